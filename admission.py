@@ -0,0 +1,212 @@
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Gewichtung der jüngsten Dauer im gleitenden Mittel der Upstream-Aufrufe (für Retry-After)
+DURATION_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """
+    Die Anfrage wurde wegen Überlast abgewiesen: 429, wenn die Warteschlange voll ist, 503, wenn die
+    Wartezeit abgelaufen ist. retry_after ist die geschätzte Wartezeit in Sekunden für den Retry-After-Header.
+    """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """
+    Begrenzt die gleichzeitigen Upstream-Aufrufe (Embedding und Chat-Modell) eines Worker-Prozesses.
+    Bis zu limit Anfragen laufen sofort, bis zu queue_size weitere warten der Reihe nach höchstens
+    max_wait Sekunden auf einen freien Platz. Alles darüber hinaus wird sofort abgewiesen, statt sich vor
+    einer langsamen API zu stauen, bis der Worker-Timeout greift. limit <= 0 schaltet die Begrenzung ab.
+    Was nach der Anfrage weiterläuft (z. B. das Erzeugen einer Antwort), startet per submit in einem Pool mit
+    limit Plätzen, der nie mehr Aufgaben hat als belegte Plätze.
+    """
+
+    def __init__(self, limit, queue_size, max_wait):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._average_seconds = None
+        self._executor = None
+
+    def acquire(self):
+        """
+        Belegt einen Platz; wirft Overloaded, wenn die Warteschlange voll ist oder die Wartezeit abläuft.
+        """
+        if self.limit <= 0:
+            return
+        with self._cond:
+            # Neue Anfragen überholen keine wartenden
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                return
+            if self._waiting >= self.queue_size:
+                raise Overloaded("Zu viele Anfragen, bitte gleich noch einmal versuchen.", 429,
+                                 self._retry_after_locked())
+            deadline = time.monotonic() + self.max_wait
+            self._waiting += 1
+            try:
+                while self._active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Overloaded("Der Dienst ist gerade überlastet, bitte gleich noch einmal versuchen.",
+                                         503, self._retry_after_locked())
+                    self._cond.wait(remaining)
+                self._active += 1
+            finally:
+                self._waiting -= 1
+                # Ein abgelaufener Wartender kann ein notify() verbraucht haben: den nächsten wecken
+                if self._active < self.limit and self._waiting:
+                    self._cond.notify()
+
+    def release(self, seconds=None):
+        """
+        Gibt einen Platz frei; seconds (Dauer der Belegung) fließt in die Schätzung für Retry-After ein.
+        """
+        if self.limit <= 0:
+            return
+        with self._cond:
+            self._active -= 1
+            if seconds is not None:
+                self._average_seconds = seconds if self._average_seconds is None else (
+                    DURATION_SMOOTHING * seconds + (1 - DURATION_SMOOTHING) * self._average_seconds)
+            self._cond.notify()
+
+    def submit(self, admitted, function, *args):
+        """
+        Führt function(*args) auf einem mit acquire belegten Platz im Pool aus und gibt den Platz danach frei;
+        admitted ist der Zeitpunkt der Zulassung (time.monotonic()) für die Schätzung von Retry-After.
+        Wird erst beim ersten Aufruf angelegt, damit kein Worker-Prozess die Threads des Masters erbt.
+        """
+        def run():
+            try:
+                function(*args)
+            finally:
+                self.release(time.monotonic() - admitted)
+
+        with self._cond:
+            if self._executor is None:
+                # Ohne Begrenzung (limit <= 0) bleibt es bei der Standardgröße des ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self.limit if self.limit > 0 else None,
+                                                    thread_name_prefix="shopbot-upstream")
+            executor = self._executor
+        try:
+            executor.submit(run)
+        except Exception:
+            self.release()
+            raise
+
+    def _retry_after_locked(self):
+        # Die Wartenden werden in Runden zu je limit Plätzen abgearbeitet
+        rounds = self._waiting // self.limit + 1
+        return max(1, math.ceil((self._average_seconds or 1.0) * rounds))
+
+    def stats(self):
+        with self._cond:
+            return {"limit": self.limit, "active": self._active, "waiting": self._waiting,
+                    "queue_size": self.queue_size, "average_seconds": self._average_seconds}
+
+
+class Flight:
+    """
+    Eine laufende Antwort, die mehrere Anfragen teilen: der Erzeuger veröffentlicht Token für Token
+    (publish) und schließt mit finish ab; jede Anfrage liest alle Token von Anfang an (stream).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._tokens = []
+        self._done = False
+        self._error = None
+        self.followers = 0
+
+    def publish(self, token):
+        with self._cond:
+            self._tokens.append(token)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def stream(self, idle_timeout=None):
+        """
+        Liefert die Token, sobald sie veröffentlicht werden; wirft den Fehler des Erzeugers weiter bzw.
+        TimeoutError, wenn idle_timeout Sekunden lang kein Token kommt.
+        """
+        position = 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: len(self._tokens) > position or self._done, idle_timeout):
+                    raise TimeoutError("Keine Antwort vom Chat-Modell erhalten.")
+                tokens = self._tokens[position:]
+                done, error = self._done, self._error
+            position += len(tokens)
+            yield from tokens
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    def result(self, idle_timeout=None):
+        return "".join(self.stream(idle_timeout))
+
+
+class SingleFlight:
+    """
+    Fasst gleichzeitige Anfragen mit demselben Schlüssel (z. B. Kontext und normierte Frage) zusammen:
+    nur die erste (lead) ruft die API auf, alle weiteren warten auf deren Flight (join). Gilt pro
+    Worker-Prozess; über Worker hinweg übernimmt der Antwort-Cache, sobald die Antwort gespeichert ist.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """
+        Flight einer laufenden Anfrage mit diesem Schlüssel oder None.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+            return flight
+
+    def lead(self, key):
+        """
+        Gibt (Flight, True) zurück, wenn der Aufrufer die Antwort erzeugt, sonst (laufender Flight, False).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def land(self, key, flight, error=None):
+        """
+        Schließt einen Flight ab; neue Anfragen mit diesem Schlüssel starten danach einen eigenen.
+        """
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
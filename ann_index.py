@@ -0,0 +1,256 @@
+import numpy as np
+import faiss
+
+# Unterstützte Index-Typen (Auswahl per SHOPBOT_INDEX_TYPE):
+#   flat      – exakte Suche, memory-mapbar; gut bis einige zehntausend Chunks
+#   ivf_flat  – invertierte Listen über k-Means-Zentren; schnelle, fast exakte Suche, memory-mapbar
+#   hnsw      – Graph-Index; sehr niedrige Latenz, liegt aber vollständig im RAM jedes Workers
+#   ivf_pq    – IVF mit Produktquantisierung; ~1/64 des Speichers, dafür geringere Genauigkeit
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+DEFAULT_INDEX_TYPE = "flat"
+
+# Speicherform der Vektoren in flat-, ivf_flat- und hnsw-Indizes (Auswahl per SHOPBOT_VECTOR_STORAGE):
+#   float32 – unverändert, 4 Byte pro Dimension
+#   float16 – halbe Größe; Skalarprodukte weichen nur in der vierten Nachkommastelle ab
+#   int8    – Skalarquantisierung (FAISS SQ8) auf 8 Bit pro Dimension, ein Viertel der Größe
+# Bei verlustbehafteter Speicherung (float16, int8 und ivf_pq) werden die besten Kandidaten anhand der
+# exakten Vektoren neu bewertet (siehe rescore). Gemessen (benchmarks/bench_ann_index.py, 20 000 Vektoren,
+# d=1536, 50 Kandidaten): flat mit int8 hat 29 statt 117 MB Index-Datei, recall@10 0,975 ohne und 1,000 mit
+# Neubewertung bei halber Suchzeit; hnsw mit int8 35 statt 123 MB, recall@10 0,999 statt 0,983.
+# float16/int8 sind opt-in: für die Neubewertung liegen die exakten Vektoren zusätzlich als float32 neben
+# dem Index (vectors.npy) und zählen zum Speicherbudget der Shards; ein Wechsel baut den Index neu auf.
+VECTOR_STORAGES = ("float32", "float16", "int8")
+DEFAULT_VECTOR_STORAGE = "float32"
+_SCALAR_QUANTIZERS = {"float16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+# Ziel-Recall@k, auf den nprobe/efSearch beim Aufbau automatisch eingestellt werden
+TARGET_RECALL = 0.95
+TUNING_K = 10
+TUNING_QUERIES = 200
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+PQ_SUBQUANTIZERS = 96
+PQ_BITS = 8
+# Faustregel von FAISS: mindestens 39 Trainingspunkte pro Zentrum
+MIN_POINTS_PER_CENTROID = 39
+
+
+def normalize_vectors(vectors, copy=True):
+    """
+    Normiert Vektoren auf Länge 1 (als float32-Kopie; mit copy=False eine float32-Matrix an Ort und Stelle).
+    Das Skalarprodukt normierter Vektoren entspricht der Kosinus-Ähnlichkeit, für die die ada-002-Embeddings
+    gedacht sind.
+    """
+    if copy or not (isinstance(vectors, np.ndarray) and vectors.dtype == np.float32 and vectors.ndim == 2
+                    and vectors.flags.c_contiguous):
+        vectors = np.array(vectors, dtype="float32", copy=True, ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def cosine_similarity(query, vectors):
+    """
+    Kosinus-Ähnlichkeit eines Vektors zu jeder Zeile von vectors, vektorisiert (float32).
+    """
+    query = np.asarray(query, dtype="float32").reshape(-1)
+    vectors = np.asarray(vectors, dtype="float32").reshape(-1, query.shape[0])
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    return (vectors @ query) / np.maximum(norms, np.float32(1e-12))
+
+
+def rescore(query, ids, positions, vectors, k):
+    """
+    Bewertet Kandidaten eines verlustbehafteten Index exakt neu: Kosinus-Ähnlichkeit der Anfrage zu den
+    exakten Vektoren der Kandidaten (Zeilen positions in vectors, z. B. memory-gemappt) und die k besten
+    davon. ids und positions gehören paarweise zusammen; -1 steht für fehlende Treffer.
+    Gibt (Scores, IDs) in der Form von faiss.Index.search für eine Anfrage zurück.
+    """
+    ids = np.asarray(ids, dtype="int64").reshape(-1)
+    positions = np.asarray(positions, dtype="int64").reshape(-1)
+    valid = (ids >= 0) & (positions >= 0)
+    ids, positions = ids[valid], positions[valid]
+    # Zeilen in aufsteigender Reihenfolge lesen: bei memory-gemappten Vektoren wenige Seitenzugriffe
+    order = np.argsort(positions)
+    scores = np.empty(len(ids), dtype="float32")
+    scores[order] = cosine_similarity(query, vectors[positions[order]])
+    best = np.argsort(-scores, kind="stable")[:k]
+    return scores[best][None, :], ids[best][None, :]
+
+
+def resolve_vector_storage(storage):
+    if storage not in VECTOR_STORAGES:
+        print(f"Unbekannte Vektor-Speicherform '{storage}', verwende '{DEFAULT_VECTOR_STORAGE}'.")
+        return DEFAULT_VECTOR_STORAGE
+    return storage
+
+
+def is_lossy(index_type, storage):
+    """
+    Ob ein Index die Vektoren nur angenähert speichert; dann werden Treffer exakt neu bewertet.
+    """
+    return index_type == "ivf_pq" or storage != "float32"
+
+
+def _nlist_for(count):
+    # ~4·sqrt(n) Listen, aber genug Trainingspunkte pro Liste
+    nlist = int(4 * np.sqrt(count))
+    return max(1, min(nlist, count // MIN_POINTS_PER_CENTROID))
+
+
+def _pq_subquantizers(dimension):
+    m = min(PQ_SUBQUANTIZERS, dimension)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def resolve_index_type(index_type, count):
+    """
+    Fällt auf einen einfacheren Index-Typ zurück, wenn für das Training zu wenige Vektoren vorhanden sind.
+    """
+    if index_type not in INDEX_TYPES:
+        print(f"Unbekannter Index-Typ '{index_type}', verwende '{DEFAULT_INDEX_TYPE}'.")
+        return DEFAULT_INDEX_TYPE
+    if index_type == "ivf_pq" and count < (2 ** PQ_BITS) * MIN_POINTS_PER_CENTROID:
+        index_type = "ivf_flat"
+    if index_type == "ivf_flat" and _nlist_for(count) < 2:
+        index_type = "flat"
+    return index_type
+
+
+def create_index(index_type, training_vectors, storage="float32"):
+    """
+    Erzeugt einen leeren Index des gewünschten Typs für normierte Vektoren (Skalarprodukt = Kosinus)
+    und trainiert ihn bei Bedarf mit training_vectors. storage (siehe VECTOR_STORAGES) legt fest, wie
+    flat-, ivf_flat- und hnsw-Indizes die Vektoren ablegen; int8 wird dabei auf den Wertebereich
+    jeder Dimension trainiert. Alle Typen unterstützen add_with_ids.
+    Gibt (index, tatsächlicher Index-Typ) zurück.
+    """
+    dimension = training_vectors.shape[1]
+    index_type = resolve_index_type(index_type, len(training_vectors))
+    qtype = _SCALAR_QUANTIZERS.get(storage)
+    metric = faiss.METRIC_INNER_PRODUCT
+    if index_type == "hnsw":
+        if qtype is None:
+            hnsw = faiss.IndexHNSWFlat(dimension, HNSW_M, metric)
+        else:
+            hnsw = faiss.IndexHNSWSQ(dimension, qtype, HNSW_M, metric)
+            hnsw.train(training_vectors)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(hnsw), index_type
+
+    quantizer = faiss.IndexFlatIP(dimension)
+    if index_type == "flat":
+        # Exakte Suche in IVF-Form mit nur einer Liste: memory-mapbar und mit nativer ID-Verwaltung
+        quantizer.add(np.zeros((1, dimension), dtype="float32"))
+        if qtype is None:
+            return faiss.IndexIVFFlat(quantizer, dimension, 1, metric), index_type
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, 1, qtype, metric)
+        index.train(training_vectors)
+        return index, index_type
+
+    nlist = _nlist_for(len(training_vectors))
+    if index_type == "ivf_pq":
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), PQ_BITS, metric)
+    elif qtype is None:
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+    else:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, qtype, metric)
+    print(f"Trainiere {index_type}-Index mit {nlist} Listen auf {len(training_vectors)} Vektoren ...")
+    index.train(training_vectors)
+    return index, index_type
+
+
+def _inner_index(index):
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+
+def supports_remove(index):
+    """
+    HNSW-Graphen können keine einzelnen Vektoren entfernen; sie werden stattdessen neu aufgebaut.
+    """
+    return not isinstance(_inner_index(index), faiss.IndexHNSW)
+
+
+def rebuild_without(index, removed_ids):
+    """
+    Baut einen HNSW-Index ohne die angegebenen IDs neu auf (die Vektoren werden aus dem Index rekonstruiert).
+    Der neue Graph übernimmt Parameter und gegebenenfalls den trainierten Skalarquantisierer des alten,
+    sodass quantisierte Vektoren beim erneuten Einfügen dieselben Codes erhalten.
+    """
+    inner = _inner_index(index)
+    ids = faiss.vector_to_array(index.id_map)
+    vectors = inner.reconstruct_n(0, inner.ntotal)
+    keep = ~np.isin(ids, np.asarray(list(removed_ids), dtype="int64"))
+    empty = faiss.clone_index(inner)
+    empty.reset()
+    rebuilt = faiss.IndexIDMap2(empty)
+    if keep.any():
+        rebuilt.add_with_ids(vectors[keep], ids[keep])
+    return rebuilt
+
+
+def apply_search_params(index, params):
+    """
+    Setzt Suchparameter wie nprobe (IVF) oder efSearch (HNSW) auf einem geladenen Index.
+    """
+    inner = _inner_index(index)
+    if "nprobe" in params and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = int(params["nprobe"])
+    if "efSearch" in params and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = int(params["efSearch"])
+
+
+def recall_at_k(found, expected):
+    hits = sum(len(set(f[f >= 0]) & set(e[e >= 0])) for f, e in zip(found, expected))
+    return hits / max(1, expected.size)
+
+
+def tune_search_params(index, vectors, ids, k=TUNING_K, target_recall=TARGET_RECALL, queries=TUNING_QUERIES,
+                       seed=0):
+    """
+    Wählt den kleinsten nprobe- bzw. efSearch-Wert, mit dem der Index gegenüber exakter Suche
+    den Ziel-Recall@k erreicht. Als Anfragen dienen leicht verrauschte Vektoren aus dem Bestand.
+    vectors und ids sind die (normierten) Vektoren im Index mit ihren IDs. Gibt die gewählten Parameter zurück.
+    """
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF) and inner.nlist == 1:
+        return {"nprobe": 1}
+    if isinstance(inner, faiss.IndexIVF):
+        name, candidates = "nprobe", [p for p in (1, 2, 4, 8, 16, 32, 64, 128, 256) if p <= inner.nlist]
+        if inner.nlist not in candidates:
+            candidates.append(inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        name, candidates = "efSearch", [16, 32, 64, 128, 256, 512]
+    else:
+        return {}
+    if inner.ntotal == 0 or len(vectors) == 0:
+        return {name: candidates[0]}
+
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)]
+    sample = normalize_vectors(sample + rng.normal(scale=0.02, size=sample.shape).astype("float32"))
+    k = min(k, inner.ntotal)
+    # Exakte Nachbarn direkt auf der Vektormatrix, ohne sie in einen weiteren Index zu kopieren
+    _, positions = faiss.knn(sample, vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+    expected = np.asarray(ids, dtype="int64")[positions]
+
+    recalls = []
+    for value in candidates:
+        apply_search_params(index, {name: value})
+        _, found = index.search(sample, k)
+        recalls.append(recall_at_k(found, expected))
+        if recalls[-1] >= target_recall:
+            break
+    if recalls[-1] >= target_recall:
+        params = {name: candidates[len(recalls) - 1]}
+    else:
+        # Ziel nicht erreichbar (z. B. durch PQ-Quantisierung): kleinsten Wert nahe am besten Recall wählen
+        best = max(recalls)
+        params = {name: next(v for v, r in zip(candidates, recalls) if r >= best - 0.01)}
+    apply_search_params(index, params)
+    print(f"Suchparameter automatisch gewählt: {params} (Ziel-Recall@{k}: {target_recall})")
+    return params
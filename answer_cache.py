@@ -0,0 +1,315 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Geschätzte Preise in US-Dollar pro 1000 Tokens (für die Anzeige der eingesparten Kosten)
+GPT4_INPUT_PRICE = float(os.getenv("SHOPBOT_PRICE_GPT4_INPUT", "0.03"))
+GPT4_OUTPUT_PRICE = float(os.getenv("SHOPBOT_PRICE_GPT4_OUTPUT", "0.06"))
+EMBEDDING_PRICE = float(os.getenv("SHOPBOT_PRICE_EMBEDDING", "0.0001"))
+
+DEFAULT_THRESHOLD = 0.96
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+# Wie viele Kontexte (Mandant + Index-Version + Prompt) ein Worker gleichzeitig im Speicher spiegelt
+DEFAULT_MAX_CONTEXTS = 64
+# Wie oft ein Worker neue Einträge anderer Worker und seine Zähler mit der Datenbank abgleicht
+SYNC_INTERVAL = 2.0
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_question(question):
+    """
+    Vereinheitlicht eine Frage für den exakten Vergleich (Groß-/Kleinschreibung, Satzzeichen, Leerzeichen).
+    """
+    return " ".join(_WORD_PATTERN.findall(question.lower()))
+
+
+def estimate_tokens(text):
+    # Grobe Faustregel: ~4 Zeichen pro Token
+    return max(1, len(text) // 4)
+
+
+def estimate_answer_cost(messages, answer):
+    """
+    Geschätzte Kosten (USD) eines GPT-4-Aufrufs für diese Nachrichten und Antwort.
+    """
+    prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    return prompt_tokens / 1000 * GPT4_INPUT_PRICE + estimate_tokens(answer) / 1000 * GPT4_OUTPUT_PRICE
+
+
+def context_key(index_version, base_prompt, greeting, tenant=None):
+    """
+    Antworten gelten nur für einen Mandanten (tenant) und nur, solange dessen Wissensindex, Basis-Prompt und
+    Begrüßung unverändert sind.
+    """
+    return hashlib.sha256(f"{index_version}\0{base_prompt}\0{greeting}\0{tenant}".encode("utf-8")).hexdigest()
+
+
+class _Mirror:
+    """
+    Gespiegelte Einträge eines Kontexts: normierte Frage -> ID, ID -> (Antwort, Kosten, Erstellzeit) und die
+    Frage-Embeddings als Matrix.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.ids = []
+        self.vectors = None
+        self.exact = {}
+        self.entries = {}
+        self.synced_at = 0.0
+
+    def forget(self, entry_ids):
+        entry_ids = set(entry_ids)
+        if not entry_ids:
+            return
+        self.exact = {k: v for k, v in self.exact.items() if v not in entry_ids}
+        for entry_id in entry_ids:
+            self.entries.pop(entry_id, None)
+        keep = [position for position, entry_id in enumerate(self.ids) if entry_id not in entry_ids]
+        if len(keep) != len(self.ids):
+            self.ids = [self.ids[position] for position in keep]
+            self.vectors = self.vectors[keep] if keep else None
+
+
+class AnswerCache:
+    """
+    Semantischer Antwort-Cache für wiederkehrende Kundenfragen.
+
+    Die Einträge liegen in einer SQLite-Datei, die sich alle Worker teilen. Jeder Worker hält je Kontext
+    (Mandant + Index-Version + Prompt) einen Spiegel der normierten Frage-Embeddings im Speicher, für
+    höchstens max_contexts Kontexte (die am längsten nicht genutzten fallen heraus), und sucht darin per
+    Skalarprodukt (= Kosinus-Ähnlichkeit). Exakt gleiche Fragen werden schon vor dem
+    Embedding-Aufruf erkannt. Einträge verfallen nach ttl Sekunden; über max_entries hinaus werden die am
+    längsten nicht genutzten verdrängt. Treffer werden aus dem Spiegel beantwortet; Trefferzahl und letzte
+    Nutzung schreibt der Worker gesammelt beim nächsten Abgleich (alle SYNC_INTERVAL Sekunden).
+    """
+
+    def __init__(self, path, threshold=DEFAULT_THRESHOLD, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_contexts=DEFAULT_MAX_CONTEXTS):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_contexts = max(1, max_contexts)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " context TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " normalized TEXT NOT NULL,"
+            " embedding BLOB,"
+            " answer TEXT NOT NULL,"
+            " cost REAL NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_context ON answers (context, normalized)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS answer_stats (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self._conn.commit()
+        self._mirrors = OrderedDict()
+        self._pending_stats = {}
+        # Treffer je Eintrag: ID -> [Anzahl, zuletzt genutzt], werden mit den Zählern gesammelt geschrieben
+        self._pending_hits = {}
+
+    # --------------------------
+    # Spiegel im Speicher
+    # --------------------------
+    def _sync_locked(self, context):
+        """
+        Gibt den Spiegel des Kontexts zurück, lädt neue Einträge nach (inkrementell über die ID), vergisst
+        abgelaufene bzw. von anderen Workern gelöschte und schreibt gesammelte Zähler. Wechselnde Mandanten
+        behalten so ihre Spiegel, statt sie jedes Mal neu zu laden.
+        """
+        now = time.monotonic()
+        mirror = self._mirrors.get(context)
+        if mirror is None:
+            mirror = self._mirrors[context] = _Mirror()
+            while len(self._mirrors) > self.max_contexts:
+                self._mirrors.popitem(last=False)
+        else:
+            self._mirrors.move_to_end(context)
+            if now - mirror.synced_at < SYNC_INTERVAL:
+                return mirror
+        cutoff = time.time() - self.ttl
+        mirror.forget([entry_id for entry_id, (_, _, created) in mirror.entries.items() if created < cutoff])
+        if mirror.entries:
+            # Verdrängte oder gelöschte Einträge fallen auf, weil weniger übrig sind als gespiegelt
+            remaining = self._conn.execute(
+                "SELECT COUNT(*) FROM answers WHERE context = ? AND id <= ? AND created >= ?",
+                (context, mirror.last_id, cutoff),
+            ).fetchone()[0]
+            if remaining != len(mirror.entries):
+                alive = {entry_id for (entry_id,) in self._conn.execute(
+                    "SELECT id FROM answers WHERE context = ? AND id <= ?", (context, mirror.last_id))}
+                mirror.forget([entry_id for entry_id in mirror.entries if entry_id not in alive])
+        rows = self._conn.execute(
+            "SELECT id, normalized, embedding, answer, cost, created FROM answers"
+            " WHERE context = ? AND id > ? AND created >= ? ORDER BY id",
+            (context, mirror.last_id, cutoff),
+        ).fetchall()
+        new_vectors = []
+        for entry_id, normalized, blob, answer, cost, created in rows:
+            mirror.exact[normalized] = entry_id
+            mirror.entries[entry_id] = (answer, cost, created)
+            if blob is not None:
+                mirror.ids.append(entry_id)
+                new_vectors.append(np.frombuffer(blob, dtype="float32"))
+            mirror.last_id = entry_id
+        if new_vectors:
+            stacked = np.vstack(new_vectors)
+            mirror.vectors = stacked if mirror.vectors is None else np.vstack([mirror.vectors, stacked])
+        self._flush_locked()
+        mirror.synced_at = now
+        return mirror
+
+    def _count(self, name, value=1.0):
+        self._pending_stats[name] = self._pending_stats.get(name, 0.0) + value
+
+    def _flush_locked(self):
+        """
+        Schreibt gesammelte Zähler und Treffer (hits, last_used) in einer Transaktion.
+        """
+        if not self._pending_stats and not self._pending_hits:
+            return
+        self._conn.executemany(
+            "INSERT INTO answer_stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            list(self._pending_stats.items()),
+        )
+        self._conn.executemany(
+            "UPDATE answers SET last_used = MAX(last_used, ?), hits = hits + ? WHERE id = ?",
+            [(last_used, hits, entry_id) for entry_id, (hits, last_used) in self._pending_hits.items()],
+        )
+        self._conn.commit()
+        self._pending_stats = {}
+        self._pending_hits = {}
+
+    def _use_entry_locked(self, mirror, entry_id, kind, extra_saving=0.0):
+        # Antwort aus dem Spiegel; Verdrängungen anderer Worker bemerkt der nächste Abgleich
+        entry = mirror.entries.get(entry_id)
+        now = time.time()
+        if entry is None or entry[2] < now - self.ttl:
+            # Inzwischen abgelaufen
+            mirror.forget([entry_id])
+            return None
+        answer, cost, _ = entry
+        pending = self._pending_hits.setdefault(entry_id, [0, now])
+        pending[0] += 1
+        pending[1] = now
+        self._count(kind)
+        self._count("saved_usd", cost + extra_saving)
+        return answer
+
+    # --------------------------
+    # Öffentliche Schnittstelle
+    # --------------------------
+    def lookup_exact(self, question, context):
+        """
+        Schneller Pfad ohne Embedding: liefert die gespeicherte Antwort auf exakt dieselbe Frage oder None.
+        """
+        normalized = normalize_question(question)
+        with self._lock:
+            mirror = self._sync_locked(context)
+            self._count("lookups")
+            entry_id = mirror.exact.get(normalized)
+            if entry_id is None:
+                return None
+            # Auch der Embedding-Aufruf entfällt
+            return self._use_entry_locked(mirror, entry_id, "exact_hits",
+                                          estimate_tokens(question) / 1000 * EMBEDDING_PRICE)
+
+    def lookup_similar(self, embedding, context):
+        """
+        Liefert die Antwort auf die ähnlichste gespeicherte Frage, wenn deren Kosinus-Ähnlichkeit
+        mindestens threshold beträgt, sonst None. embedding muss normiert sein.
+        """
+        query = np.asarray(embedding, dtype="float32").reshape(-1)
+        with self._lock:
+            mirror = self._sync_locked(context)
+            if mirror.vectors is None or not mirror.ids:
+                self._count("misses")
+                return None
+            similarities = mirror.vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self._count("misses")
+                return None
+            answer = self._use_entry_locked(mirror, mirror.ids[best], "semantic_hits")
+            if answer is None:
+                self._count("misses")
+            return answer
+
+    def store(self, question, embedding, context, answer, cost):
+        """
+        Speichert eine neue Antwort und verdrängt abgelaufene bzw. überzählige Einträge.
+        """
+        now = time.time()
+        blob = np.asarray(embedding, dtype="float32").reshape(-1).tobytes() if embedding is not None else None
+        with self._lock:
+            # Gesammelte Treffer zuerst schreiben, damit die Verdrängung die aktuelle Nutzung sieht
+            self._flush_locked()
+            self._conn.execute(
+                "INSERT INTO answers (context, question, normalized, embedding, answer, cost, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (context, question, normalize_question(question), blob, answer, cost, now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            # Beim nächsten Zugriff sofort nachladen
+            mirror = self._mirrors.get(context)
+            if mirror is not None:
+                mirror.synced_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.execute("DELETE FROM answer_stats")
+            self._conn.commit()
+            self._mirrors.clear()
+            self._pending_stats = {}
+            self._pending_hits = {}
+
+    def stats(self):
+        with self._lock:
+            self._flush_locked()
+            values = dict(self._conn.execute("SELECT name, value FROM answer_stats").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            top = self._conn.execute(
+                "SELECT question, hits FROM answers WHERE hits > 0 ORDER BY hits DESC LIMIT 10"
+            ).fetchall()
+        lookups = int(values.get("lookups", 0))
+        exact_hits = int(values.get("exact_hits", 0))
+        semantic_hits = int(values.get("semantic_hits", 0))
+        return {
+            "entries": entries,
+            "lookups": lookups,
+            "exact_hits": exact_hits,
+            "semantic_hits": semantic_hits,
+            "hit_rate": (exact_hits + semantic_hits) / lookups if lookups else 0.0,
+            "saved_usd": values.get("saved_usd", 0.0),
+            "threshold": self.threshold,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "top_questions": top,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
@@ -1,84 +1,192 @@
 import os
+import json
+import time
+import hashlib
 import datetime
 import threading
-import openai
-import numpy as np
-import faiss
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_admin import Admin, AdminIndexView, expose
-from crawl import crawl_website
-
-# Definiere den absoluten Pfad für die knowledge.txt
-KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge.txt")
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify
+from models import (
+    DATABASE_URI, APIKey, BotPrompt, CrawledPage, CrawledWebsite, GreetingMessage, UploadedFile, db,
+    enable_sqlite_wal, init_schema,
+)
+from embeddings import EMBEDDING_DIMENSION, embed_texts, get_embedding_provider
+from embedding_cache import EmbeddingCache
+from index_store import (IndexBuilder, ShardCache, build_lock, current_version, has_keyword_index, load_index,
+                         read_meta)
+from ann_index import DEFAULT_INDEX_TYPE, DEFAULT_VECTOR_STORAGE, is_lossy, normalize_vectors, resolve_vector_storage
+from completions import get_chat_backend
+from serving import install_shared_openai_session
+from bot_settings import DEFAULT_BASE_PROMPT, DEFAULT_GREETING, BotSettings, SettingsCache
+from answer_cache import AnswerCache, context_key, estimate_answer_cost, normalize_question
+from admission import AdmissionGate, Flight, Overloaded, SingleFlight
+from keyword_index import exact_terms, is_lexical_query, reciprocal_rank_fusion
+from chunking import chunk_document, chunker_signature, get_token_counter
+from knowledge_store import KnowledgeStore, content_hash, split_sections, sync_upload_directory
+from jobs import ACTIVE_STATUSES, JobCancelled, JobRunner
+from dedup import DEDUP_VERSION, DEFAULT_THRESHOLD, MinHasher
+from tenants import DEFAULT_TENANT, list_tenants, normalize_tenant, tenant_exists, tenant_path
+from metrics import (
+    INDEX_BUILD_SECONDS, INDEX_CHUNKS, INDEX_CHUNKS_EMBEDDED, INDEX_CHUNKS_PER_SECOND, INDEX_DUPLICATE_CHARS,
+    INDEX_DUPLICATES, INDEX_SHARD_BYTES, INDEX_SHARD_EVICTIONS, REGISTRY, RequestTrace, annotate, stage,
+)
 
-# Flask-App und Konfiguration
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+# Frühere Wissensdatei; wird beim ersten Start einmalig in die Wissensbasis (instance/knowledge.db) übernommen
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge.txt")
 
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///shopbot.db"
+# Flask-App und Konfiguration. Der Import legt nur die App mit ihren Routen an; Datenbank, Caches, Index
+# und Admin-Oberfläche richtet create_app() ein (siehe unten). SHOPBOT_INSTANCE_PATH verlegt den
+# instance-Ordner (Datenbanken, Index), z. B. für Benchmarks.
+app = Flask(__name__, instance_path=os.getenv("SHOPBOT_INSTANCE_PATH") or None)
+app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = "mein-geheimer-schluessel"
 app.config["UPLOAD_FOLDER"] = "uploads"
-db = SQLAlchemy(app)
 
-# ✅ NEUE ROUTE HINZUFÜGEN
 @app.route("/")
 def home():
     return "Hello, Flask is running!"
 
-# Falls du weitere Routen hast, sollten die hier sein
+# --------------------------
+# Mandanten (Shops)
+# --------------------------
+# Jeder Mandant hat eigene Wissensbasis, eigenen Index-Shard, eigene Uploads sowie eigenen Basis-Prompt und
+# Begrüßungstext (siehe tenants.py). Chat und Begrüßung wählen ihn per "tenant" (JSON-Feld oder Parameter).
+def tenant_instance_path(tenant):
+    return tenant_path(app.instance_path, tenant)
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=6000, debug=True)
-# Sicherstellen, dass der Upload-Ordner existiert
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+def tenant_upload_folder(tenant):
+    return tenant_path(app.config["UPLOAD_FOLDER"], tenant)
 
-# ... Rest deines Codes ...
+def ensure_tenant(tenant):
+    """
+    Legt den Ordner eines Mandanten an (beim ersten Eintrag im Admin-Bereich); erst dann ist er bekannt.
+    """
+    os.makedirs(tenant_instance_path(tenant), exist_ok=True)
 
+def known_tenants():
+    return list_tenants(app.instance_path)
+
+def request_tenant(value):
+    """
+    Mandant einer Anfrage: None, wenn die ID ungültig oder der Mandant nicht angelegt ist.
+    """
+    tenant = normalize_tenant(value)
+    return tenant if tenant is not None and tenant_exists(app.instance_path, tenant) else None
+
+def form_tenant():
+    """
+    Mandant aus einem Formular oder Parameter des Admin-Bereichs (ungültige IDs: Standard-Mandant).
+    """
+    return normalize_tenant(request.values.get("tenant")) or DEFAULT_TENANT
 
 # --------------------------
-# Datenbankmodelle
+# Bot-Einstellungen (API-Key, Basis-Prompt, Begrüßung) mit In-Memory-Cache
 # --------------------------
-class CrawledPage(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(500), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
-class CrawledWebsite(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(500), nullable=False, unique=True)
-
-class UploadedFile(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
-
-class APIKey(db.Model):
-    __tablename__ = "api_key"
-    __table_args__ = {"extend_existing": True}
-    id = db.Column(db.Integer, primary_key=True)
-    key = db.Column(db.String(100), nullable=False)
-
-class BotPrompt(db.Model):
-    __tablename__ = "bot_prompt"
-    __table_args__ = {"extend_existing": True}
-    id = db.Column(db.Integer, primary_key=True)
-    prompt = db.Column(db.Text, nullable=False)
-
-class GreetingMessage(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    text = db.Column(db.String(500), nullable=False)
-
-with app.app_context():
-    db.create_all()
+def load_bot_settings(stamp, tenant=DEFAULT_TENANT):
+    """
+    Lädt API-Key, Basis-Prompt und Begrüßungstext eines Mandanten mit einer einzigen Abfrage. Der API-Key
+    gilt für alle Mandanten; ein gesetztes OPENAI_API_KEY in der Umgebung hat Vorrang vor dem gespeicherten.
+    """
+    row = db.session.execute(db.select(
+        db.select(APIKey.key).order_by(APIKey.id).limit(1).scalar_subquery(),
+        db.select(BotPrompt.prompt).filter_by(tenant=tenant).order_by(BotPrompt.id).limit(1).scalar_subquery(),
+        db.select(GreetingMessage.text).filter_by(tenant=tenant).order_by(GreetingMessage.id).limit(1)
+        .scalar_subquery(),
+    )).one()
+    stored_key, stored_prompt, stored_greeting = row
+    return BotSettings(
+        api_key=os.getenv("OPENAI_API_KEY") or stored_key,
+        base_prompt=stored_prompt or DEFAULT_BASE_PROMPT,
+        greeting=stored_greeting or DEFAULT_GREETING,
+        stamp=stamp,
+    )
+
+# Ein Cache je Mandant; alle teilen sich die Versionsdatei, sodass jede Änderung (auch am gemeinsamen
+# API-Key) jeden Mandanten neu laden lässt
+SETTINGS_STAMP = os.path.join(app.instance_path, "settings.version")
+settings_cache = SettingsCache(load_bot_settings, SETTINGS_STAMP)
+tenant_settings_caches = {DEFAULT_TENANT: settings_cache}
+tenant_settings_lock = threading.Lock()
+
+def get_settings_cache(tenant=DEFAULT_TENANT):
+    cache = tenant_settings_caches.get(tenant)
+    if cache is None:
+        with tenant_settings_lock:
+            cache = tenant_settings_caches.setdefault(
+                tenant, SettingsCache(lambda stamp: load_bot_settings(stamp, tenant), SETTINGS_STAMP))
+    return cache
 
 # --------------------------
 # Globale Variablen für FAISS-Index-Caching
 # --------------------------
-faiss_index = None
-faiss_chunk_list = None
+# Der Index wird je Mandant als eigener Shard versioniert gespeichert (Standard-Mandant: instance/faiss_index,
+# sonst instance/tenants/<mandant>/faiss_index) und von allen Workern memory-gemappt geladen.
+# Wie oft (in Sekunden) ein Worker prüft, ob eine neuere Index-Version veröffentlicht wurde
+INDEX_CHECK_INTERVAL = 2.0
+# Index-Typ: flat, ivf_flat, hnsw oder ivf_pq (siehe ann_index.py)
+INDEX_TYPE = os.getenv("SHOPBOT_INDEX_TYPE", DEFAULT_INDEX_TYPE).lower()
+# Speicherform der Vektoren im Index: float32 (Standard), float16 oder int8 (siehe ann_index.py). Bei
+# float16/int8 (und ivf_pq) werden die besten RESCORE_CANDIDATES Treffer anhand der exakten Vektoren neu
+# bewertet (0: aus). Messwerte in benchmarks/bench_ann_index.py. Eine geänderte Speicherform baut beim
+# nächsten Abgleich jeden Index neu auf (Embeddings kommen aus dem Cache).
+VECTOR_STORAGE = resolve_vector_storage(os.getenv("SHOPBOT_VECTOR_STORAGE", DEFAULT_VECTOR_STORAGE).lower())
+RESCORE_CANDIDATES = int(os.getenv("SHOPBOT_RESCORE_CANDIDATES", "50"))
+# Retrieval: "vector" (nur FAISS), "hybrid" (FAISS und Stichwortsuche, per Reciprocal-Rank-Fusion vereint)
+# oder "auto" (wie hybrid, aber Fragen aus exakten Angaben wie Artikelnummern nur per Stichwortsuche, ohne Embedding)
+RETRIEVAL_MODE = os.getenv("SHOPBOT_RETRIEVAL", "auto").lower()
+# Chunks im Prompt-Kontext und Kandidaten je Suchverfahren für die Fusion
+CONTEXT_CHUNKS = 3
+RETRIEVAL_CANDIDATES = int(os.getenv("SHOPBOT_RETRIEVAL_CANDIDATES", "20"))
+# Admin-Liste der gecrawlten Seiten: Einträge pro Seite und Länge der Textvorschau
+CRAWLED_PAGE_SIZE = 50
+CRAWLED_PREVIEW_CHARS = 500
+# Chunks ab dieser geschätzten Jaccard-Ähnlichkeit (Wort-3-Gramme) gelten als Beinahe-Duplikate und werden
+# nicht erneut eingebettet, sondern als weitere Fundstelle des vorhandenen Chunks vermerkt (über 1: aus).
+# Chunks mit abweichenden Zahlen, Preisen oder Artikelnummern werden nie zusammengefasst (siehe dedup.py).
+DEDUP_THRESHOLD = float(os.getenv("SHOPBOT_DEDUP_THRESHOLD", str(DEFAULT_THRESHOLD)))
+# Obergrenze für die geladenen Index-Shards eines Workers (Summe der Dateigrößen); darüber werden die am
+# längsten nicht genutzten Shards verworfen und bei Bedarf neu geladen
+SHARD_CACHE_MB = float(os.getenv("SHOPBOT_SHARD_CACHE_MB", "2048"))
+# Beim Index-Aufbau liegen höchstens so viele neu einzubettende Chunks (Texte und Embeddings) gleichzeitig im
+# Speicher; ein Stapel endet an einer Dokumentgrenze. Ein neuer Index wird mit dem ersten Stapel trainiert.
+INDEX_BATCH_CHUNKS = int(os.getenv("SHOPBOT_INDEX_BATCH_CHUNKS", "10000"))
+
+def index_dir(tenant=DEFAULT_TENANT):
+    return os.path.join(tenant_instance_path(tenant), "faiss_index")
+
+shard_cache = ShardCache(int(SHARD_CACHE_MB * 1024 * 1024), INDEX_CHECK_INTERVAL,
+                         on_evict=lambda tenant: INDEX_SHARD_EVICTIONS.inc())
+
+# Admission Control je Worker: höchstens UPSTREAM_CONCURRENCY Chat-Anfragen rufen gleichzeitig die API auf
+# (Embedding und GPT-4), bis zu UPSTREAM_QUEUE weitere warten höchstens UPSTREAM_QUEUE_SECONDS; alle übrigen
+# erhalten sofort 429 bzw. 503 mit Retry-After (0: keine Begrenzung). Antworten aus dem Antwort-Cache und
+# zusammengefasste Anfragen belegen keinen Platz. Messwerte in benchmarks/bench_admission.py.
+UPSTREAM_CONCURRENCY = int(os.getenv("SHOPBOT_UPSTREAM_CONCURRENCY", "32"))
+UPSTREAM_QUEUE = int(os.getenv("SHOPBOT_UPSTREAM_QUEUE", "64"))
+UPSTREAM_QUEUE_SECONDS = float(os.getenv("SHOPBOT_UPSTREAM_QUEUE_SECONDS", "10"))
+# Wie lange (Sekunden) eine Anfrage höchstens auf das nächste Token der Antwort wartet
+UPSTREAM_IDLE_TIMEOUT = float(os.getenv("SHOPBOT_UPSTREAM_IDLE_TIMEOUT", "60"))
+# Gleichzeitige gleiche Fragen (normiert, gleicher Mandant und Wissensstand) teilen sich einen API-Aufruf
+# (SHOPBOT_COALESCE=0: aus)
+COALESCE_REQUESTS = os.getenv("SHOPBOT_COALESCE", "1") != "0"
+# Retry-After (Sekunden) für Chat-Anfragen an einen Mandanten, dessen erster Index noch aufgebaut wird
+INDEX_BUILDING_RETRY_AFTER = int(os.getenv("SHOPBOT_INDEX_BUILDING_RETRY_AFTER", "10"))
+upstream_gate = AdmissionGate(UPSTREAM_CONCURRENCY, UPSTREAM_QUEUE, UPSTREAM_QUEUE_SECONDS)
+chat_flights = SingleFlight()
+
+# Prozesseigene Ressourcen mit offenen SQLite-Verbindungen; angelegt von open_process_resources()
+# (siehe create_app), damit kein Worker die Verbindungen eines anderen Prozesses erbt.
+# Persistenter Embedding-Cache: nur neue oder geänderte Chunks werden bei einem Rebuild neu eingebettet
+embedding_cache = None
+# Antwort-Cache für wiederkehrende Kundenfragen
+answer_cache = None
+# Wissensbasis des Standard-Mandanten: ein Dokument pro gecrawlter Seite und hochgeladener Datei, Quelle des
+# Index-Aufbaus; die der übrigen Mandanten öffnet get_knowledge_store() bei Bedarf
+knowledge_store = None
+tenant_knowledge_stores = {}
+tenant_stores_lock = threading.Lock()
+# Hintergrund-Jobs (Crawls, Index-Aktualisierungen): je Art läuft höchstens einer, auch über Worker hinweg
+job_runner = None
 
 # --------------------------
 # Hilfsfunktionen für Retrieval und Index-Aufbau
@@ -88,150 +196,531 @@ def get_embedding(text):
     Ruft mithilfe des text-embedding-ada-002 Modells (openai==0.28.0) das Embedding eines Textes ab.
     """
     try:
-        response = openai.Embedding.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        return response["data"][0]["embedding"]
+        return get_embedding_provider().embed_batch([text])[0]
     except Exception as e:
         print("Fehler beim Abrufen des Embeddings:", e)
         return None
 
-def cosine_similarity(vec1, vec2):
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+def document_hash(text_hash):
+    """
+    Index-Hash eines Dokuments aus seinem Inhalts-Hash (wie in der Wissensbasis gespeichert) und den
+    Chunking-Einstellungen: Ändern sich Chunk-Größe, Überlappung oder die Duplikat-Erkennung, gelten alle
+    Dokumente als geändert und werden neu zerlegt (Embeddings kommen aus dem Cache).
+    """
+    return hashlib.sha256((chunker_signature() + DEDUP_VERSION + "\n" + text_hash).encode("utf-8")).hexdigest()
 
-def chunk_text(text, max_length=500):
+def embed_documents_into(builder, documents, progress=None, batch_chunks=None):
     """
-    Teilt einen langen Text in Chunks (ca. max_length Zeichen). Diese Implementierung teilt zeilenweise.
+    Zerlegt die Dokumente (Quelle, Text) dokumentweise in Chunks (siehe chunking.chunk_document), bettet
+    sie stapelweise ein und fügt sie mit Zeichenbereich und Überschrift dem Builder hinzu. Ein Stapel umfasst
+    ganze Dokumente mit zusammen etwa batch_chunks (Standard: INDEX_BATCH_CHUNKS) einzubettenden Chunks;
+    Texte und Embeddings eines Stapels werden nach dem Einfügen verworfen, die Dokumente also nie alle auf
+    einmal gehalten. Beinahe-Duplikate eines vorhandenen oder früheren Chunks (siehe DEDUP_THRESHOLD) werden
+    nicht eingebettet, sondern beim Builder als weitere Fundstelle dieses Chunks vermerkt.
+    progress(abgerufen, bisher insgesamt) meldet den Fortschritt der Embedding-Abrufe (siehe embed_texts).
+    Gibt die Anzahl neu eingebetteter Chunks zurück.
     """
-    chunks = []
-    current_chunk = ""
-    for line in text.splitlines():
-        if len(current_chunk) + len(line) + 1 > max_length:
-            chunks.append(current_chunk.strip())
-            current_chunk = line
-        else:
-            current_chunk += " " + line
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    return chunks
-
-def build_faiss_index_from_knowledge(knowledge_text):
-    """
-    Zerlegt den kombinierten Wissens-Text in Chunks, berechnet deren Embeddings und erstellt einen FAISS-Index.
-    Das Mapping der Chunks wird in der globalen Variable faiss_chunk_list gespeichert.
-    """
-    global faiss_index, faiss_chunk_list
-    chunks = chunk_text(knowledge_text, max_length=500)
-    embeddings = []
-    for chunk in chunks:
-        emb = get_embedding(chunk)
-        if emb is not None:
-            embeddings.append(emb)
-        else:
-            print("Kein Embedding für Chunk:", chunk[:30])
-    if len(embeddings) == 0:
+    batch_chunks = batch_chunks or INDEX_BATCH_CHUNKS
+    hasher = MinHasher()
+    finder = builder.duplicate_finder(DEDUP_THRESHOLD, hasher) if DEDUP_THRESHOLD <= 1 else None
+    # Jeder neue Chunk erhält eine fortlaufende Position; new_ids ordnet den bereits eingefügten ihre Chunk-ID zu.
+    # Pro Dokument des Stapels bleiben nur die Chunks und der Hash stehen, nicht der Dokumenttext selbst.
+    # Jeder Chunk wird entweder eingebettet (Position) oder ist ein Beinahe-Duplikat von target: einer
+    # vorhandenen Chunk-ID oder ("neu", Position), auch aus einem früheren Stapel.
+    new_ids = {}
+    document_chunks, unique, signatures = [], [], []
+    offset = 0
+    totals = [0, 0, 0]  # Duplikate, deren Zeichen und Tokens
+
+    def flush():
+        nonlocal document_chunks, unique, signatures, offset, totals
+        counts = add_embedded_batch(builder, document_chunks, unique, signatures, offset, new_ids, progress)
+        totals = [total + count for total, count in zip(totals, counts)]
+        offset += len(unique)
+        document_chunks, unique, signatures = [], [], []
+
+    for source, text in documents:
+        planned = []
+        for chunk in chunk_document(source, text):
+            signature = target = None
+            if finder is not None:
+                signature = hasher.signature(chunk.text)
+                terms = exact_terms(chunk.text)
+                target = finder.find(signature, terms)
+            if target is None:
+                position = offset + len(unique)
+                if finder is not None:
+                    finder.add(("neu", position), signature, terms)
+                unique.append(chunk.text)
+                signatures.append(signature)
+                planned.append((chunk, position, None))
+            else:
+                planned.append((chunk, None, target))
+        document_chunks.append((source, document_hash(content_hash(text)), planned))
+        if len(unique) >= batch_chunks:
+            flush()
+    if document_chunks:
+        flush()
+    duplicates, duplicate_chars, duplicate_tokens = totals
+    added = len(new_ids)
+    INDEX_CHUNKS_EMBEDDED.inc(added)
+    if duplicates:
+        INDEX_DUPLICATES.inc(duplicates)
+        INDEX_DUPLICATE_CHARS.inc(duplicate_chars)
+        print(f"Beinahe-Duplikate: {duplicates} von {added + duplicates} Chunks zusammengefasst; "
+              f"{duplicate_chars} Zeichen (~{duplicate_tokens} Tokens) nicht eingebettet, "
+              f"Index um {duplicates * EMBEDDING_DIMENSION * 4 / 1024:.0f} KB Vektordaten kleiner.")
+    return added
+
+def add_embedded_batch(builder, document_chunks, unique, signatures, offset, new_ids, progress=None):
+    """
+    Bettet die neuen Chunks eines Stapels (unique, ab Position offset) ein, fügt die Dokumente dem Builder
+    hinzu und vermerkt danach ihre Beinahe-Duplikate. Ergänzt new_ids um die IDs der eingefügten Chunks.
+    Gibt (Duplikate, deren Zeichen, deren Tokens) zurück.
+    """
+    # Embeddings werden gebündelt und parallel abgerufen; die Reihenfolge entspricht unique.
+    batch_progress = (lambda done, total: progress(offset + done, offset + total)) if progress else None
+    unique_embeddings = embed_texts(unique, cache=embedding_cache, progress=batch_progress)
+
+    def embedded(position):
+        if position >= offset:
+            return unique_embeddings[position - offset] is not None
+        return position in new_ids
+
+    entries, entry_signatures, entry_positions = [], [], []
+    for source, text_hash, planned in document_chunks:
+        embeddings = []
+        indexed_chunks = []
+        complete = True
+        for chunk, position, target in planned:
+            if position is None:
+                # Ohne Embedding des übernommenen Chunks fehlt auch diese Fundstelle im Index
+                if isinstance(target, tuple) and not embedded(target[1]):
+                    complete = False
+                continue
+            emb = unique_embeddings[position - offset]
+            if emb is not None:
+                embeddings.append(emb)
+                indexed_chunks.append(chunk)
+                entry_signatures.append(signatures[position - offset])
+                entry_positions.append(position)
+            else:
+                print("Kein Embedding für Chunk:", chunk.text[:30])
+                complete = False
+        # Nur vollständig eingebettete Dokumente gelten als aktuell; der Rest wird beim nächsten Abgleich wiederholt.
+        entries.append((source, indexed_chunks, embeddings, text_hash if complete else None))
+    # Die IDs neuer Chunks stehen erst nach dem Einfügen fest; erst dann werden ihre Duplikate vermerkt
+    new_ids.update(zip(entry_positions, builder.add_documents(entries, entry_signatures)))
+    duplicates = duplicate_chars = duplicate_tokens = 0
+    for source, _, planned in document_chunks:
+        for chunk, position, target in planned:
+            if isinstance(target, tuple):
+                target = new_ids.get(target[1])
+            if target is None:
+                continue
+            builder.add_duplicate(target, source, chunk)
+            duplicates += 1
+            duplicate_chars += len(chunk.text)
+            duplicate_tokens += get_token_counter().count(chunk.text)
+    return duplicates, duplicate_chars, duplicate_tokens
+
+def save_and_publish(builder, tenant=DEFAULT_TENANT):
+    if builder.index is None:
         print("Keine gültigen Embeddings gefunden!")
+        return None
+    version = builder.save(index_dir(tenant))
+    publish_index_snapshot(load_index(index_dir(tenant), version), tenant)
+    INDEX_CHUNKS.set(len(builder.ids), tenant=tenant)
+    stats = embedding_cache.stats()
+    print(f"FAISS-Index Version {version} ({tenant}) gespeichert mit {len(builder.ids)} Chunks aus "
+          f"{len(builder.documents)} Dokumenten.")
+    print(f"Embedding-Cache: {stats['hits']} Treffer, {stats['misses']} Fehlzugriffe, "
+          f"{stats['entries']} Einträge ({stats['bytes'] / 1024 / 1024:.1f} MB).")
+    return version
+
+def build_faiss_index_from_knowledge(progress=None, tenant=DEFAULT_TENANT):
+    """
+    Baut den Index-Shard eines Mandanten vollständig neu aus dessen Wissensbasis auf; die Dokumente werden
+    dabei blockweise gelesen. Index und Chunks werden als neue Version gespeichert und anschließend in diesem
+    Worker aktiviert; die übrigen Worker übernehmen die Version bei ihrer nächsten Prüfung.
+    Muss unter build_lock(index_dir(tenant)) aufgerufen werden.
+    """
+    start = time.perf_counter()
+    store = get_knowledge_store(tenant)
+    builder = IndexBuilder(index_type=INDEX_TYPE, vector_storage=VECTOR_STORAGE, knowledge_seq=store.last_seq())
+    added = embed_documents_into(builder, store.iter_documents(), progress)
+    version = save_and_publish(builder, tenant)
+    record_index_build("full", added, time.perf_counter() - start)
+    return version
+
+def sync_knowledge_index(progress=None, tenant=DEFAULT_TENANT):
+    """
+    Gleicht den gespeicherten Index-Shard eines Mandanten inkrementell mit dessen Wissensbasis ab: Verglichen
+    werden nur die Inhalts-Hashes; neue oder geänderte Dokumente werden gelesen und eingebettet, gelöschte per
+    remove_ids aus dem Index entfernt. Die Shards anderer Mandanten bleiben unberührt.
+    """
+    store = get_knowledge_store(tenant)
+    with build_lock(index_dir(tenant)):
+        start = time.perf_counter()
+        builder = IndexBuilder.from_version(index_dir(tenant), index_type=INDEX_TYPE, vector_storage=VECTOR_STORAGE)
+        if builder.index is not None and builder.index_type != INDEX_TYPE:
+            # Index-Typ wurde umkonfiguriert: neu trainieren und aufbauen (Embeddings kommen aus dem Cache)
+            print(f"Index-Typ geändert ({builder.index_type} -> {INDEX_TYPE}), baue den Index neu auf.")
+            return build_faiss_index_from_knowledge(progress, tenant)
+        if builder.index is not None and (
+                builder.vector_storage != VECTOR_STORAGE
+                or (is_lossy(builder.actual_index_type, builder.vector_storage) and builder.vectors is None)):
+            # Ebenso bei geänderter Speicherform oder fehlenden exakten Vektoren für die Neubewertung
+            print(f"Vektor-Speicherform geändert ({builder.vector_storage} -> {VECTOR_STORAGE}), "
+                  "baue den Index neu auf.")
+            return build_faiss_index_from_knowledge(progress, tenant)
+        # Stand vor dem Lesen merken: spätere Änderungen holt der nächste Abgleich nach
+        seq = store.last_seq()
+        wanted = {source: document_hash(text_hash) for source, text_hash in store.hashes().items()}
+        stale = (builder.source_names() | set(builder.documents)) - set(wanted)
+        changed = [source for source, index_hash in wanted.items() if builder.documents.get(source) != index_hash]
+        # In einem Schritt: die Tabellen werden nur einmal verdichtet
+        removed = builder.remove_sources(stale | set(changed))
+        added = embed_documents_into(builder, store.iter_documents(changed), progress)
+        # Versionen aus der Zeit vor der hybriden Suche erhalten beim nächsten Abgleich ihren Stichwortindex
+        missing_keywords = (builder.base_version is not None
+                            and not has_keyword_index(index_dir(tenant), builder.base_version))
+        if not changed and not removed and not missing_keywords:
+            print("Wissensindex ist bereits aktuell.")
+            return None
+        builder.knowledge_seq = seq
+        print(f"Index-Abgleich ({tenant}): {len(changed)} Dokumente neu/geändert, {added} Chunks hinzugefügt, "
+              f"{removed} entfernt.")
+        version = save_and_publish(builder, tenant)
+        record_index_build("sync", added, time.perf_counter() - start)
+        return version
+
+def record_index_build(kind, chunks, seconds):
+    INDEX_BUILD_SECONDS.observe(seconds, kind=kind)
+    if chunks and seconds > 0:
+        INDEX_CHUNKS_PER_SECOND.set(chunks / seconds)
+
+def knowledge_changes_since(version, tenant=DEFAULT_TENANT):
+    """
+    Änderungen der Wissensbasis eines Mandanten seit der Index-Version version: (neue bzw. geänderte
+    Quellen, gelöschte Quellen). Gibt None zurück, wenn die Version oder ihr Stand der Wissensbasis unbekannt ist.
+    """
+    meta = read_meta(index_dir(tenant), version)
+    if meta is None:
+        return None
+    return get_knowledge_store(tenant).changes_since(meta.get("knowledge_seq"))
+
+def publish_index_snapshot(snapshot, tenant=DEFAULT_TENANT):
+    """
+    Tauscht den aktiven Index-Stand eines Mandanten atomar aus; laufende Anfragen behalten ihren bisherigen Stand.
+    """
+    shard_cache.publish(tenant, snapshot)
+    INDEX_SHARD_BYTES.set(shard_cache.stats()[1])
+
+def get_index_snapshot(tenant=DEFAULT_TENANT):
+    """
+    Liefert den aktiven Index-Stand eines Mandanten (Shard) und lädt höchstens alle INDEX_CHECK_INTERVAL
+    Sekunden eine neu veröffentlichte Version nach. Nicht geladene Shards werden dabei geladen, was bei
+    Bedarf andere verdrängt (siehe SHARD_CACHE_MB).
+    """
+    snapshot = shard_cache.get(tenant, index_dir(tenant))
+    INDEX_SHARD_BYTES.set(shard_cache.stats()[1])
+    return snapshot
+
+def sync_uploaded_files(tenant=DEFAULT_TENANT):
+    """
+    Übernimmt neue oder auf der Platte geänderte hochgeladene Dateien eines Mandanten in dessen Wissensbasis.
+    """
+    filenames = [file_record.filename for file_record in UploadedFile.query.filter_by(tenant=tenant)]
+    return sync_upload_directory(get_knowledge_store(tenant), tenant_upload_folder(tenant), filenames)
+
+def migrate_knowledge_file():
+    """
+    Übernimmt beim ersten Start den bisherigen Wissensbestand in die Wissensbasis: die Abschnitte der
+    knowledge.txt, gecrawlte Seiten, die dort fehlen, und die hochgeladenen Dateien. Der Text gecrawlter
+    Seiten liegt danach nur noch in der Wissensbasis, nicht mehr zusätzlich in CrawledPage.
+    """
+    if knowledge_store.is_migrated("knowledge.txt"):
         return
-    embeddings = np.array(embeddings).astype("float32")
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
-    faiss_index = index
-    faiss_chunk_list = chunks
-    print(f"FAISS-Index aufgebaut mit {len(chunks)} Chunks.")
+    imported = 0
+    if os.path.exists(KNOWLEDGE_FILE):
+        with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+            imported += len(knowledge_store.put_many(split_sections(f)))
+    known = set(knowledge_store.sources("url:"))
+    pages = ((page.url, page.content) for page in CrawledPage.query.filter(CrawledPage.content != "")
+             if "url:" + page.url not in known)
+    imported += len(knowledge_store.put_many(("url:" + url, f"URL: {url}\n{text}\n") for url, text in pages))
+    imported += sync_uploaded_files()
+    db.session.query(CrawledPage).update({CrawledPage.content: ""})
+    db.session.commit()
+    knowledge_store.mark_migrated("knowledge.txt")
+    if imported:
+        print(f"{imported} Dokumente in die Wissensbasis übernommen; knowledge.txt wird nicht mehr verwendet.")
 
-def load_current_knowledge():
+def get_knowledge_store(tenant=DEFAULT_TENANT):
     """
-    Liest den aktuellen Wissensbestand aus der knowledge.txt und aus allen hochgeladenen .txt-Dateien.
+    Wissensbasis eines Mandanten (instance/knowledge.db bzw. instance/tenants/<mandant>/knowledge.db);
+    jeder Prozess öffnet sie beim ersten Zugriff.
     """
-    knowledge = ""
-    try:
-        with open("knowledge.txt", "r", encoding="utf-8") as f:
-            file_content = f.read()
-            print("Inhalt von knowledge.txt (erste 100 Zeichen):", file_content[:100])
-            knowledge += file_content + "\n"
-    except FileNotFoundError:
-        print("knowledge.txt nicht gefunden.")
-        knowledge = ""
-    uploaded_knowledge = ""
-    uploaded_files = UploadedFile.query.all()
-    for file_record in uploaded_files:
-        file_path = os.path.join(app.config["UPLOAD_FOLDER"], file_record.filename)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                print(f"Inhalt von {file_record.filename} (erste 100 Zeichen):", content[:100])
-                uploaded_knowledge += content + "\n"
-        except Exception as e:
-            print(f"Fehler beim Lesen der Datei {file_record.filename}:", e)
-            continue
-    full_knowledge = knowledge + "\n" + uploaded_knowledge
-    return full_knowledge
+    if tenant == DEFAULT_TENANT:
+        return knowledge_store
+    store = tenant_knowledge_stores.get(tenant)
+    if store is None:
+        with tenant_stores_lock:
+            store = tenant_knowledge_stores.get(tenant)
+            if store is None:
+                ensure_tenant(tenant)
+                store = KnowledgeStore(os.path.join(tenant_instance_path(tenant), "knowledge.db"))
+                tenant_knowledge_stores[tenant] = store
+    return store
 
-def refresh_knowledge_index():
+def configure_openai_api_key():
     """
-    Aktualisiert den FAISS-Index mit den aktuellen Daten aus der Wissensbasis.
-    Setzt den API-Key aus der DB und baut den Index neu auf.
+    Setzt den API-Key für Hintergrund-Threads (Umgebungsvariable oder gespeicherter Schlüssel).
+    """
+    import openai
+
+    api_key = settings_cache.get().api_key
+    if api_key:
+        openai.api_key = api_key
+
+def refresh_knowledge_index(progress=None, tenant=DEFAULT_TENANT):
+    """
+    Aktualisiert den Index-Shard eines Mandanten mit den aktuellen Daten aus dessen Wissensbasis.
+    Setzt den API-Key aus der DB, übernimmt geänderte Upload-Dateien und gleicht den Index inkrementell ab:
+    nur neue oder geänderte Dokumente werden eingebettet, entfernte Dokumente aus dem Index gelöscht.
+    Gibt eine Meldung über das Ergebnis zurück.
     """
-    global faiss_index, faiss_chunk_list
     with app.app_context():
-        stored_key = APIKey.query.first()
-        if stored_key:
-            openai.api_key = stored_key.key
-        new_knowledge = load_current_knowledge()
-        if new_knowledge.strip():
-            build_faiss_index_from_knowledge(new_knowledge)
-            print("Wissensindex wurde aktualisiert.")
-        else:
-            print("Kein Wissen gefunden. Index nicht aktualisiert.")
+        configure_openai_api_key()
+        sync_uploaded_files(tenant)
+        if get_knowledge_store(tenant).stats()["documents"] or current_version(index_dir(tenant)) is not None:
+            version = sync_knowledge_index(progress, tenant)
+            if version is None:
+                return "Wissensindex ist bereits aktuell."
+            return f"Wissensindex aktualisiert (Version {version})."
+        print(f"Kein Wissen gefunden ({tenant}). Index nicht aktualisiert.")
+        return "Kein Wissen gefunden. Index nicht aktualisiert."
+
+def index_job(job, tenant=DEFAULT_TENANT):
+    """
+    Job "index": Index-Abgleich eines Mandanten mit den eingebetteten Chunks als Fortschritt.
+    """
+    return refresh_knowledge_index(lambda done, total: job.progress(done, total, "Chunks eingebettet"), tenant)
+
+def schedule_index_update(tenant=DEFAULT_TENANT):
+    """
+    Plant eine Index-Aktualisierung eines Mandanten als Hintergrund-Job ein. Läuft für diesen Mandanten gerade
+    eine, startet die neue danach; ist schon eine eingeplant, übernimmt diese auch die neue Änderung.
+    Die Shards verschiedener Mandanten werden unabhängig voneinander aktualisiert. Gibt die Job-ID zurück.
+    """
+    if tenant == DEFAULT_TENANT:
+        job_id, _ = job_runner.submit(index_job_kind(tenant), index_job, label="Wissensindex aktualisieren")
+    else:
+        job_id, _ = job_runner.submit(index_job_kind(tenant), index_job, tenant,
+                                      label=f"Wissensindex aktualisieren ({tenant})")
+    return job_id
+
+def index_job_kind(tenant=DEFAULT_TENANT):
+    return "index" if tenant == DEFAULT_TENANT else f"index:{tenant}"
+
+def crawl_job(job, sites):
+    """
+    Job "crawl": crawlt die Websites (URL, Seitenbudget, Tiefe, Mandant) nacheinander in die Wissensbasis ihres
+    Mandanten und plant für jeden Mandanten mit Änderungen eine Index-Aktualisierung ein. Bei Abbruch bleibt
+    der Frontier erhalten; der nächste Crawl setzt dort fort.
+    """
+    from crawl import crawl_website
+
+    changed = removed = processed = 0
+    changed_tenants = []
+    try:
+        for site_url, max_pages, max_depth, tenant in sites:
+            print(f"🔍 Starte Crawling für: {site_url} ({tenant})")
+            report = crawl_website(site_url, max_pages=max_pages, max_depth=max_depth,
+                                   store=get_knowledge_store(tenant),
+                                   progress=lambda pages: job.progress(processed + pages, None, f"Crawle {site_url}"))
+            changed += len(report.changed)
+            removed += len(report.removed)
+            processed += len(report.changed) + len(report.removed) + report.unchanged + report.failed
+            if (report.changed or report.removed) and tenant not in changed_tenants:
+                changed_tenants.append(tenant)
+    except JobCancelled:
+        # Bereits gespeicherte Seiten trotzdem in den Index übernehmen
+        for tenant in {tenant for _, _, _, tenant in sites}:
+            schedule_index_update(tenant)
+        raise
+    if not changed and not removed:
+        return f"{processed} Seiten geprüft, keine Änderungen gefunden."
+    # Neue, geänderte und entfernte Seiten stehen bereits in der Wissensbasis;
+    # der Abgleich bettet nur diese Dokumente ein
+    jobs = ", ".join(f"#{schedule_index_update(tenant)}" for tenant in changed_tenants)
+    return (f"{processed} Seiten geprüft, {changed} neu/geändert, {removed} entfernt; "
+            f"Index-Aktualisierung als Job {jobs} eingeplant.")
 
 # --------------------------
-# Admin-Oberfläche
+# App einrichten (einmal pro Prozess bzw. bei gunicorn --preload einmal im Master)
 # --------------------------
-class MyAdminIndexView(AdminIndexView):
-    @expose("/")
-    def index(self):
-        return self.render("admin_index.html")
+app_ready = False
+app_setup_lock = threading.Lock()
+
+def open_process_resources():
+    """
+    Öffnet Caches, Wissensbasis, Job-Verwaltung und den HTTP-Pool für OpenAI in diesem Prozess, falls noch
+    nicht geschehen. Mit gunicorn --preload ruft jeder Worker das nach dem Fork auf (gunicorn.conf.py).
+    """
+    global embedding_cache, answer_cache, knowledge_store, job_runner
+    if knowledge_store is not None:
+        return
+    embedding_cache = EmbeddingCache(
+        os.path.join(app.instance_path, "embedding_cache.db"),
+        max_bytes=int(os.getenv("SHOPBOT_EMBEDDING_CACHE_MB", "512")) * 1024 * 1024,
+    )
+    # Schwelle = minimale Kosinus-Ähnlichkeit der Fragen
+    answer_cache = AnswerCache(
+        os.path.join(app.instance_path, "answer_cache.db"),
+        threshold=float(os.getenv("SHOPBOT_ANSWER_CACHE_THRESHOLD", "0.96")),
+        ttl=float(os.getenv("SHOPBOT_ANSWER_CACHE_TTL_HOURS", "24")) * 3600,
+        max_entries=int(os.getenv("SHOPBOT_ANSWER_CACHE_MAX_ENTRIES", "5000")),
+        max_contexts=int(os.getenv("SHOPBOT_ANSWER_CACHE_CONTEXTS", "64")),
+    )
+    knowledge_store = KnowledgeStore(os.path.join(app.instance_path, "knowledge.db"))
+    job_runner = JobRunner(os.path.join(app.instance_path, "jobs.db"), context=app.app_context)
+    # Gemeinsamer HTTP-Verbindungspool für alle OpenAI-Aufrufe dieses Prozesses (wichtig für gevent-Worker)
+    install_shared_openai_session()
+
+def close_process_resources():
+    """
+    Schließt die Verbindungen aus open_process_resources() (auch die Wissensbasen weiterer Mandanten) und die
+    Datenbank-Verbindungen von SQLAlchemy. Die geladenen Index-Shards bleiben erhalten: Nach dem Fork teilen
+    sich die Worker ihre Speicherseiten.
+    """
+    global embedding_cache, answer_cache, knowledge_store, job_runner
+    if job_runner is not None:
+        # Zuerst laufende Jobs abwarten; sie nutzen Caches und Wissensbasen
+        job_runner.close()
+    with tenant_stores_lock:
+        stores = list(tenant_knowledge_stores.values())
+        tenant_knowledge_stores.clear()
+    for resource in (embedding_cache, answer_cache, knowledge_store, *stores):
+        if resource is not None:
+            resource.close()
+    embedding_cache = answer_cache = knowledge_store = job_runner = None
+    if app_ready:
+        with app.app_context():
+            db.engine.dispose()
+
+def init_admin():
+    """
+    Admin-Oberfläche (Flask-Admin wird erst hier importiert).
+    """
+    from flask_admin import Admin, AdminIndexView, expose
+
+    class MyAdminIndexView(AdminIndexView):
+        @expose("/")
+        def index(self):
+            return self.render("admin_index.html")
+
+    return Admin(app, name="ShopBot Admin", template_mode="bootstrap3", index_view=MyAdminIndexView())
 
-admin = Admin(app, name="ShopBot Admin", template_mode="bootstrap3", index_view=MyAdminIndexView())
+def create_app():
+    """
+    App-Factory für gunicorn ("app:create_app()"), flask run und Skripte: richtet die App beim ersten Aufruf
+    ein und gibt sie zurück; weitere Aufrufe liefern dieselbe App. Eingerichtet werden Datenbank und Schema
+    (prozessübergreifend gesperrt, danach nur noch ein Versionsvergleich, siehe models.init_schema),
+    Caches und Wissensbasis, die Übernahme der knowledge.txt, die Admin-Oberfläche und der gespeicherte
+    Index, damit schon der erste Chat ohne Laden oder Aufbau auskommt.
+    """
+    global app_ready
+    with app_setup_lock:
+        if app_ready:
+            return app
+        start = time.perf_counter()
+        os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+        os.makedirs(app.instance_path, exist_ok=True)
+        db.init_app(app)
+        with app.app_context():
+            enable_sqlite_wal(db.engine)
+            with build_lock(app.instance_path):
+                if init_schema():
+                    print("Datenbankschema angelegt bzw. aktualisiert.")
+        # Metriken (/metrics): jeder Worker legt seinen Stand hier ab, damit /metrics alle Worker zusammenfasst
+        REGISTRY.set_directory(os.path.join(app.instance_path, "metrics"))
+        open_process_resources()
+        with app.app_context():
+            migrate_knowledge_file()
+        init_admin()
+        app_ready = True
+        snapshot = get_index_snapshot()
+        print(f"App in {time.perf_counter() - start:.2f}s eingerichtet"
+              f"{f', Index-Version {snapshot.version} geladen' if snapshot is not None else ''}.")
+        return app
 
 # --------------------------
 # Routen für Webseiten-Verwaltung, Datei-Upload, Löschen usw.
 # --------------------------
+def read_budget(field_name):
+    """
+    Liest ein optionales Crawl-Budget aus dem Formular; leer oder 0 bedeutet unbegrenzt.
+    """
+    value = request.form.get(field_name, "").strip()
+    return int(value) if value.isdigit() and int(value) > 0 else None
+
 @app.route("/admin/websites", methods=["GET", "POST"])
 def manage_websites():
     if request.method == "POST":
+        tenant = form_tenant()
         new_url = request.form.get("url", "").strip()
         if new_url:
             # Falls kein Protokoll eingegeben wurde, füge automatisch https:// hinzu.
             if not (new_url.startswith("http://") or new_url.startswith("https://")):
                 new_url = "https://" + new_url
 
+            # Eine Website gehört genau einem Mandanten (ihre Seiten landen in dessen Wissensbasis)
             if not CrawledWebsite.query.filter_by(url=new_url).first():
-                db.session.add(CrawledWebsite(url=new_url))
+                ensure_tenant(tenant)
+                db.session.add(CrawledWebsite(url=new_url, max_pages=read_budget("max_pages"),
+                                              max_depth=read_budget("max_depth"), tenant=tenant))
                 db.session.commit()
                 flash("Webseite erfolgreich hinzugefügt!", "success")
             else:
                 flash("Diese Webseite ist bereits in der Liste.", "warning")
-    websites = CrawledWebsite.query.all()
-    return render_template("manage_websites.html", websites=websites)
+    websites = CrawledWebsite.query.order_by(CrawledWebsite.tenant, CrawledWebsite.url).all()
+    return render_template("manage_websites.html", websites=websites, tenants=known_tenants())
 
 @app.route("/admin/upload", methods=["GET", "POST"])
 def upload_file():
+    tenant = form_tenant()
     if request.method == "POST":
         file = request.files.get("file")
         if file and file.filename.endswith(".txt"):
-            file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
+            ensure_tenant(tenant)
+            os.makedirs(tenant_upload_folder(tenant), exist_ok=True)
+            file_path = os.path.join(tenant_upload_folder(tenant), file.filename)
             file.save(file_path)
-            new_file = UploadedFile(filename=file.filename)
+            new_file = UploadedFile(filename=file.filename, tenant=tenant)
             db.session.add(new_file)
             db.session.commit()
+            # Nur die Chunks der neuen Datei einbetten und dem Index-Shard des Mandanten hinzufügen
+            if sync_uploaded_files(tenant):
+                schedule_index_update(tenant)
             flash("Datei erfolgreich hochgeladen!", "success")
         else:
             flash("Nur .txt-Dateien erlaubt!", "error")
-    files = UploadedFile.query.all()
-    return render_template("upload.html", files=files)
+    files = UploadedFile.query.filter_by(tenant=tenant).all()
+    return render_template("upload.html", files=files, tenant=tenant, tenants=known_tenants())
+
+@app.route("/admin/website_budget/<int:website_id>", methods=["POST"])
+def update_website_budget(website_id):
+    website = CrawledWebsite.query.get(website_id)
+    if website:
+        website.max_pages = read_budget("max_pages")
+        website.max_depth = read_budget("max_depth")
+        db.session.commit()
+        flash("Crawl-Budget gespeichert!", "success")
+    else:
+        flash("Webseite nicht gefunden!", "error")
+    return redirect(url_for("manage_websites"))
 
 @app.route("/admin/delete_website/<int:website_id>", methods=["POST"])
 def delete_website(website_id):
@@ -249,6 +738,10 @@ def delete_all_crawled_data():
     try:
         num_deleted = db.session.query(CrawledPage).delete()
         db.session.commit()
+        for tenant in known_tenants():
+            store = get_knowledge_store(tenant)
+            if store.delete_many(store.sources("url:")):
+                schedule_index_update(tenant)
         flash(f"✅ {num_deleted} gecrawlte Einträge wurden gelöscht!", "success")
     except Exception as e:
         db.session.rollback()
@@ -257,15 +750,48 @@ def delete_all_crawled_data():
 
 @app.route("/admin/crawled-data")
 def crawled_data():
-    pages = CrawledPage.query.order_by(CrawledPage.id.desc()).all()
-    return render_template("crawled_data.html", pages=pages)
+    """
+    Gecrawlte Seiten, neueste zuerst, seitenweise per Keyset-Paginierung über die ID (?before=<id> bzw.
+    ?after=<id>): jede Seite kostet eine Indexsuche, unabhängig davon, wie weit geblättert wurde.
+    Die Vorschau liest nur die ersten Zeichen der angezeigten Seitentexte aus der Wissensbasis.
+    """
+    before = request.args.get("before", type=int)
+    after = request.args.get("after", type=int)
+    query = CrawledPage.query.with_entities(CrawledPage.id, CrawledPage.url, CrawledPage.timestamp)
+    if after is not None:
+        pages = query.filter(CrawledPage.id > after).order_by(CrawledPage.id).limit(CRAWLED_PAGE_SIZE + 1).all()
+        has_newer = len(pages) > CRAWLED_PAGE_SIZE
+        pages = pages[:CRAWLED_PAGE_SIZE][::-1]
+        has_older = bool(pages) and query.filter(CrawledPage.id < pages[-1].id).first() is not None
+    else:
+        newest_first = query.order_by(CrawledPage.id.desc())
+        if before is not None:
+            newest_first = newest_first.filter(CrawledPage.id < before)
+        pages = newest_first.limit(CRAWLED_PAGE_SIZE + 1).all()
+        has_older = len(pages) > CRAWLED_PAGE_SIZE
+        pages = pages[:CRAWLED_PAGE_SIZE]
+        has_newer = bool(pages) and query.filter(CrawledPage.id > pages[0].id).first() is not None
+    # Eine Seite steht in der Wissensbasis des Mandanten, dem ihre Website gehört
+    previews = {}
+    for tenant in known_tenants():
+        previews.update(get_knowledge_store(tenant).previews(["url:" + page.url for page in pages],
+                                                             CRAWLED_PREVIEW_CHARS))
+    return render_template(
+        "crawled_data.html", pages=pages, previews={page.id: previews.get("url:" + page.url, "") for page in pages},
+        total=db.session.query(db.func.count(CrawledPage.id)).scalar(),
+        older=pages[-1].id if has_older else None, newer=pages[0].id if has_newer else None,
+    )
 
 @app.route("/admin/delete_crawled/<int:page_id>", methods=["POST"])
 def delete_crawled(page_id):
     page = CrawledPage.query.get(page_id)
     if page:
+        url = page.url
         db.session.delete(page)
         db.session.commit()
+        for tenant in known_tenants():
+            if get_knowledge_store(tenant).delete("url:" + url):
+                schedule_index_update(tenant)
         flash("✅ Gecrawlte Seite wurde gelöscht!", "success")
     else:
         flash("❌ Seite nicht gefunden!", "error")
@@ -273,72 +799,68 @@ def delete_crawled(page_id):
 
 @app.route("/admin/start-crawling", methods=["POST"])
 def start_crawling():
-    with app.app_context():
-        websites = CrawledWebsite.query.all()
-        if not websites:
-            flash("❌ Keine Webseiten zum Crawlen eingetragen!", "error")
-        else:
-            def crawl():
-                crawled_text = []
-                for site in websites:
-                    print(f"🔍 Starte Crawling für: {site.url}")
-                    text = crawl_website(site.url)
-                    if text:
-                        crawled_text.append(text)
-                all_text = "\n".join(crawled_text)
-                try:
-                    with open(KNOWLEDGE_FILE, "w", encoding="utf-8") as f:
-                        f.write(all_text)
-                    print("knowledge.txt wurde geschrieben.")
-                except Exception as e:
-                    print("Fehler beim Schreiben von knowledge.txt:", e)
-                flash("✅ Crawling abgeschlossen und Wissen aktualisiert!", "success")
-                # Setze den FAISS-Index zurück, damit er beim nächsten Chat neu aufgebaut wird.
-                global faiss_index, faiss_chunk_list
-                faiss_index, faiss_chunk_list = None, None
-            thread = threading.Thread(target=crawl)
-            thread.start()
-            flash("🚀 Crawling gestartet! Dies kann einige Minuten dauern.", "info")
-    return redirect(url_for("manage_websites"))
+    websites = CrawledWebsite.query.all()
+    if not websites:
+        flash("❌ Keine Webseiten zum Crawlen eingetragen!", "error")
+        return redirect(url_for("manage_websites"))
+    sites = [(site.url, site.max_pages, site.max_depth, site.tenant) for site in websites]
+    # Läuft schon ein Crawl, wird kein zweiter eingeplant
+    job_id, created = job_runner.submit("crawl", crawl_job, sites, label=f"Crawling ({len(sites)} Webseiten)",
+                                        queue_behind=False)
+    if created:
+        flash(f"🚀 Crawling gestartet (Job #{job_id})! Dies kann einige Minuten dauern.", "info")
+    else:
+        flash(f"Es läuft bereits ein Crawling (Job #{job_id}).", "warning")
+    return redirect(url_for("manage_jobs"))
 
 
 @app.route("/admin/basisprompt", methods=["GET", "POST"])
 def manage_basisprompt():
+    tenant = form_tenant()
     if request.method == "POST":
         new_prompt = request.form.get("prompt")
         if new_prompt:
-            prompt_entry = BotPrompt.query.first()
+            ensure_tenant(tenant)
+            prompt_entry = BotPrompt.query.filter_by(tenant=tenant).first()
             if prompt_entry:
                 prompt_entry.prompt = new_prompt
             else:
-                prompt_entry = BotPrompt(prompt=new_prompt)
+                prompt_entry = BotPrompt(prompt=new_prompt, tenant=tenant)
                 db.session.add(prompt_entry)
             db.session.commit()
+            get_settings_cache(tenant).invalidate()
             flash("Basisprompt gespeichert!", "success")
-    stored_prompt = BotPrompt.query.first()
-    current_prompt = stored_prompt.prompt if stored_prompt else "Ich bin ein hilfreicher Assistent."
-    return render_template("basisprompt.html", basisprompt=current_prompt)
+    stored_prompt = BotPrompt.query.filter_by(tenant=tenant).first()
+    current_prompt = stored_prompt.prompt if stored_prompt else DEFAULT_BASE_PROMPT
+    return render_template("basisprompt.html", basisprompt=current_prompt, tenant=tenant, tenants=known_tenants())
 
 @app.route("/admin/delete_file/<int:file_id>", methods=["POST"])
 def delete_file(file_id):
     file_record = UploadedFile.query.get(file_id)
     if file_record:
-        file_path = os.path.join(app.config["UPLOAD_FOLDER"], file_record.filename)
+        filename, tenant = file_record.filename, file_record.tenant
+        file_path = os.path.join(tenant_upload_folder(tenant), filename)
         if os.path.exists(file_path):
             os.remove(file_path)
         db.session.delete(file_record)
         db.session.commit()
+        get_knowledge_store(tenant).delete("upload:" + filename)
+        schedule_index_update(tenant)
         flash("Datei erfolgreich gelöscht!", "success")
     else:
+        tenant = DEFAULT_TENANT
         flash("Datei nicht gefunden!", "error")
-    return redirect(url_for("upload_file"))
+    return redirect(url_for("upload_file", tenant=tenant))
 
 @app.route("/admin/settings", methods=["GET", "POST"])
 def manage_settings():
+    tenant = form_tenant()
     if request.method == "POST":
         new_key = request.form.get("api_key")
         new_text = request.form.get("greeting_text")
         new_prompt = request.form.get("bot_prompt")
+        ensure_tenant(tenant)
+        # Der API-Key gilt für alle Mandanten, Begrüßung und Basis-Prompt nur für den gewählten
         if new_key:
             existing_key = APIKey.query.first()
             if existing_key:
@@ -346,107 +868,428 @@ def manage_settings():
             else:
                 db.session.add(APIKey(key=new_key))
         if new_text:
-            greeting = GreetingMessage.query.first()
+            greeting = GreetingMessage.query.filter_by(tenant=tenant).first()
             if greeting:
                 greeting.text = new_text
             else:
-                db.session.add(GreetingMessage(text=new_text))
+                db.session.add(GreetingMessage(text=new_text, tenant=tenant))
         if new_prompt:
-            prompt_entry = BotPrompt.query.first()
+            prompt_entry = BotPrompt.query.filter_by(tenant=tenant).first()
             if prompt_entry:
                 prompt_entry.prompt = new_prompt
             else:
-                db.session.add(BotPrompt(prompt=new_prompt))
+                db.session.add(BotPrompt(prompt=new_prompt, tenant=tenant))
         db.session.commit()
+        get_settings_cache(tenant).invalidate()
         flash("Einstellungen gespeichert!", "success")
     stored_key = APIKey.query.first()
     current_key = stored_key.key if stored_key else ""
-    stored_greeting = GreetingMessage.query.first()
-    current_greeting = stored_greeting.text if stored_greeting else "Hallo! Wie kann ich helfen?"
-    stored_prompt = BotPrompt.query.first()
-    current_prompt = stored_prompt.prompt if stored_prompt else "Ich bin ein hilfreicher Assistent."
-    return render_template("settings.html", api_key=current_key, greeting_text=current_greeting, bot_prompt=current_prompt)
+    stored_greeting = GreetingMessage.query.filter_by(tenant=tenant).first()
+    current_greeting = stored_greeting.text if stored_greeting else DEFAULT_GREETING
+    stored_prompt = BotPrompt.query.filter_by(tenant=tenant).first()
+    current_prompt = stored_prompt.prompt if stored_prompt else DEFAULT_BASE_PROMPT
+    return render_template("settings.html", api_key=current_key, greeting_text=current_greeting, bot_prompt=current_prompt,
+                           tenant=tenant, tenants=known_tenants())
 
 @app.route("/api/greeting", methods=["GET"])
 def get_greeting():
-    stored_greeting = GreetingMessage.query.first()
-    greeting_text = stored_greeting.text if stored_greeting else "Hallo! Wie kann ich helfen?"
-    return jsonify({"greeting_text": greeting_text})
+    """
+    Begrüßungstext des Mandanten ?tenant=<id> (ohne Angabe: Standard-Mandant).
+    """
+    tenant = request_tenant(request.args.get("tenant"))
+    if tenant is None:
+        return jsonify({"error": "Unbekannter Mandant"}), 404
+    return jsonify({"greeting_text": get_settings_cache(tenant).get().greeting})
+
+@app.route("/admin/answer-cache", methods=["GET"])
+def answer_cache_stats():
+    return render_template("answer_cache.html", stats=answer_cache.stats())
+
+@app.route("/admin/answer-cache/clear", methods=["POST"])
+def clear_answer_cache():
+    answer_cache.clear()
+    flash("Antwort-Cache geleert!", "success")
+    return redirect(url_for("answer_cache_stats"))
+
+@app.route("/admin/knowledge/changes", methods=["GET"])
+def knowledge_changes():
+    """
+    Was sich in der Wissensbasis eines Mandanten (Parameter tenant) seit einer Index-Version (Parameter since,
+    Standard: aktuelle Version seines Shards) geändert hat.
+    """
+    tenant = request_tenant(request.args.get("tenant"))
+    if tenant is None:
+        return jsonify({"error": "Unbekannter Mandant"}), 404
+    version = request.args.get("since", type=int) or current_version(index_dir(tenant))
+    changes = knowledge_changes_since(version, tenant) if version is not None else None
+    if changes is None:
+        return jsonify({"since": version, "error": "Stand dieser Index-Version unbekannt"}), 404
+    changed, deleted = changes
+    return jsonify({"since": version, "tenant": tenant, "changed": changed, "deleted": deleted,
+                    "store": get_knowledge_store(tenant).stats()})
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Laufzeiten und Zähler aller Worker im Textformat von Prometheus (Chat-Stufen, Index-Aufbau, Crawls).
+    """
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 # Neuer Endpunkt: Wissensindex aktualisieren per Knopfdruck
 @app.route("/admin/update_index", methods=["POST"])
 def update_index():
-    thread = threading.Thread(target=refresh_knowledge_index)
-    thread.start()
-    flash("Der Wissensindex wird aktualisiert. Bitte etwas Geduld!", "info")
-    return redirect(url_for("admin.index"))
+    # Jeder Mandant erhält einen eigenen Job; unveränderte Shards sind nach dem Hash-Vergleich sofort fertig
+    job_ids = [schedule_index_update(tenant) for tenant in known_tenants()]
+    flash(f"Der Wissensindex wird aktualisiert (Job {', '.join(f'#{job_id}' for job_id in job_ids)}). "
+          "Bitte etwas Geduld!", "info")
+    return redirect(url_for("manage_jobs"))
+
+@app.route("/admin/jobs", methods=["GET"])
+def manage_jobs():
+    jobs = job_runner.recent()
+    for job in jobs:
+        for field in ("created", "started", "finished"):
+            job[field + "_at"] = (datetime.datetime.fromtimestamp(job[field]).strftime("%d.%m.%Y %H:%M:%S")
+                                  if job[field] else "")
+        end = job["finished"] or (time.time() if job["started"] else None)
+        job["duration"] = f"{end - job['started']:.0f}s" if job["started"] and end else ""
+    return render_template("jobs.html", jobs=jobs,
+                           active=any(job["status"] in ACTIVE_STATUSES for job in jobs))
+
+@app.route("/admin/jobs/<int:job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job nicht gefunden"}), 404
+    return jsonify(job)
+
+@app.route("/admin/jobs/<int:job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    if job_runner.cancel(job_id):
+        flash(f"Abbruch von Job #{job_id} angefordert.", "info")
+    else:
+        flash(f"Job #{job_id} läuft nicht mehr.", "warning")
+    return redirect(url_for("manage_jobs"))
 
 # --------------------------
-# Chatbot-Endpoint mit Retrieval-Augmented Generation (FAISS)
+# Hilfsfunktionen für den Chat (Kontext, Streaming)
 # --------------------------
-@app.route("/chat", methods=["POST"])
-def chatbot():
-    user_input = request.json.get("message")
-    if not user_input:
-        return jsonify({"error": "Keine Eingabe erhalten"}), 400
+class ChatError(Exception):
+    """
+    Fehler bei der Vorbereitung einer Chat-Anfrage; wird als JSON mit dem HTTP-Status beantwortet.
+    """
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
 
-    # API-Schlüssel abrufen
-    def get_openai_api_key():
-        env_key = os.getenv("OPENAI_API_KEY")
-        if env_key:
-            return env_key
+class ChatTurn:
+    """
+    Eine vorbereitete Chat-Anfrage: entweder mit einer Antwort aus dem Antwort-Cache (cached_answer)
+    oder mit der Antwort des Chat-Modells, die im Hintergrund erzeugt wird (flight). coalesced: die
+    Antwort gehört zu einer gleichzeitigen gleichen Frage und wird nur mitgelesen.
+    """
 
-        stored_key = APIKey.query.first()
-        if stored_key:
-            return stored_key.key
+    def __init__(self, question, cached_answer=None, flight=None, coalesced=False):
+        self.question = question
+        self.cached_answer = cached_answer
+        self.flight = flight
+        self.coalesced = coalesced
 
-        return None
+    @property
+    def outcome(self):
+        return "coalesced" if self.coalesced else "generated"
 
-    openai.api_key = get_openai_api_key()
-    if not openai.api_key:
-        return jsonify({"error": "Kein API-Key gespeichert"}), 500
+    def tokens(self):
+        return self.flight.stream(UPSTREAM_IDLE_TIMEOUT)
+
+    def answer(self):
+        return self.flight.result(UPSTREAM_IDLE_TIMEOUT)
 
-    # Basis-Prompt abrufen
-    stored_prompt = BotPrompt.query.first()
-    base_prompt = stored_prompt.prompt if stored_prompt else "Ich bin ein hilfreicher Assistent."
+def prepare_chat_turn(user_input, tenant=DEFAULT_TENANT):
+    """
+    Sammelt API-Key, Basis-Prompt, Begrüßung und den relevanten Wissenskontext (FAISS und Stichwortsuche,
+    siehe find_relevant_chunks) eines Mandanten für eine Nutzerfrage; gesucht wird nur in dessen Index-Shard.
+    Wurde dieselbe oder eine sehr ähnliche Frage zum aktuellen Wissensstand schon beantwortet, kommt die
+    Antwort direkt aus dem Antwort-Cache.
+    """
+    # API-Schlüssel, Basis-Prompt und Begrüßungstext kommen aus dem Einstellungs-Cache (keine DB-Abfrage)
+    with stage("settings"):
+        settings = get_settings_cache(tenant).get()
+    import openai
 
-    # Begrüßungstext abrufen
-    stored_greeting = GreetingMessage.query.first()
-    greeting_message = stored_greeting.text if stored_greeting else "Hallo! Wie kann ich helfen?"
+    openai.api_key = settings.api_key
+    if not openai.api_key:
+        raise ChatError("Kein API-Key gespeichert")
+    base_prompt = settings.base_prompt
+    greeting_message = settings.greeting
 
     # FAISS-Index laden, falls noch nicht geschehen
-    global faiss_index, faiss_chunk_list
-    if faiss_index is None:
-        knowledge_text = load_current_knowledge()
-        if knowledge_text.strip():
-            build_faiss_index_from_knowledge(knowledge_text)
-
-    # Falls kein FAISS-Index vorhanden ist
-    relevant_context = ""
-    if faiss_index is not None:
-        query_embedding = get_embedding(user_input)
-        if query_embedding is None:
-            return jsonify({"error": "Fehler beim Abrufen des Embeddings."}), 500
-        
-        query_embedding = np.array(query_embedding).astype("float32").reshape(1, -1)
-        k = 3
-        distances, indices = faiss_index.search(query_embedding, k)
-        relevant_chunks = [faiss_chunk_list[idx] for idx in indices[0] if idx < len(faiss_chunk_list)]
-        relevant_context = "\n\n".join(relevant_chunks)
-
-    # OpenAI API aufrufen
+    with stage("index_load"):
+        snapshot = get_index_snapshot(tenant)
+    if snapshot is None and get_knowledge_store(tenant).stats()["documents"]:
+        # Noch kein Index für vorhandenes Wissen: nicht in der Anfrage aufbauen (das hielte sie und bei gevent
+        # den ganzen Worker minutenlang auf), sondern als Job einplanen und bis dahin mit 503 abweisen
+        if not job_runner.active(index_job_kind(tenant)):
+            schedule_index_update(tenant)
+        annotate(tenant=tenant, index_version=None)
+        raise Overloaded("Der Wissensindex wird gerade aufgebaut, bitte gleich noch einmal versuchen.", 503,
+                         INDEX_BUILDING_RETRY_AFTER)
+
+    # Gespeicherte Antworten gelten nur für diesen Mandanten, diese Index-Version und diesen Prompt
+    cache_context = context_key(snapshot.version if snapshot is not None else None, base_prompt, greeting_message,
+                                tenant)
+    annotate(tenant=tenant, index_version=snapshot.version if snapshot is not None else None)
+    with stage("answer_cache"):
+        cached_answer = answer_cache.lookup_exact(user_input, cache_context)
+    if cached_answer is not None:
+        return ChatTurn(user_input, cached_answer=cached_answer)
+
+    # Wird dieselbe Frage zum selben Wissensstand gerade beantwortet, liest diese Anfrage deren Antwort mit:
+    # kein eigenes Embedding, kein eigener GPT-4-Aufruf und kein Platz in der Admission Control
+    flight_key = (cache_context, normalize_question(user_input))
+    flight = chat_flights.join(flight_key) if COALESCE_REQUESTS else None
+    if flight is not None:
+        annotate(coalesced=True)
+        return ChatTurn(user_input, flight=flight, coalesced=True)
+    with stage("admission"):
+        upstream_gate.acquire()
+    admitted = time.monotonic()
+    if COALESCE_REQUESTS:
+        flight, leader = chat_flights.lead(flight_key)
+        if not leader:
+            upstream_gate.release()
+            annotate(coalesced=True)
+            return ChatTurn(user_input, flight=flight, coalesced=True)
+    else:
+        flight = Flight()
+
+    try:
+        # Falls kein FAISS-Index vorhanden ist
+        relevant_context = ""
+        query_embedding = None
+        if snapshot is not None:
+            chunk_ids, query_embedding, cached_answer = find_relevant_chunks(
+                snapshot, user_input,
+                similar_answer=lambda embedding: lookup_similar_answer(embedding, cache_context))
+            relevant_chunks = [context_chunk(snapshot.chunks, chunk_id) for chunk_id in chunk_ids]
+            relevant_context = "\n\n".join(chunk for chunk in relevant_chunks if chunk is not None)
+    except Exception as e:
+        upstream_gate.release()
+        chat_flights.land(flight_key, flight, e)
+        raise
+    if cached_answer is not None:
+        # Ähnliche Frage schon beantwortet: auch die mitlesenden Anfragen erhalten diese Antwort
+        upstream_gate.release()
+        flight.publish(cached_answer)
+        chat_flights.land(flight_key, flight)
+        return ChatTurn(user_input, cached_answer=cached_answer)
+
     messages = [
         {"role": "system", "content": base_prompt},
         {"role": "system", "content": f"Relevante Informationen:\n{relevant_context}"},
         {"role": "assistant", "content": greeting_message},
         {"role": "user", "content": user_input}
     ]
+    # Der Pool der Admission Control hat so viele Plätze wie sie zulässt; generate_answer belegt den Platz
+    # dieser Anfrage, bis die Antwort vollständig ist
+    try:
+        upstream_gate.submit(admitted, generate_answer, flight_key, flight, messages, user_input, query_embedding,
+                             cache_context)
+    except Exception as e:
+        chat_flights.land(flight_key, flight, e)
+        raise
+    return ChatTurn(user_input, flight=flight)
 
+def generate_answer(flight_key, flight, messages, question, embedding, cache_context):
+    """
+    Erzeugt die Antwort des Chat-Modells im Pool der Admission Control und veröffentlicht sie Token für Token
+    im Flight, aus dem alle Anfragen mit dieser Frage lesen. Bricht ein Client ab, läuft die Antwort für die
+    übrigen weiter und landet im Antwort-Cache. Den Platz gibt danach upstream_gate.submit frei.
+    """
+    error = None
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=messages
-        )
-        return jsonify({"response": response.choices[0].message.content})
+        tokens = []
+        for token in get_chat_backend().stream(messages):
+            tokens.append(token)
+            flight.publish(token)
+        answer = "".join(tokens)
+        if answer:
+            answer_cache.store(question, embedding, cache_context, answer, estimate_answer_cost(messages, answer))
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        error = e
+    finally:
+        chat_flights.land(flight_key, flight, error)
+
+def lookup_similar_answer(embedding, cache_context):
+    with stage("answer_cache"):
+        return answer_cache.lookup_similar(embedding, cache_context)
+
+def find_relevant_chunks(snapshot, user_input, limit=CONTEXT_CHUNKS, mode=None, similar_answer=None):
+    """
+    Retrieval für eine Nutzerfrage: die Treffer der Vektorsuche, bei hybrider Suche mit den Treffern der
+    Stichwortsuche (BM25) per Reciprocal-Rank-Fusion zusammengeführt. Im Modus "auto" werden Fragen aus
+    exakten Angaben nur per Stichwortsuche beantwortet. similar_answer(embedding) kann nach dem Embedding
+    eine gespeicherte Antwort liefern; dann entfällt die Suche.
+    Gibt (Chunk-IDs, normiertes Frage-Embedding oder None, gespeicherte Antwort oder None) zurück.
+    """
+    mode = mode or RETRIEVAL_MODE
+    keyword_ids = []
+    if mode != "vector" and snapshot.keywords is not None:
+        with stage("keyword_search"):
+            keyword_ids = [chunk_id for chunk_id, _ in
+                           snapshot.keywords.search(user_input, max(limit, RETRIEVAL_CANDIDATES))]
+    if mode == "auto" and keyword_ids and is_lexical_query(user_input):
+        # Exakte Angaben (Artikelnummer, Adresse, Telefonnummer): Stichwortsuche genügt, kein Embedding nötig.
+        # Auch der semantische Antwort-Cache wird übergangen, da "Artikel 4711" und "Artikel 4712" sich ähneln.
+        annotate(retrieval="keyword")
+        return keyword_ids[:limit], None, None
+
+    annotate(retrieval="hybrid" if keyword_ids else "vector")
+    with stage("embedding"):
+        query_embedding = get_embedding(user_input)
+    if query_embedding is None:
+        raise ChatError("Fehler beim Abrufen des Embeddings.")
+    # Normierte Vektoren: das Skalarprodukt im Index entspricht der Kosinus-Ähnlichkeit
+    query_embedding = normalize_vectors(query_embedding)
+    if similar_answer is not None:
+        cached_answer = similar_answer(query_embedding)
+        if cached_answer is not None:
+            return [], query_embedding, cached_answer
+
+    candidates = max(limit, RETRIEVAL_CANDIDATES) if keyword_ids else limit
+    with stage("vector_search"):
+        distances, indices = snapshot.search(query_embedding, candidates, RESCORE_CANDIDATES)
+    # FAISS liefert die stabilen Chunk-IDs (-1 für fehlende Treffer)
+    vector_ids = [int(chunk_id) for chunk_id in indices[0] if chunk_id >= 0]
+    if not keyword_ids:
+        return vector_ids[:limit], query_embedding, None
+    return reciprocal_rank_fusion([vector_ids, keyword_ids], limit=limit), query_embedding, None
+
+def context_chunk(chunks, chunk_id):
+    """
+    Text eines Chunks für den Prompt. Beginnt der Chunk mitten in einem Abschnitt, wird dessen
+    Überschrift (bei Webseiten die Zeile "URL: ...") vorangestellt, damit das Modell die Herkunft kennt.
+    """
+    position = chunks.position(chunk_id)
+    if position is None:
+        return None
+    text = chunks[position]
+    heading = chunks.heading(position)
+    if heading and not text.startswith(heading):
+        return f"{heading}\n{text}"
+    return text
+
+def sse_event(data, event=None):
+    """
+    Formatiert ein Server-Sent Event; die Nutzdaten werden als JSON kodiert (Zeilenumbrüche bleiben erhalten).
+    """
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+def stream_chat_response(turn, trace):
+    """
+    Leitet die Antwort des Chat-Modells Token für Token als Server-Sent Events weiter.
+    Ereignisse: "data" mit {"token": ...}, zum Schluss "done" bzw. bei Fehlern "error".
+    Eine Antwort aus dem Antwort-Cache wird als ein einziges Token gesendet.
+    Die Zeitmessung der Anfrage (trace) wird erst nach dem letzten Token abgeschlossen.
+    """
+
+    def generate():
+        try:
+            if turn.cached_answer is not None:
+                yield sse_event({"token": turn.cached_answer})
+                yield sse_event({}, event="done")
+                trace.finish("cached")
+                return
+            start = time.perf_counter()
+            try:
+                first = True
+                for token in turn.tokens():
+                    if first:
+                        trace.record("first_token", time.perf_counter() - start)
+                        first = False
+                    yield sse_event({"token": token})
+                trace.record("completion", time.perf_counter() - start)
+                yield sse_event({}, event="done")
+                trace.finish(turn.outcome)
+            except Exception as e:
+                trace.finish("error", getattr(e, "status", 500))
+                yield sse_event({"error": getattr(e, "message", str(e))}, event="error")
+        finally:
+            # Verbindung vom Client vorzeitig geschlossen
+            trace.finish("aborted")
+
+    # X-Accel-Buffering verhindert, dass ein vorgeschalteter Proxy (nginx) die Events puffert
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def begin_chat_turn(trace):
+    """
+    Gemeinsamer Beginn von /chat und /chat/stream: Eingabe und Mandant ("tenant" im JSON oder als Parameter,
+    ohne Angabe der Standard-Mandant) prüfen und die Anfrage vorbereiten.
+    Gibt (ChatTurn, None) oder (None, Fehlerantwort) zurück.
+    """
+    user_input = request.json.get("message")
+    if not user_input:
+        trace.finish("invalid", 400)
+        return None, (jsonify({"error": "Keine Eingabe erhalten"}), 400)
+    tenant = request_tenant(request.json.get("tenant") or request.args.get("tenant"))
+    if tenant is None:
+        trace.finish("invalid", 404)
+        return None, (jsonify({"error": "Unbekannter Mandant"}), 404)
+    annotate(question_chars=len(user_input))
+    try:
+        return prepare_chat_turn(user_input, tenant), None
+    except ChatError as e:
+        trace.finish("error", e.status)
+        return None, (jsonify({"error": e.message}), e.status)
+    except Overloaded as e:
+        # Überlast: sofort abweisen, statt die Anfrage bis zum Worker-Timeout hängen zu lassen
+        trace.finish("rejected", e.status)
+        return None, (jsonify({"error": e.message}), e.status, {"Retry-After": str(e.retry_after)})
+
+# --------------------------
+# Chatbot-Endpoint mit Retrieval-Augmented Generation (FAISS)
+# --------------------------
+@app.route("/chat", methods=["POST"])
+def chatbot():
+    with RequestTrace("chat") as trace:
+        turn, error = begin_chat_turn(trace)
+        if error is not None:
+            return error
+
+        # Mit "stream": true wird die Antwort als Server-Sent Events geliefert (wie /chat/stream)
+        if request.json.get("stream"):
+            annotate(stream=True)
+            return stream_chat_response(turn, trace)
+
+        if turn.cached_answer is not None:
+            trace.finish("cached")
+            return jsonify({"response": turn.cached_answer})
+
+        try:
+            with trace.stage("completion"):
+                answer = turn.answer()
+            trace.finish(turn.outcome)
+            return jsonify({"response": answer})
+        except ChatError as e:
+            # Fehler bei der Vorbereitung der Anfrage, deren Antwort diese mitliest
+            trace.finish("error", e.status)
+            return jsonify({"error": e.message}), e.status
+        except Exception as e:
+            trace.finish("error", 500)
+            return jsonify({"error": str(e)}), 500
+
+@app.route("/chat/stream", methods=["POST"])
+def chatbot_stream():
+    with RequestTrace("chat_stream") as trace:
+        turn, error = begin_chat_turn(trace)
+        if error is not None:
+            return error
+        annotate(stream=True)
+        return stream_chat_response(turn, trace)
+
+if __name__ == "__main__":
+    create_app().run(host="0.0.0.0", port=6000, debug=True)
@@ -0,0 +1,223 @@
+"""
+Benchmark für Single-Flight und Admission Control von /chat.
+
+Startet gunicorn (gevent) lokal mit den Fake-Backends (SHOPBOT_EMBEDDINGS=fake, SHOPBOT_COMPLETIONS=fake),
+deren Latenzen eine langsame OpenAI-API simulieren. Jeder Lauf beginnt mit einem leeren instance-Ordner
+(SHOPBOT_INSTANCE_PATH), also ohne gespeicherte Antworten.
+
+1. Ansturm: --burst Clients stellen gleichzeitig dieselbe (noch nicht beantwortete) Frage, --rounds Mal mit
+   jeweils neuer Frage. Verglichen wird mit und ohne Zusammenfassen (SHOPBOT_COALESCE): Chat-Modell-Aufrufe
+   (Anfragen mit Ergebnis generated laut /metrics), Latenz p50/p99.
+2. Überlast: --concurrency Clients stellen für --duration Sekunden lauter verschiedene Fragen, mehr als die
+   API gleichzeitig verkraftet. Verglichen wird ohne Begrenzung (SHOPBOT_UPSTREAM_CONCURRENCY=0) mit der
+   Admission Control (--limit, --queue, --queue-seconds): erfolgreiche Antworten pro Sekunde (Goodput),
+   p50/p99 der erfolgreichen, abgewiesene (429/503) und fehlgeschlagene Anfragen (Client-Timeout, 5xx).
+   Die simulierte API schafft je Worker --capacity gleichzeitige Aufrufe, darüber wird sie anteilig
+   langsamer; ohne Begrenzung überschreiten die Antwortzeiten so das Client-Timeout (--timeout).
+
+Aufruf:
+    python benchmarks/bench_admission.py --burst 50 --concurrency 200 --limit 8 --duration 20
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def post_chat(url, question, timeout):
+    """
+    Gibt den HTTP-Status zurück (auch 429/503, ohne Ausnahme).
+    """
+    request = urllib.request.Request(url, data=json.dumps({"message": question}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def generated_answers(base_url):
+    """
+    Summe der vom Chat-Modell erzeugten Antworten laut /metrics (alle Worker).
+    """
+    with urllib.request.urlopen(base_url + "/metrics", timeout=10) as response:
+        text = response.read().decode("utf-8")
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+               if line.startswith("shopbot_chat_requests_total{") and 'outcome="generated"' in line)
+
+
+class Server:
+    def __init__(self, env, workers):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        command = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "gevent", "--worker-connections",
+                   "1000", "-b", f"127.0.0.1:{self.port}", "--timeout", "120", "--log-level", "warning",
+                   "app:create_app()"]
+        env = dict(env, SHOPBOT_INSTANCE_PATH=tempfile.mkdtemp(prefix="bench_admission_"))
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+
+    def __enter__(self):
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            try:
+                # Die erste Anfrage baut bei Bedarf den Index auf
+                if post_chat(self.base_url + "/chat", "Öffnungszeiten?", 60) == 200:
+                    return self
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.5)
+        raise RuntimeError("Server nicht erreichbar")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def run_clients(count, target):
+    threads = [threading.Thread(target=target, args=(number,), daemon=True) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def burst(server, clients, rounds, timeout):
+    latencies, failures = [], 0
+    lock = threading.Lock()
+    # Die Worker schreiben ihre Metriken verzögert (PUBLISH_INTERVAL); die Antwort beim Start zählt nicht mit
+    time.sleep(6)
+    before = generated_answers(server.base_url)
+    for round_number in range(rounds):
+        question = f"Habt ihr am Feiertag {round_number} geöffnet?"
+        barrier = threading.Barrier(clients)
+
+        def client(_):
+            nonlocal failures
+            barrier.wait()
+            start = time.perf_counter()
+            status = post_chat(server.base_url + "/chat", question, timeout)
+            with lock:
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    failures += 1
+
+        run_clients(clients, client)
+    time.sleep(6)
+    return generated_answers(server.base_url) - before, latencies, failures
+
+
+def overload(server, clients, duration, timeout):
+    latencies, rejected, failed = [], 0, 0
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client(number):
+        nonlocal rejected, failed
+        request_number = 0
+        while time.time() < stop_at:
+            request_number += 1
+            start = time.perf_counter()
+            try:
+                status = post_chat(server.base_url + "/chat", f"Frage {number}-{request_number} zu Artikel X",
+                                   timeout)
+            except (urllib.error.URLError, ConnectionError, OSError):
+                status = None
+            with lock:
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                elif status in (429, 503):
+                    rejected += 1
+                else:
+                    failed += 1
+            if status in (429, 503):
+                # Ein braver Client wartet kurz, statt sofort erneut zu fragen
+                time.sleep(0.5)
+
+    started = time.time()
+    run_clients(clients, client)
+    return latencies, rejected, failed, time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--burst", type=int, default=50, help="gleichzeitige Clients mit derselben Frage")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=200, help="gleichzeitige Clients bei Überlast")
+    parser.add_argument("--duration", type=float, default=20.0, help="Dauer des Überlasttests in Sekunden")
+    parser.add_argument("--limit", type=int, default=8, help="SHOPBOT_UPSTREAM_CONCURRENCY je Worker")
+    parser.add_argument("--queue", type=int, default=16, help="SHOPBOT_UPSTREAM_QUEUE je Worker")
+    parser.add_argument("--queue-seconds", type=float, default=2.0, help="SHOPBOT_UPSTREAM_QUEUE_SECONDS")
+    parser.add_argument("--completion-latency", type=float, default=1.0, help="Zeit bis zum ersten Token")
+    parser.add_argument("--capacity", type=int, default=8,
+                        help="gleichzeitige Aufrufe je Worker, die die simulierte API ohne Verzögerung schafft")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Client-Timeout pro Anfrage")
+    parser.add_argument("--skip", default="", help="burst und/oder overload überspringen")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "SHOPBOT_EMBEDDINGS": "fake",
+        "SHOPBOT_COMPLETIONS": "fake",
+        "SHOPBOT_WORKER_CLASS": "gevent",
+        "SHOPBOT_FAKE_EMBEDDING_SECONDS": "0.1",
+        "SHOPBOT_FAKE_FIRST_TOKEN_SECONDS": str(args.completion_latency),
+        "SHOPBOT_FAKE_TOKEN_SECONDS": "0.01",
+        "SHOPBOT_FAKE_CAPACITY": str(args.capacity),
+        # Verschiedene Fragen sollen nicht über den semantischen Antwort-Cache beantwortet werden
+        "SHOPBOT_ANSWER_CACHE_THRESHOLD": "2",
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-fake"),
+    })
+
+    if "burst" not in args.skip:
+        print(f"Ansturm: {args.burst} Clients x {args.rounds} Runden, {args.workers} Worker")
+        print(f"{'Modus':<16} {'GPT-4-Aufrufe':>14} {'p50 s':>7} {'p99 s':>7} {'Fehler':>7}")
+        for coalesce in (False, True):
+            with Server(dict(env, SHOPBOT_COALESCE="1" if coalesce else "0", SHOPBOT_UPSTREAM_CONCURRENCY="0"),
+                        args.workers) as server:
+                calls, latencies, failures = burst(server, args.burst, args.rounds, args.timeout)
+            print(f"{'zusammengefasst' if coalesce else 'einzeln':<16} {calls:>14.0f} "
+                  f"{percentile(latencies, 50):>7.2f} {percentile(latencies, 99):>7.2f} {failures:>7}")
+
+    if "overload" not in args.skip:
+        print(f"\nÜberlast: {args.concurrency} Clients, {args.duration:.0f} s, {args.workers} Worker")
+        print(f"{'Modus':<24} {'Antw./s':>8} {'p50 s':>7} {'p99 s':>7} {'abgewiesen':>11} {'Fehler':>7}")
+        setups = [("ohne Begrenzung", {"SHOPBOT_UPSTREAM_CONCURRENCY": "0"}),
+                  (f"Admission (limit {args.limit})", {"SHOPBOT_UPSTREAM_CONCURRENCY": str(args.limit),
+                                                       "SHOPBOT_UPSTREAM_QUEUE": str(args.queue),
+                                                       "SHOPBOT_UPSTREAM_QUEUE_SECONDS": str(args.queue_seconds)})]
+        for name, extra in setups:
+            with Server(dict(env, **extra), args.workers) as server:
+                latencies, rejected, failed, elapsed = overload(server, args.concurrency, args.duration,
+                                                                args.timeout)
+            print(f"{name:<24} {len(latencies) / elapsed:>8.1f} {percentile(latencies, 50):>7.2f} "
+                  f"{percentile(latencies, 99):>7.2f} {rejected:>11} {failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
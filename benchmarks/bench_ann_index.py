@@ -0,0 +1,147 @@
+"""
+Benchmark der Index-Typen aus ann_index.py auf synthetischen Embeddings.
+
+Für jede Korpusgröße wird ein geclusterter, normierter Vektorbestand erzeugt (ähnlich echten
+Text-Embeddings) und mit jedem Index-Typ und jeder Speicherform der Vektoren (float32, float16, int8;
+ivf_pq quantisiert selbst) aufgebaut. Gemessen werden:
+  - recall@k gegenüber exakter Suche (flat, float32), direkt aus dem Index und nach exakter Neubewertung
+    der besten --rescore Kandidaten (wie IndexSnapshot.search; nur bei verlustbehafteter Speicherung)
+  - Latenz einzelner Anfragen (p50/p99, mit Neubewertung)
+  - zusätzlicher Resident-Speicher (RSS) des Index und Größe der Index-Datei. Die exakten Vektoren für die
+    Neubewertung (vectors.npy, n x d x 4 Byte) liegen zusätzlich auf der Platte, werden aber nur gemappt:
+    je Anfrage werden --rescore Zeilen gelesen.
+  - Aufbau-/Trainingszeit und die automatisch gewählten Suchparameter
+
+Aufruf:
+    python benchmarks/bench_ann_index.py --sizes 10000,100000,1000000 --dim 1536
+    python benchmarks/bench_ann_index.py --sizes 20000 --types flat,hnsw --storages float32,int8 --rescore 50
+
+Achtung: 1M Vektoren mit 1536 Dimensionen belegen als float32 rund 6 GB pro Kopie.
+Auf kleineren Maschinen z. B. --dim 256 oder --sizes 10000,100000 verwenden.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import (INDEX_TYPES, VECTOR_STORAGES, create_index, is_lossy, normalize_vectors,  # noqa: E402
+                       recall_at_k, rescore, tune_search_params)
+
+
+def rss_mb():
+    """
+    Aktueller Resident-Speicher des Prozesses in MB (Linux: /proc/self/statm).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_corpus(size, dim, queries, clusters=256, seed=0):
+    """
+    Erzeugt normierte Vektoren um zufällige Clusterzentren (plus Anfragen aus derselben Verteilung).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    data = np.empty((size + queries, dim), dtype="float32")
+    step = 50000
+    for start in range(0, size + queries, step):
+        end = min(start + step, size + queries)
+        labels = rng.integers(0, clusters, end - start)
+        data[start:end] = centers[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype("float32")
+    faiss.normalize_L2(data)
+    return data[:size], data[size:]
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def run(index_type, storage, vectors, queries, ids, k, ground_truth, rescore_candidates):
+    before = rss_mb()
+    start = time.perf_counter()
+    index, actual_type = create_index(index_type, vectors, storage)
+    index.add_with_ids(vectors, ids)
+    params = tune_search_params(index, vectors, ids, k=k)
+    build_seconds = time.perf_counter() - start
+    memory = rss_mb() - before
+    file_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+
+    _, found = index.search(queries, k)
+    recall = recall_at_k(found, ground_truth)
+    # Neubewertung anhand der exakten Vektoren; IDs entsprechen hier den Zeilen von vectors
+    rescoring = is_lossy(actual_type, storage) and rescore_candidates > 0
+    latencies = []
+    for i in range(len(queries)):
+        t = time.perf_counter()
+        if rescoring:
+            _, candidates = index.search(queries[i:i + 1], max(k, rescore_candidates))
+            _, top = rescore(queries[i], candidates[0], candidates[0], vectors, k)
+            found[i, :top.shape[1]] = top[0]
+        else:
+            index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - t)
+    rescored_recall = recall_at_k(found, ground_truth) if rescoring else None
+    del index
+    return {
+        "type": actual_type,
+        "storage": storage if actual_type != "ivf_pq" else "pq",
+        "recall": recall,
+        "rescored": rescored_recall,
+        "p50": percentile_ms(latencies, 50),
+        "p99": percentile_ms(latencies, 99),
+        "rss_mb": memory,
+        "file_mb": file_mb,
+        "build_s": build_seconds,
+        "params": params,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Korpusgrößen, kommagetrennt")
+    parser.add_argument("--dim", type=int, default=1536, help="Dimension (ada-002: 1536)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--storages", default=",".join(VECTOR_STORAGES))
+    parser.add_argument("--rescore", type=int, default=50,
+                        help="Kandidaten für die exakte Neubewertung (0: ohne Neubewertung)")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="FAISS-Threads pro Anfrage (1 entspricht einem Gunicorn-Worker)")
+    args = parser.parse_args()
+    faiss.omp_set_num_threads(args.threads)
+
+    print(f"{'Größe':>9} {'Typ':<9} {'Vektoren':<8} {'recall@' + str(args.k):>9} {'neu bew.':>8} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'RSS MB':>8} {'Datei MB':>9} {'Aufbau s':>9}  Parameter")
+    for size in (int(s) for s in args.sizes.split(",")):
+        vectors, queries = synthetic_corpus(size, args.dim, args.queries)
+        queries = normalize_vectors(queries)
+        ids = np.arange(size, dtype="int64")
+        exact = faiss.IndexFlatIP(args.dim)
+        exact.add(vectors)
+        _, ground_truth = exact.search(queries, args.k)
+        del exact
+        for index_type in args.types.split(","):
+            # ivf_pq quantisiert die Vektoren selbst; die Speicherform spielt dort keine Rolle
+            storages = args.storages.split(",") if index_type != "ivf_pq" else ["float32"]
+            for storage in storages:
+                result = run(index_type, storage, vectors, queries, ids, args.k, ground_truth, args.rescore)
+                rescored = f"{result['rescored']:.3f}" if result["rescored"] is not None else "-"
+                print(f"{size:>9} {result['type']:<9} {result['storage']:<8} {result['recall']:>9.3f} "
+                      f"{rescored:>8} {result['p50']:>8.2f} {result['p99']:>8.2f} {result['rss_mb']:>8.0f} "
+                      f"{result['file_mb']:>9.0f} {result['build_s']:>9.1f}  {result['params']}")
+        del vectors, queries
+
+
+if __name__ == "__main__":
+    main()
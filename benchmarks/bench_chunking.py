@@ -0,0 +1,131 @@
+"""
+Benchmark des Chunkings beim Indexaufbau.
+
+Vergleicht das bisherige chunk_text (ganzer Wissensbestand als ein String, Aufteilung nach Zeichen
+mit wiederholtem String-+=) mit chunking.iter_chunks (dokumentweise, Satz- und Überschriftsgrenzen,
+Token-Limit mit Überlappung). Ausgegeben werden Laufzeit, Heap-Spitze (tracemalloc), Anzahl und Größe
+der Chunks, leere Chunks und Chunks, die über eine "URL:"/"Datei:"-Dokumentgrenze reichen.
+
+Korpus: mit --knowledge eine vorhandene knowledge.txt, sonst ein künstlicher Shop-Wissensbestand.
+
+Aufruf:
+    python benchmarks/bench_chunking.py --documents 2000
+    python benchmarks/bench_chunking.py --knowledge knowledge.txt
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import (  # noqa: E402
+    DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, get_token_counter, iter_chunks,
+)
+
+SECTION_PREFIXES = ("URL: ", "Datei: ")
+
+
+def legacy_chunk_text(text, max_length=500):
+    """
+    Bisheriges chunk_text aus app.py (unverändert übernommen).
+    """
+    chunks = []
+    current_chunk = ""
+    for line in text.splitlines():
+        if len(current_chunk) + len(line) + 1 > max_length:
+            chunks.append(current_chunk.strip())
+            current_chunk = line
+        else:
+            current_chunk += " " + line
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def split_sections(text):
+    documents, source, lines = [], "knowledge.txt", []
+    for line in text.splitlines():
+        if line.startswith(SECTION_PREFIXES):
+            if lines:
+                documents.append((source, "\n".join(lines)))
+            source, lines = line, []
+        lines.append(line)
+    if lines:
+        documents.append((source, "\n".join(lines)))
+    return documents
+
+
+def synthetic_knowledge(documents, seed=42):
+    rng = random.Random(seed)
+    words = ("Lieferung Versandkosten Rücksendung Garantie Artikel Größe Farbe Bestellung Zahlung "
+             "Gutschein Kundenkonto Lieferzeit Ersatzteil Bedienungsanleitung Sicherheitshinweis").split()
+    sections = []
+    for number in range(documents):
+        lines = [f"URL: https://shop.example/seite-{number}"]
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.5:
+                lines.append(f"## {rng.choice(words)} {number}")
+            sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(5, 25))) + "."
+                         for _ in range(rng.randint(2, 20))]
+            # Gecrawlte Seiten sind oft eine einzige sehr lange Zeile
+            lines.append(" ".join(sentences))
+        sections.append("\n".join(lines))
+    return "\n".join(sections) + "\n"
+
+
+def crosses_boundary(chunk_text):
+    """
+    Ob ein Chunk Text aus zwei Dokumenten enthält (eine Abschnittskennung nicht am Anfang).
+    """
+    return any(f" {prefix}" in chunk_text or f"\n{prefix}" in chunk_text for prefix in SECTION_PREFIXES)
+
+
+def measure(label, run):
+    start = time.perf_counter()
+    chunks = run()
+    elapsed = time.perf_counter() - start
+    # Speicher in einem zweiten Lauf, da tracemalloc die Laufzeit stark verfälscht
+    del chunks
+    tracemalloc.start()
+    chunks = run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    counter = get_token_counter()
+    sizes = sorted(counter.count(chunk) for chunk in chunks if chunk)
+    empty = sum(1 for chunk in chunks if not chunk.strip())
+    crossing = sum(1 for chunk in chunks if crosses_boundary(chunk))
+    print(f"{label:<30} {elapsed:>7.2f}s {peak / 1024 / 1024:>9.1f} MB {len(chunks):>8} "
+          f"{sizes[len(sizes) // 2] if sizes else 0:>7} {sizes[-1] if sizes else 0:>7} {empty:>6} {crossing:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--knowledge", help="Pfad zu einer knowledge.txt")
+    parser.add_argument("--documents", type=int, default=2000, help="Dokumente im künstlichen Korpus")
+    args = parser.parse_args()
+
+    if args.knowledge:
+        with open(args.knowledge, "r", encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = synthetic_knowledge(args.documents)
+    documents = split_sections(text)
+    del text
+    counter = "tiktoken" if get_token_counter().exact else "Schätzung"
+    print(f"Korpus: {len(documents)} Dokumente, "
+          f"{sum(len(body) for _, body in documents) / 1024 / 1024:.1f} MB Text, Tokens per {counter}")
+    print(f"{'Verfahren':<30} {'Zeit':>8} {'Heap-Spitze':>12} {'Chunks':>8} "
+          f"{'Median':>7} {'Max':>7} {'leer':>6} {'Grenze':>8}   (Größen in Tokens)")
+
+    # Bisher: alles zu einem String zusammenfügen und nach Zeichen teilen
+    measure("chunk_text (bisher, 500 Zeichen)",
+            lambda: legacy_chunk_text("\n".join(body for _, body in documents), max_length=500))
+    measure(f"iter_chunks ({DEFAULT_CHUNK_TOKENS}/{DEFAULT_OVERLAP_TOKENS} Tokens)",
+            lambda: [chunk.text for chunk in iter_chunks(iter(documents))])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark der Persistenz gecrawlter Seiten und der Admin-Liste "Gecrawlte Daten".
+
+1. Crawl gegen einen lokalen Test-HTTP-Server (siehe bench_crawler.py) ohne Ratenlimit, einmal mit
+   einer Transaktion pro Seite (SHOPBOT_CRAWL_BATCH_SIZE=1, Verhalten wie bisher) und einmal blockweise.
+   Parallel schreibt ein zweiter Prozess (wie ein Web-Worker) alle 10 ms eine Zeile in dieselbe
+   shopbot.db; ausgegeben werden Crawl-Dauer, Transaktionen des Crawls in shopbot.db und die Dauer der
+   Schreibvorgänge des zweiten Prozesses (p50/p99/max).
+2. Admin-Liste mit --stored gespeicherten Seiten: bisheriges Vorgehen (alle CrawledPage-Zeilen laden,
+   für jede den vollständigen Text aus der Wissensbasis lesen) gegen die Keyset-paginierte Route.
+
+Alle Daten liegen in einem temporären Verzeichnis (SHOPBOT_INSTANCE_PATH, SHOPBOT_DATABASE_URI).
+
+Aufruf:
+    python benchmarks/bench_crawl_store.py --pages 1000 --stored 100000
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+import datetime
+import multiprocessing
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TMP = tempfile.mkdtemp(prefix="bench_crawl_store_")
+DATABASE = os.path.join(TMP, "shopbot.db")
+os.environ["SHOPBOT_DATABASE_URI"] = "sqlite:///" + DATABASE
+os.environ["SHOPBOT_INSTANCE_PATH"] = TMP
+os.environ.setdefault("SHOPBOT_CRAWL_HOST_RPS", "100000")
+os.environ.setdefault("SHOPBOT_CRAWL_HOST_CONCURRENCY", "16")
+os.environ.setdefault("SHOPBOT_EMBEDDINGS", "fake")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import app as shopbot  # noqa: E402
+import crawl  # noqa: E402
+from models import CrawledPage, CrawlFrontier, db  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.dialects.sqlite import insert  # noqa: E402
+from knowledge_store import KnowledgeStore  # noqa: E402
+from bench_crawler import make_handler  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def write_continuously(path, interval, stop, results):
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("CREATE TABLE IF NOT EXISTS bench_writes (id INTEGER PRIMARY KEY, created REAL)")
+    conn.commit()
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.execute("INSERT INTO bench_writes (created) VALUES (?)", (time.time(),))
+        conn.commit()
+        latencies.append(time.perf_counter() - start)
+        time.sleep(interval)
+    conn.close()
+    results.put(latencies)
+
+
+class ConcurrentWriter:
+    """
+    Schreibt in einem eigenen Prozess wie ein Web-Worker kleine Transaktionen in dieselbe Datenbank
+    und misst deren Dauer (einschließlich Warten auf die Schreibsperre).
+    """
+
+    def __init__(self, path, interval=0.01):
+        self.latencies = []
+        self._stop = multiprocessing.Event()
+        self._results = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=write_continuously,
+                                                args=(path, interval, self._stop, self._results))
+
+    def __enter__(self):
+        self._process.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self.latencies = self._results.get()
+        self._process.join()
+
+
+def reset_crawl_tables():
+    with shopbot.app.app_context():
+        db.session.query(CrawledPage).delete()
+        db.session.query(CrawlFrontier).delete()
+        db.session.commit()
+
+
+def bench_crawl(base_url, batch_size):
+    reset_crawl_tables()
+    crawl.CRAWL_BATCH_SIZE = batch_size
+    store = KnowledgeStore(os.path.join(TMP, f"knowledge_{batch_size}.db"))
+    with shopbot.app.app_context():
+        engine = db.engine
+    commits = [0]
+
+    def count_commit(connection):
+        commits[0] += 1
+
+    event.listen(engine, "commit", count_commit)
+    try:
+        with ConcurrentWriter(DATABASE) as writer:
+            start = time.perf_counter()
+            report = crawl.crawl_website(base_url + "/", store=store)
+            elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, "commit", count_commit)
+    pages = len(report.changed) + report.unchanged
+    print(f"{'Transaktion pro Seite' if batch_size == 1 else f'Blöcke zu {batch_size} Seiten':<26} "
+          f"{pages:>6} Seiten {elapsed:>7.2f}s {pages / elapsed:>6.0f} Seiten/s {commits[0]:>6} Commits   "
+          f"Web-Schreiber p50 {percentile(writer.latencies, 0.5) * 1000:>6.1f} ms, "
+          f"p99 {percentile(writer.latencies, 0.99) * 1000:>6.1f} ms, max {max(writer.latencies) * 1000:>6.1f} ms")
+
+
+def fill_pages(count, store):
+    reset_crawl_tables()
+    now = datetime.datetime.utcnow()
+    text = "Lieferung Versandkosten Rücksendung Garantie Artikel Größe Farbe. " * 30
+    with shopbot.app.app_context():
+        for start in range(0, count, 5000):
+            rows = [{"url": f"https://shop.example/seite-{number}", "content": "", "timestamp": now,
+                     "content_hash": f"{number:064d}", "links": "[]"}
+                    for number in range(start, min(count, start + 5000))]
+            db.session.execute(insert(CrawledPage), rows)
+            db.session.commit()
+            store.put_many(crawl.page_document(row["url"], text) for row in rows)
+
+
+def bench_admin(stored):
+    store = KnowledgeStore(os.path.join(TMP, "knowledge_admin.db"))
+    fill_pages(stored, store)
+    shopbot.knowledge_store = store
+    print(f"Admin-Liste mit {stored} gespeicherten Seiten:")
+
+    with shopbot.app.app_context():
+        start = time.perf_counter()
+        pages = CrawledPage.query.order_by(CrawledPage.id.desc()).all()
+        previews = {page.id: (store.get("url:" + page.url) or "")[:500] for page in pages}
+        elapsed = time.perf_counter() - start
+    print(f"  {'bisher (alle Zeilen + Texte)':<34} {elapsed * 1000:>9.1f} ms  ({len(previews)} Einträge)")
+    del pages, previews
+
+    client = shopbot.app.test_client()
+    for label, path in (("Keyset, erste Seite", "/admin/crawled-data"),
+                        ("Keyset, Seite in der Mitte", f"/admin/crawled-data?before={stored // 2}"),
+                        ("Keyset, letzte Seite", "/admin/crawled-data?before=60")):
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+        print(f"  {label:<34} {min(timings) * 1000:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000, help="Seiten des Test-Shops für den Crawl")
+    parser.add_argument("--links", type=int, default=10, help="Links pro Seite")
+    parser.add_argument("--batch-size", type=int, default=crawl.CRAWL_BATCH_SIZE)
+    parser.add_argument("--stored", type=int, default=100000, help="gespeicherte Seiten für die Admin-Liste")
+    args = parser.parse_args()
+    shopbot.create_app()
+
+    counter = {"requests": 0, "bytes": 0, "lock": threading.Lock()}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.pages, 0.0, args.links, counter))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Daten in {TMP}")
+    try:
+        for batch_size in (1, args.batch_size):
+            bench_crawl(base_url, batch_size)
+    finally:
+        server.shutdown()
+    bench_admin(args.stored)
+
+
+if __name__ == "__main__":
+    main()
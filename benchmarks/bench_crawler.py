@@ -0,0 +1,162 @@
+"""
+Benchmark des Crawlers gegen einen lokalen Test-HTTP-Server (kein Internet nötig).
+
+Der Server liefert einen künstlichen Shop mit --pages Seiten, die jeweils auf einige andere Seiten
+verlinken, und wartet pro Anfrage --latency Sekunden (simulierte Server-Antwortzeit).
+Verglichen werden:
+  - der bisherige serielle Ablauf (zwei Downloads pro Seite ohne gemeinsame Session, Pause nach jeder
+    Seite); wegen der Pausen nur für --legacy-pages Seiten gemessen und hochgerechnet,
+  - der neue Crawler mit den Standard-Höflichkeitsgrenzen pro Host,
+  - der neue Crawler ohne Ratenlimit (reiner Durchsatz der Engine),
+  - ein Recrawl ohne Änderungen mit bedingten Anfragen (ETag/If-None-Match, Antwort 304).
+
+Aufruf:
+    python benchmarks/bench_crawler.py --pages 500 --latency 0.05
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawl_engine import (  # noqa: E402
+    DEFAULT_HOST_CONCURRENCY, DEFAULT_HOST_RPS, USER_AGENT, Crawler, HostThrottle, KnownPage,
+)
+
+
+def make_handler(pages, latency, links_per_page, counter):
+    rng = random.Random(42)
+    link_map = {i: rng.sample(range(pages), min(links_per_page, pages)) for i in range(pages)}
+
+    class ShopHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            with counter["lock"]:
+                counter["requests"] += 1
+            time.sleep(latency)
+            path = self.path.strip("/")
+            if path and not path.startswith("produkt-"):
+                # robots.txt, sitemap.xml usw. gibt es im Test-Shop nicht
+                self.send_error(404)
+                return
+            number = int(path.split("-")[-1]) if path else 0
+            if number >= pages:
+                self.send_error(404)
+                return
+            links = "".join(f'<li><a href="/produkt-{i}">Produkt {i}</a></li>' for i in link_map[number])
+            body = (
+                "<html><head><title>Shop</title><style>body{color:#333}</style></head><body>"
+                f"<header><nav><ul>{links}</ul></nav></header>"
+                f"<main><h1>Produkt {number}</h1><p>{'Beschreibung des Produkts. ' * 40}</p></main>"
+                "<footer>Impressum</footer><script>var x = 1;</script></body></html>"
+            ).encode("utf-8")
+            etag = f'"produkt-{number}-v1"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            with counter["lock"]:
+                counter["bytes"] += len(body)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ShopHandler
+
+
+def legacy_crawl(start_url, max_pages, sleep):
+    """
+    Nachbildung des bisherigen crawl_website: zwei requests.get pro Seite und eine feste Pause.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    base_domain = urlparse(start_url).netloc
+    to_visit, visited = {start_url}, set()
+    while to_visit and len(visited) < max_pages:
+        url = to_visit.pop()
+        if url in visited:
+            continue
+        soup = BeautifulSoup(requests.get(url, headers=headers, timeout=10).text, "lxml")
+        for tag in soup(["script", "style", "header", "footer", "nav"]):
+            tag.decompose()
+        soup.get_text(separator=" ", strip=True)
+        visited.add(url)
+        soup = BeautifulSoup(requests.get(url, headers=headers, timeout=10).text, "lxml")
+        links = {urljoin(url, a["href"]) for a in soup.find_all("a", href=True)}
+        to_visit.update(link for link in links if urlparse(link).netloc == base_domain and link not in visited)
+        time.sleep(sleep)
+    return len(visited)
+
+
+def report(label, pages, counter, elapsed, total_pages=None):
+    line = (f"{label:<34} {pages:>6} Seiten  {counter['requests'] / max(pages, 1):>5.1f} Anfr./Seite  "
+            f"{counter['bytes'] / 1024:>8.0f} KB  {elapsed:8.2f}s  {pages / elapsed:8.1f} Seiten/s")
+    if total_pages:
+        line += f"  (hochgerechnet auf {total_pages} Seiten: {total_pages / (pages / elapsed) / 60:.1f} min)"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulierte Antwortzeit pro Anfrage")
+    parser.add_argument("--links", type=int, default=10, help="Links pro Seite")
+    parser.add_argument("--legacy-pages", type=int, default=20)
+    parser.add_argument("--legacy-sleep", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    counter = {"requests": 0, "bytes": 0, "lock": threading.Lock()}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.pages, args.latency, args.links, counter))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    start_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    try:
+        start = time.perf_counter()
+        crawled = legacy_crawl(start_url, args.legacy_pages, args.legacy_sleep)
+        report("seriell (bisher)", crawled, counter, time.perf_counter() - start, args.pages)
+
+        setups = [
+            (f"Crawler ({DEFAULT_HOST_CONCURRENCY} parallel, {DEFAULT_HOST_RPS:g} Anfr./s)",
+             HostThrottle(DEFAULT_HOST_CONCURRENCY, DEFAULT_HOST_RPS)),
+            (f"Crawler ({args.workers} parallel, ohne Limit)", HostThrottle(args.workers, 0)),
+        ]
+        known = {}
+        for label, throttle in setups:
+            counter["requests"] = counter["bytes"] = 0
+            start = time.perf_counter()
+            crawled = 0
+            for page in Crawler(max_workers=args.workers, throttle=throttle).crawl(start_url):
+                if page.text:
+                    crawled += 1
+                    known[page.url] = KnownPage(page.etag, page.last_modified, page.content_hash, page.links)
+            report(label, crawled, counter, time.perf_counter() - start)
+
+        counter["requests"] = counter["bytes"] = 0
+        start = time.perf_counter()
+        unchanged = sum(1 for page in Crawler(max_workers=args.workers, throttle=HostThrottle(args.workers, 0))
+                        .crawl(start_url, known=known) if page.not_modified)
+        report("Recrawl (304, ohne Limit)", unchanged, counter, time.perf_counter() - start)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
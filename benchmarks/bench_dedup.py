@@ -0,0 +1,111 @@
+"""
+Benchmark der Beinahe-Duplikat-Erkennung beim Indexaufbau.
+
+Baut den Index mit app.embed_documents_into für mehrere Schwellen von SHOPBOT_DEDUP_THRESHOLD
+(über 1 = ohne Erkennung) und gibt aus: eingebettete Chunks, zusammengefasste Duplikate, nicht
+eingebettete Zeichen und Tokens, Größe von index.faiss und die Aufbauzeit. Eingebettet wird lokal
+(SHOPBOT_EMBEDDINGS=fake) mit einem eigenen, leeren Embedding-Cache pro Lauf.
+
+Korpus: mit --knowledge eine vorhandene knowledge.txt, sonst ein künstlich gecrawlter Shop, in dem
+jede Produktseite dieselben Versand- und Rückgabeabschnitte enthält und ein Teil der Seiten als
+Varianten (andere URL, ein Wort geändert) mehrfach vorkommt.
+
+Aufruf:
+    python benchmarks/bench_dedup.py --pages 500
+    python benchmarks/bench_dedup.py --knowledge knowledge.txt --thresholds 2 0.9
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SHOPBOT_EMBEDDINGS", "fake")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import app as shopbot  # noqa: E402
+from chunking import get_token_counter  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+from index_store import INDEX_FILE, IndexBuilder  # noqa: E402
+from knowledge_store import split_sections  # noqa: E402
+
+WORDS = ("Lieferung Versandkosten Rücksendung Garantie Artikel Größe Farbe Bestellung Zahlung Gutschein "
+         "Kundenkonto Lieferzeit Ersatzteil Bedienungsanleitung Sicherheitshinweis Material Pflege").split()
+
+
+def sentences(rng, count):
+    return " ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))) + "." for _ in range(count))
+
+
+def synthetic_shop(pages, variant_share=0.3, seed=42):
+    rng = random.Random(seed)
+    shipping = sentences(rng, 12)
+    returns = sentences(rng, 10)
+    documents = []
+    for number in range(pages):
+        if documents and rng.random() < variant_share:
+            # Variante einer früheren Seite: andere URL, ein Wort der Beschreibung geändert
+            source, text = rng.choice(documents)
+            words = text.split(" ")
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            documents.append((f"{source}?variante={number}", " ".join(words)))
+            continue
+        text = "\n".join([
+            f"## Produkt {number}", sentences(rng, rng.randint(4, 30)),
+            "## Versand", shipping,
+            "## Rückgabe", returns,
+        ])
+        documents.append((f"url:https://shop.example/produkt-{number}", text))
+    return documents
+
+
+def run(documents, threshold):
+    shopbot.DEDUP_THRESHOLD = threshold
+    with tempfile.TemporaryDirectory() as tmp:
+        shopbot.embedding_cache = EmbeddingCache(os.path.join(tmp, "embedding_cache.db"))
+        builder = IndexBuilder(index_type="flat")
+        start = time.perf_counter()
+        added = shopbot.embed_documents_into(builder, documents)
+        elapsed = time.perf_counter() - start
+        version = builder.save(os.path.join(tmp, "index"))
+        index_bytes = os.path.getsize(os.path.join(tmp, "index", f"v{version:06d}", INDEX_FILE))
+    counter = get_token_counter()
+    return {
+        "embedded": added,
+        "embedded_tokens": sum(counter.count(text) for text in builder.texts),
+        "duplicates": sum(len(references) for references in builder.duplicates.values()),
+        "index_bytes": index_bytes,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--knowledge", help="Pfad zu einer knowledge.txt")
+    parser.add_argument("--pages", type=int, default=500, help="Seiten im künstlichen Korpus")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[2.0, 0.95, 0.9, 0.8],
+                        help="Zu vergleichende Schwellen (über 1 = ohne Erkennung)")
+    args = parser.parse_args()
+
+    if args.knowledge:
+        with open(args.knowledge, "r", encoding="utf-8") as f:
+            documents = list(split_sections(f))
+    else:
+        documents = synthetic_shop(args.pages)
+    print(f"Korpus: {len(documents)} Dokumente, {sum(len(text) for _, text in documents) / 1024 / 1024:.1f} MB Text")
+    print(f"{'Schwelle':>8} {'eingebettet':>12} {'Duplikate':>10} {'Tokens':>9} {'index.faiss':>12} {'Zeit':>7}")
+    baseline = None
+    for threshold in args.thresholds:
+        result = run(documents, threshold)
+        baseline = baseline or result
+        label = "aus" if threshold > 1 else f"{threshold:.2f}"
+        saved = 1 - result["embedded_tokens"] / baseline["embedded_tokens"] if baseline["embedded_tokens"] else 0.0
+        print(f"{label:>8} {result['embedded']:>12} {result['duplicates']:>10} {result['embedded_tokens']:>9} "
+              f"{result['index_bytes'] / 1024 / 1024:>9.2f} MB {result['seconds']:>6.2f}s"
+              f"   ({saved:.0%} weniger Tokens eingebettet)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark der Embedding-Pipeline mit dem lokalen FakeEmbeddingProvider (kein Netzwerk nötig).
+
+Vergleicht den bisherigen seriellen Ablauf (ein API-Aufruf pro Chunk) mit der gebündelten,
+parallelen Pipeline. Die Latenz pro API-Aufruf wird simuliert.
+
+Aufruf:
+    python benchmarks/bench_embeddings.py --latency 0.05 --batch-size 100 --workers 4
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import FakeEmbeddingProvider, embed_texts  # noqa: E402
+
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge.txt")
+
+
+def load_chunks(max_length=500):
+    with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+        text = " ".join(f.read().split())
+    return [text[i:i + max_length] for i in range(0, len(text), max_length)]
+
+
+def run(label, chunks, latency, batch_size, workers, rate_limit_every=0):
+    provider = FakeEmbeddingProvider(latency=latency, rate_limit_every=rate_limit_every)
+    start = time.perf_counter()
+    results = embed_texts(chunks, provider=provider, batch_size=batch_size, max_workers=workers,
+                          base_delay=0.01, max_delay=0.1)
+    elapsed = time.perf_counter() - start
+    missing = sum(1 for r in results if r is None)
+    print(f"{label:<28} {len(chunks):>6} Chunks  {provider.calls:>5} Aufrufe  "
+          f"{elapsed:8.2f}s  {len(chunks) / elapsed:10.1f} Chunks/s  fehlend: {missing}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulierte Latenz pro API-Aufruf in Sekunden")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate-limit-every", type=int, default=5,
+                        help="jeder n-te Aufruf liefert einen Rate-Limit-Fehler (0 = nie)")
+    args = parser.parse_args()
+
+    chunks = load_chunks()
+    serial = run("seriell (1 Chunk/Aufruf)", chunks, args.latency, 1, 1)
+    batched = run("gebündelt + parallel", chunks, args.latency, args.batch_size, args.workers)
+    run("gebündelt + Rate-Limits", chunks, args.latency, args.batch_size, args.workers, args.rate_limit_every)
+
+    # Reihenfolge muss identisch bleiben
+    assert all(a == b for a, b in zip(serial, batched)), "Reihenfolge der Embeddings weicht ab!"
+    print("Reihenfolge der Embeddings identisch.")
+
+
+if __name__ == "__main__":
+    main()
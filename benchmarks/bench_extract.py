@@ -0,0 +1,188 @@
+"""
+Micro-Benchmark der HTML-Extraktion (sichtbarer Text + Links) des Crawlers.
+
+Vergleicht die bisherige Extraktion mit BeautifulSoup (zwei Parses pro Seite: einer für den Text in
+get_text_from_page, einer für die Links in find_all_links) mit der lxml-Extraktion in einem Durchlauf
+(crawl_engine.extract_text_and_links) und prüft, dass Text und Links identisch sind.
+
+Korpus: mit --corpus ein Verzeichnis gespeicherter Shop-Seiten (*.html), z. B. angelegt mit
+    python benchmarks/bench_extract.py --save-corpus korpus/ --urls urls.txt
+Ohne --corpus wird ein künstlicher Shop-Korpus erzeugt.
+
+Ausgegeben werden Seiten/s sowie der Speicher pro Seite: die Spitze des Python-Heaps während der
+Extraktion (tracemalloc, Mittel über alle Seiten) und der RSS-Zuwachs pro geparster Seite in einem
+frischen Prozess, der alle Dokumentbäume gleichzeitig hält (enthält auch den C-Speicher von libxml2,
+den tracemalloc nicht sieht).
+
+Aufruf:
+    python benchmarks/bench_extract.py --pages 300
+    python benchmarks/bench_extract.py --corpus korpus/
+"""
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import resource
+import tracemalloc
+import subprocess
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree  # noqa: E402
+
+from crawl_engine import create_session, extract_text_and_links  # noqa: E402
+
+BASE_URL = "https://shop.example/"
+
+
+def extract_bs4(html, url):
+    """
+    Bisheriger Ablauf: ein Parse für den Text, ein zweiter für die Links.
+    """
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "header", "footer", "nav"]):
+        tag.decompose()
+    text = soup.get_text(separator=" ", strip=True)
+    soup = BeautifulSoup(html, "lxml")
+    links = [urljoin(url, link["href"]) for link in soup.find_all("a", href=True)]
+    return text, links
+
+
+def parse_lxml(html):
+    parser = etree.HTMLParser()
+    parser.feed(html)
+    return parser.close()
+
+
+METHODS = {
+    "BeautifulSoup (bisher, 2 Parses)": extract_bs4,
+    "lxml (1 Durchlauf)": extract_text_and_links,
+}
+# Nur der Parse-Schritt, für die Messung des Baum-Speichers
+PARSERS = {
+    "BeautifulSoup (bisher, 2 Parses)": lambda html: BeautifulSoup(html, "lxml"),
+    "lxml (1 Durchlauf)": parse_lxml,
+}
+
+
+def synthetic_page(rng, number):
+    products = "".join(
+        f'<div class="product"><a href="/produkt-{rng.randint(0, 5000)}?utm_source=nl">'
+        f'<img src="/img/{i}.jpg" alt="Bild {i}"></a><h3>Produkt {i} &amp; Zubehör</h3>'
+        f'<span class="price">{rng.randint(1, 999)},99&nbsp;€</span><!-- Kommentar {i} --></div>'
+        for i in range(rng.randint(20, 60))
+    )
+    menu = "".join(f'<li><a href="/kategorie-{i}">Kategorie {i}</a></li>' for i in range(80))
+    state = json.dumps({"items": [{"id": i, "name": f"Artikel {i}"} for i in range(200)]})
+    return (
+        "<!DOCTYPE html><html lang='de'><head><meta charset='utf-8'><title>Shop – Seite "
+        f"{number}</title><style>.product{{float:left}}</style><script>window.__STATE__={state}</script></head>"
+        f"<body><header><div class='logo'>Shop</div><nav><ul>{menu}</ul></nav></header>"
+        f"<main><h1>Kategorie {number}</h1><p>{'Beschreibung mit <b>Fett</b> und <i>kursiv</i>. ' * 30}</p>"
+        f"{products}<template><p>Vorlage</p></template><noscript>Bitte JavaScript aktivieren</noscript></main>"
+        "<footer><a href='/impressum'>Impressum</a> <a href='mailto:info@shop.example'>Kontakt</a></footer>"
+        "<script src='/app.js'></script></body></html>"
+    )
+
+
+def load_corpus(args):
+    if args.corpus:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.corpus, "*.htm*"))):
+            with open(path, "rb") as f:
+                pages.append(f.read().decode("utf-8", errors="replace"))
+        return pages
+    rng = random.Random(42)
+    return [synthetic_page(rng, i) for i in range(args.pages)]
+
+
+def save_corpus(directory, url_file):
+    """
+    Lädt die URLs aus url_file (eine pro Zeile) und speichert das HTML für spätere Läufe.
+    """
+    os.makedirs(directory, exist_ok=True)
+    session = create_session(1)
+    with open(url_file, "r", encoding="utf-8") as f:
+        urls = [line.strip() for line in f if line.strip()]
+    for number, url in enumerate(urls):
+        response = session.get(url, timeout=10)
+        if "text/html" in response.headers.get("Content-Type", ""):
+            with open(os.path.join(directory, f"seite-{number:05d}.html"), "w", encoding="utf-8") as f:
+                f.write(response.text)
+    print(f"{len(urls)} URLs geladen, Korpus in {directory}")
+
+
+def measure_rss(method, corpus_args):
+    """
+    RSS-Zuwachs (KB) pro Seite, wenn ein frischer Prozess die Bäume aller Seiten gleichzeitig hält.
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--rss-child", method, *corpus_args]
+    return float(subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip())
+
+
+def rss_child(method, pages):
+    parse = PARSERS[method]
+    parse(pages[0])
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    trees = [parse(html) for html in pages]
+    print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / len(trees))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Verzeichnis mit gespeicherten HTML-Seiten")
+    parser.add_argument("--pages", type=int, default=300, help="Seitenzahl des künstlichen Korpus")
+    parser.add_argument("--save-corpus", help="Korpus-Verzeichnis anlegen (mit --urls)")
+    parser.add_argument("--urls", help="Datei mit einer URL pro Zeile")
+    parser.add_argument("--rss-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.save_corpus:
+        save_corpus(args.save_corpus, args.urls)
+        return
+
+    pages = load_corpus(args)
+    if args.rss_child:
+        rss_child(args.rss_child, pages)
+        return
+    if not pages:
+        print("Keine Seiten im Korpus gefunden.")
+        return
+    corpus_args = ["--corpus", args.corpus] if args.corpus else ["--pages", str(args.pages)]
+
+    total_kb = sum(len(html.encode("utf-8")) for html in pages) / 1024
+    print(f"Korpus: {len(pages)} Seiten, {total_kb / len(pages):.0f} KB HTML pro Seite im Mittel")
+
+    results = {}
+    print(f"{'Verfahren':<34} {'Seiten/s':>9} {'ms/Seite':>9} {'Heap-Spitze KB':>15} {'Baum KB (RSS)':>15}")
+    for name, extract in METHODS.items():
+        start = time.perf_counter()
+        results[name] = [extract(html, BASE_URL) for html in pages]
+        elapsed = time.perf_counter() - start
+
+        peaks = []
+        for html in pages:
+            tracemalloc.start()
+            extract(html, BASE_URL)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        rss = measure_rss(name, corpus_args)
+        print(f"{name:<34} {len(pages) / elapsed:>9.1f} {elapsed / len(pages) * 1000:>9.2f} "
+              f"{sum(peaks) / len(peaks) / 1024:>15.0f} {rss:>15.0f}")
+
+    reference, candidate = results.values()
+    mismatches = [i for i, (a, b) in enumerate(zip(reference, candidate)) if a != b]
+    if mismatches:
+        print(f"ABWEICHUNG bei {len(mismatches)} Seiten, z. B. Seite {mismatches[0]}")
+        sys.exit(1)
+    print("Text und Links aller Seiten identisch.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Lasttest für /chat: vergleicht gunicorn mit Sync-Workern (bisheriges Setup) und gevent-Workern.
+
+Startet gunicorn lokal mit den Fake-Backends (SHOPBOT_EMBEDDINGS=fake, SHOPBOT_COMPLETIONS=fake),
+deren Latenzen die Wartezeit auf die OpenAI-API simulieren, und feuert für eine feste Dauer
+parallele Anfragen ab. Ausgegeben werden Anfragen/s, p50/p99-Latenz und Fehler. Jedes Setup beginnt mit
+einem leeren temporären instance-Ordner (SHOPBOT_INSTANCE_PATH); jede Anfrage stellt eine andere Frage
+und der semantische Antwort-Cache ist abgeschaltet, gemessen wird also der Chat-Pfad ohne Cache-Treffer.
+
+Aufruf:
+    python benchmarks/bench_load.py --concurrency 200 --duration 20 --completion-latency 1.5
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUPS = {
+    "sync": ["-w", "4", "-k", "sync"],
+    "gevent": ["-w", "4", "-k", "gevent", "--worker-connections", "500"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def post_chat(url, question, timeout):
+    request = urllib.request.Request(url, data=json.dumps({"message": question}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
+
+
+def wait_until_ready(url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            # Die erste Anfrage baut bei Bedarf den Index auf
+            post_chat(url, "Öffnungszeiten?", timeout)
+            return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.5)
+    return False
+
+
+def load(url, concurrency, duration, timeout):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client(number):
+        request_number = 0
+        while time.time() < stop_at:
+            request_number += 1
+            start = time.perf_counter()
+            try:
+                post_chat(url, f"Wo finde ich das Kreismedienzentrum? ({number}-{request_number})", timeout)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=client, args=(number,), daemon=True) for number in range(concurrency)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.time() - started
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200, help="gleichzeitige Clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="Dauer pro Setup in Sekunden")
+    parser.add_argument("--embedding-latency", type=float, default=0.2)
+    parser.add_argument("--completion-latency", type=float, default=1.5, help="Zeit bis zum ersten Token")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client-Timeout pro Anfrage")
+    parser.add_argument("--setups", default="sync,gevent")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "SHOPBOT_EMBEDDINGS": "fake",
+        "SHOPBOT_COMPLETIONS": "fake",
+        "SHOPBOT_FAKE_EMBEDDING_SECONDS": str(args.embedding_latency),
+        "SHOPBOT_FAKE_FIRST_TOKEN_SECONDS": str(args.completion_latency),
+        "SHOPBOT_FAKE_TOKEN_SECONDS": "0",
+        # Verschiedene Fragen sollen nicht über den semantischen Antwort-Cache beantwortet werden
+        "SHOPBOT_ANSWER_CACHE_THRESHOLD": "2",
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-fake"),
+    })
+
+    print(f"{'Setup':<8} {'Anfragen':>9} {'Anfr./s':>8} {'p50 s':>7} {'p99 s':>7} {'Fehler':>7}")
+    for setup in args.setups.split(","):
+        port = free_port()
+        command = [sys.executable, "-m", "gunicorn", *SETUPS[setup], "-b", f"127.0.0.1:{port}",
+                   "--timeout", "120", "--log-level", "warning", "app:create_app()"]
+        # gunicorn.conf.py patcht nur für gevent-Worker (SHOPBOT_WORKER_CLASS)
+        env["SHOPBOT_WORKER_CLASS"] = SETUPS[setup][SETUPS[setup].index("-k") + 1]
+        env["SHOPBOT_INSTANCE_PATH"] = tempfile.mkdtemp(prefix=f"bench_load_{setup}_")
+        server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}/chat"
+        try:
+            if not wait_until_ready(url):
+                print(f"{setup:<8} Server nicht erreichbar")
+                continue
+            latencies, errors, elapsed = load(url, args.concurrency, args.duration, args.timeout)
+            print(f"{setup:<8} {len(latencies):>9} {len(latencies) / elapsed:>8.1f} "
+                  f"{percentile(latencies, 50):>7.2f} {percentile(latencies, 99):>7.2f} {len(errors):>7}")
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
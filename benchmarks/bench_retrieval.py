@@ -0,0 +1,260 @@
+"""
+Evaluations-Harness für das Retrieval: baut einen Index aus knowledge.txt und spielt die Fragen aus
+training_data.jsonl / training_data_prepared.jsonl über denselben Suchpfad wie /chat ab
+(app.find_relevant_chunks, für jeden Retrieval-Modus vector, hybrid und auto).
+
+Relevanz: Ein Chunk gilt als relevant für eine Frage, wenn er die Schlüsselbegriffe der Referenzantwort
+(Wörter ab 4 Zeichen und alles mit Ziffern) nahezu so gut abdeckt wie der beste Chunk des Korpus
+(mindestens --min-coverage). Fragen, deren Antwort im Korpus nicht vorkommt, werden nicht gewertet.
+
+Gemessen werden recall@k (Anteil der Fragen mit einem relevanten Chunk unter den ersten k), MRR,
+Aufbauzeit des Index, Latenz pro Frage (p50/p99), Embedding-Aufrufe pro Frage und der Spitzen-RSS.
+Das Ergebnis wird als JSON geschrieben; mit --compare werden die Kennzahlen einem früheren Lauf
+(z. B. eines anderen Commits) gegenübergestellt.
+
+Embeddings: standardmäßig der deterministische lokale Ersatz (SHOPBOT_EMBEDDINGS=fake, kein Netzwerk).
+Mit --embeddings openai werden echte Embeddings verwendet; die Chunks kommen dann aus dem Embedding-Cache
+der App (instance/embedding_cache.db), sodass wiederholte Läufe nur die Fragen neu einbetten.
+
+Aufruf:
+    python benchmarks/bench_retrieval.py --output retrieval.json
+    python benchmarks/bench_retrieval.py --output neu.json --compare retrieval.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("vector", "hybrid", "auto")
+K_VALUES = (1, 3, 5, 10)
+
+_WORD = re.compile(r"\w+")
+STOPWORDS = {
+    "sind", "eine", "einen", "einer", "eines", "dass", "werden", "wird", "können", "kann", "über", "auch",
+    "nicht", "sowie", "unter", "ihre", "ihren", "unsere", "unser", "diese", "dieser", "oder", "bietet",
+    "beim", "nach", "sich", "haben", "wurde", "zum", "zur", "mit", "für", "von", "und", "bitte",
+}
+
+
+def key_terms(text):
+    return {word for word in _WORD.findall(text.lower())
+            if (len(word) >= 4 or any(ch.isdigit() for ch in word)) and word not in STOPWORDS}
+
+
+def load_questions(paths):
+    """
+    Frage/Antwort-Paare aus den Trainingsdateien (Format {"prompt": "Frage: ...\\nAntwort:", "completion": ...}),
+    doppelte Fragen nur einmal.
+    """
+    pairs = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                question = record["prompt"].replace("Frage:", "", 1).rsplit("Antwort:", 1)[0].strip()
+                pairs.setdefault(question, record["completion"].strip())
+    return list(pairs.items())
+
+
+def judge(snapshot, pairs, min_coverage):
+    """
+    Relevante Chunk-IDs je Frage (siehe Modulbeschreibung); None für Fragen ohne Antwort im Korpus.
+    """
+    chunk_terms = [(int(chunk_id), set(_WORD.findall(snapshot.chunks[position].lower())))
+                   for position, chunk_id in enumerate(snapshot.chunks.ids)]
+    judgements = []
+    for _, answer in pairs:
+        terms = key_terms(answer)
+        coverage = [(chunk_id, len(terms & words) / len(terms)) for chunk_id, words in chunk_terms] if terms else []
+        best = max((value for _, value in coverage), default=0.0)
+        if best < min_coverage:
+            judgements.append(None)
+            continue
+        judgements.append({chunk_id for chunk_id, value in coverage if value >= 0.8 * best})
+    return judgements
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else 0.0
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def evaluate(shopbot, snapshot, pairs, judgements, mode, repeat):
+    max_k = max(K_VALUES)
+    hits = {k: 0 for k in K_VALUES}
+    reciprocal_ranks, latencies, ranks = [], [], []
+    calls = {"embeddings": 0}
+    get_embedding = shopbot.get_embedding
+
+    def counting_embedding(text):
+        calls["embeddings"] += 1
+        return get_embedding(text)
+
+    shopbot.get_embedding = counting_embedding
+    try:
+        for (question, _), relevant in zip(pairs, judgements):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                chunk_ids, _, _ = shopbot.find_relevant_chunks(snapshot, question, limit=max_k, mode=mode)
+                latencies.append(time.perf_counter() - start)
+            if relevant is None:
+                ranks.append(None)
+                continue
+            rank = next((position for position, chunk_id in enumerate(chunk_ids, start=1) if chunk_id in relevant),
+                        None)
+            ranks.append(rank)
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+            for k in K_VALUES:
+                hits[k] += rank is not None and rank <= k
+    finally:
+        shopbot.get_embedding = get_embedding
+    judged = len(reciprocal_ranks)
+    result = {f"recall@{k}": hits[k] / judged if judged else 0.0 for k in K_VALUES}
+    result.update({
+        "mrr": sum(reciprocal_ranks) / judged if judged else 0.0,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p99_ms": percentile_ms(latencies, 99),
+        "embedding_calls_per_query": calls["embeddings"] / max(len(latencies), 1),
+    })
+    return result, ranks
+
+
+def print_results(results, previous=None):
+    columns = [f"recall@{k}" for k in K_VALUES] + ["mrr", "p50_ms", "p99_ms", "embedding_calls_per_query"]
+    print(f"{'Modus':<8}" + "".join(f"{name.replace('embedding_calls_per_query', 'Emb./Frage'):>12}"
+                                     for name in columns))
+    for mode, metrics in results["modes"].items():
+        print(f"{mode:<8}" + "".join(f"{metrics[name]:>12.3f}" for name in columns))
+        if previous and mode in previous.get("modes", {}):
+            before = previous["modes"][mode]
+            print(f"{'  Δ':<8}" + "".join(f"{metrics[name] - before.get(name, 0.0):>+12.3f}" for name in columns))
+    build = results["build"]
+    line = f"Indexaufbau: {build['seconds']:.2f}s, {build['chunks']} Chunks; Spitzen-RSS {results['peak_rss_mb']:.0f} MB"
+    if previous:
+        line += (f" (vorher {previous['build']['seconds']:.2f}s, {previous['build']['chunks']} Chunks, "
+                 f"{previous['peak_rss_mb']:.0f} MB; Commit {previous.get('commit')})")
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--knowledge", default=os.path.join(ROOT, "knowledge.txt"))
+    parser.add_argument("--questions", nargs="*", default=[os.path.join(ROOT, "training_data.jsonl"),
+                                                          os.path.join(ROOT, "training_data_prepared.jsonl")])
+    parser.add_argument("--embeddings", choices=("fake", "openai"), default="fake")
+    parser.add_argument("--index-type", help="Index-Typ (Standard: SHOPBOT_INDEX_TYPE der App)")
+    parser.add_argument("--vector-storage", choices=("float32", "float16", "int8"),
+                        help="Speicherform der Vektoren (Standard: SHOPBOT_VECTOR_STORAGE der App)")
+    parser.add_argument("--min-coverage", type=float, default=0.5,
+                        help="Mindestabdeckung der Antwortbegriffe, damit eine Frage gewertet wird")
+    parser.add_argument("--repeat", type=int, default=20, help="Wiederholungen pro Frage für die Latenzmessung")
+    parser.add_argument("--output", default="bench_retrieval.json", help="Ergebnisdatei (JSON)")
+    parser.add_argument("--compare", help="früheres Ergebnis (JSON) zum Vergleich")
+    args = parser.parse_args()
+    # Relative Pfade beziehen sich auf das Aufrufverzeichnis, nicht auf ROOT (siehe chdir unten)
+    args.output = os.path.abspath(args.output)
+    args.compare = os.path.abspath(args.compare) if args.compare else None
+
+    if args.embeddings == "fake":
+        os.environ["SHOPBOT_EMBEDDINGS"] = "fake"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.chdir(ROOT)
+    import app as shopbot
+    from embedding_cache import EmbeddingCache
+    from index_store import IndexBuilder, load_index
+    from knowledge_store import split_sections
+    from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS
+
+    pairs = load_questions(args.questions)
+    with open(args.knowledge, "r", encoding="utf-8") as f:
+        documents = list(split_sections(f))
+    index_type = args.index_type or shopbot.INDEX_TYPE
+    vector_storage = args.vector_storage or shopbot.VECTOR_STORAGE
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.embeddings == "fake":
+            # Eigener, leerer Cache: die Aufbauzeit soll das Einbetten aller Chunks enthalten
+            shopbot.embedding_cache = EmbeddingCache(os.path.join(tmp, "embedding_cache.db"))
+        else:
+            # Embedding-Cache der App (instance/embedding_cache.db)
+            shopbot.open_process_resources()
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        builder = IndexBuilder(index_type=index_type, vector_storage=vector_storage)
+        shopbot.embed_documents_into(builder, documents)
+        version = builder.save(os.path.join(tmp, "index"))
+        build_seconds = time.perf_counter() - start
+        snapshot = load_index(os.path.join(tmp, "index"), version)
+
+        judgements = judge(snapshot, pairs, args.min_coverage)
+        results = {
+            "commit": git_commit(),
+            "created": time.time(),
+            "config": {
+                "embeddings": args.embeddings,
+                "index_type": builder.actual_index_type,
+                "vector_storage": builder.vector_storage,
+                "rescore_candidates": shopbot.RESCORE_CANDIDATES,
+                "chunk_tokens": DEFAULT_CHUNK_TOKENS,
+                "chunk_overlap": DEFAULT_OVERLAP_TOKENS,
+                "retrieval_candidates": shopbot.RETRIEVAL_CANDIDATES,
+                "dedup_threshold": shopbot.DEDUP_THRESHOLD,
+                "min_coverage": args.min_coverage,
+            },
+            "corpus": {
+                "documents": len(documents),
+                "questions": len(pairs),
+                "judged": sum(1 for relevant in judgements if relevant is not None),
+            },
+            "build": {"seconds": build_seconds, "chunks": len(snapshot.chunks),
+                      "rss_growth_mb": peak_rss_mb() - rss_before},
+            "modes": {},
+            "questions": [{"question": question, "relevant": sorted(relevant) if relevant is not None else None,
+                           "ranks": {}} for (question, _), relevant in zip(pairs, judgements)],
+        }
+        for mode in MODES:
+            metrics, ranks = evaluate(shopbot, snapshot, pairs, judgements, mode, args.repeat)
+            results["modes"][mode] = metrics
+            for entry, rank in zip(results["questions"], ranks):
+                entry["ranks"][mode] = rank
+        results["peak_rss_mb"] = peak_rss_mb()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Korpus: {len(documents)} Dokumente, {results['corpus']['judged']}/{len(pairs)} Fragen gewertet, "
+          f"Embeddings: {args.embeddings}, Index: {builder.actual_index_type}")
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    print(f"Ergebnis geschrieben nach {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark des Starts der Web-App.
+
+1. import app in einem frischen Interpreter (Median aus --repeat Läufen) und welche schweren Module danach
+   geladen sind.
+2. app.create_app() mit vorhandenem Index (Schema, Caches, Wissensbasis, Admin-Oberfläche, Index laden).
+3. gunicorn mit gunicorn.conf.py und --workers Workern, einmal mit preload_app (App im Master eingerichtet,
+   Worker per Fork) und einmal ohne (jeder Worker richtet die App selbst ein): Zeit ab Start bis zur ersten
+   Chat-Antwort und bis alle Worker bereit sind, Speicher aller Prozesse als Summe von RSS und PSS. PSS
+   rechnet geteilte Seiten anteilig, die Differenz zu RSS zeigt also, was Copy-on-Write einspart.
+
+Die Daten liegen in einem temporären instance-Ordner (SHOPBOT_INSTANCE_PATH). Der Index wird aus der
+knowledge.txt gebaut; mit --copies N wird jeder Abschnitt N-mal (ohne Duplikaterkennung) eingebettet, um einen
+größeren Index zu simulieren. Eingebettet und geantwortet wird lokal (SHOPBOT_EMBEDDINGS/SHOPBOT_COMPLETIONS=fake).
+
+Aufruf:
+    python benchmarks/bench_startup.py --copies 20 --workers 4
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMP = tempfile.mkdtemp(prefix="bench_startup_")
+ENV = dict(os.environ)
+ENV.update({
+    "SHOPBOT_INSTANCE_PATH": TMP,
+    "SHOPBOT_EMBEDDINGS": "fake",
+    "SHOPBOT_COMPLETIONS": "fake",
+    "SHOPBOT_FAKE_FIRST_TOKEN_SECONDS": "0",
+    "SHOPBOT_FAKE_TOKEN_SECONDS": "0",
+    "SHOPBOT_DEDUP_THRESHOLD": "2",
+    "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-benchmark"),
+})
+HEAVY_MODULES = ("openai", "aiohttp", "flask_admin", "faiss", "numpy", "flask_sqlalchemy")
+
+IMPORT_SCRIPT = f"""
+import sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(elapsed, " ".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+CREATE_SCRIPT = """
+import time
+import app
+start = time.perf_counter()
+app.create_app()
+print(time.perf_counter() - start)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_script(script):
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=ENV, capture_output=True, text=True,
+                            check=True).stdout
+    return output.strip().splitlines()[-1].split(" ", 1)
+
+
+def prepare_instance(copies):
+    os.environ.update(ENV)
+    import app as shopbot
+    from knowledge_store import split_sections
+
+    shopbot.create_app()
+    with open(shopbot.KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+        sections = list(split_sections(f))
+    shopbot.knowledge_store.put_many((f"{source}#kopie-{copy}", text)
+                                     for copy in range(1, copies) for source, text in sections)
+    shopbot.refresh_knowledge_index()
+    shopbot.close_process_resources()
+    return len(shopbot.get_index_snapshot().chunks)
+
+
+def memory_kb(pid):
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in ("Rss", "Pss"):
+                    values[name] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values.get("Rss", 0), values.get("Pss", 0)
+
+
+def chat(url, timeout=5.0):
+    request = urllib.request.Request(url, data=json.dumps({"message": "Öffnungszeiten?"}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
+
+
+def bench_gunicorn(workers, preload):
+    port = free_port()
+    env = dict(ENV, SHOPBOT_PRELOAD="1" if preload else "0", WEB_CONCURRENCY=str(workers), PORT=str(port))
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning"],
+                              cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    ready = {}
+
+    def read_output():
+        for line in server.stdout:
+            if line.startswith("Worker ") and line.rstrip().endswith("bereit."):
+                ready[int(line.split()[1])] = time.perf_counter() - start
+
+    threading.Thread(target=read_output, daemon=True).start()
+    url = f"http://127.0.0.1:{port}/chat"
+    first_chat = None
+    try:
+        deadline = time.perf_counter() + 120
+        while first_chat is None and time.perf_counter() < deadline:
+            try:
+                if chat(url) == 200:
+                    first_chat = time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.01)
+        while len(ready) < workers and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        # Jeder Worker beantwortet einige Chats, damit die Index-Seiten tatsächlich berührt sind
+        threads = [threading.Thread(target=chat, args=(url, 30.0)) for _ in range(workers * 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        time.sleep(0.5)
+        rss = pss = 0
+        for pid in [server.pid, *ready]:
+            process_rss, process_pss = memory_kb(pid)
+            rss += process_rss
+            pss += process_pss
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    all_ready = max(ready.values()) if len(ready) == workers else float("nan")
+    return first_chat, all_ready, rss / 1024, pss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=20, help="Kopien jedes Abschnitts der knowledge.txt im Index")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5, help="Läufe für import app und create_app")
+    args = parser.parse_args()
+
+    print(f"Daten in {TMP}")
+    chunks = prepare_instance(args.copies)
+    print(f"Index: {chunks} Chunks")
+
+    timings, modules = [], ""
+    for _ in range(args.repeat):
+        elapsed, modules = run_script(IMPORT_SCRIPT)
+        timings.append(float(elapsed))
+    print(f"import app:   {statistics.median(timings) * 1000:>7.0f} ms  (geladen: {modules or '-'})")
+    timings = [float(run_script(CREATE_SCRIPT)[0]) for _ in range(args.repeat)]
+    print(f"create_app(): {statistics.median(timings) * 1000:>7.0f} ms")
+
+    print(f"\ngunicorn, {args.workers} Worker:")
+    print(f"{'Modus':<12} {'erster Chat':>12} {'alle bereit':>12} {'RSS gesamt':>11} {'PSS gesamt':>11}")
+    for preload in (False, True):
+        first_chat, all_ready, rss, pss = bench_gunicorn(args.workers, preload)
+        print(f"{'preload' if preload else 'ohne preload':<12} {first_chat:>11.2f}s {all_ready:>11.2f}s "
+              f"{rss:>8.0f} MB {pss:>8.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Misst die Zeit bis zum ersten Token (TTFT) für /chat (blockierend) und /chat/stream (Server-Sent Events).
+
+Läuft vollständig lokal: Embeddings und Chat-Antworten kommen aus den Fake-Backends
+(SHOPBOT_EMBEDDINGS=fake, SHOPBOT_COMPLETIONS=fake), deren Latenzen sich einstellen lassen. Die Daten
+liegen in einem temporären instance-Ordner (SHOPBOT_INSTANCE_PATH). Jede Anfrage stellt eine andere Frage
+und der semantische Antwort-Cache ist abgeschaltet, damit der Chat-Pfad gemessen wird und keine Cache-Treffer.
+
+Aufruf:
+    python benchmarks/bench_streaming.py --first-token 0.8 --token 0.03 --requests 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def measure(client, path, question):
+    start = time.perf_counter()
+    response = client.post(path, json={"message": question}, buffered=False)
+    first = None
+    body = b""
+    for part in response.iter_encoded():
+        if first is None and part:
+            first = time.perf_counter() - start
+        body += part
+    total = time.perf_counter() - start
+    response.close()
+    return first if first is not None else total, total, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--first-token", type=float, default=0.8, help="simulierte Zeit bis zum ersten Token (s)")
+    parser.add_argument("--token", type=float, default=0.03, help="simulierte Zeit pro weiterem Token (s)")
+    parser.add_argument("--requests", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["SHOPBOT_EMBEDDINGS"] = "fake"
+    os.environ["SHOPBOT_COMPLETIONS"] = "fake"
+    os.environ["SHOPBOT_FAKE_FIRST_TOKEN_SECONDS"] = str(args.first_token)
+    os.environ["SHOPBOT_FAKE_TOKEN_SECONDS"] = str(args.token)
+    os.environ["SHOPBOT_INSTANCE_PATH"] = tempfile.mkdtemp(prefix="bench_streaming_")
+    os.environ["SHOPBOT_ANSWER_CACHE_THRESHOLD"] = "2"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.chdir(ROOT)
+    import app as shopbot
+
+    client = shopbot.create_app().test_client()
+    # Erste Anfrage baut ggf. den Index auf und zählt nicht mit
+    measure(client, "/chat", "Öffnungszeiten?")
+
+    print(f"{'Endpunkt':<14} {'TTFT Median':>12} {'Gesamt Median':>14}")
+    for path in ("/chat", "/chat/stream"):
+        ttfts, totals = [], []
+        for number in range(args.requests):
+            ttft, total, _ = measure(client, path, f"Wo finde ich das Kreismedienzentrum? ({path} #{number})")
+            ttfts.append(ttft)
+            totals.append(total)
+        ttfts.sort()
+        totals.sort()
+        print(f"{path:<14} {ttfts[len(ttfts) // 2] * 1000:>10.0f}ms {totals[len(totals) // 2] * 1000:>12.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
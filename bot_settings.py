@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+DEFAULT_BASE_PROMPT = "Ich bin ein hilfreicher Assistent."
+DEFAULT_GREETING = "Hallo! Wie kann ich helfen?"
+
+# Spätestens nach so vielen Sekunden bemerkt ein Worker Änderungen aus einem anderen Worker
+DEFAULT_MAX_AGE = 5.0
+
+
+@dataclass(frozen=True)
+class BotSettings:
+    """
+    Unveränderlicher Stand der Bot-Konfiguration, wie sie der Chat benötigt.
+    """
+    api_key: Optional[str]
+    base_prompt: str
+    greeting: str
+    stamp: str
+
+
+class SettingsCache:
+    """
+    Hält die Bot-Konfiguration im Speicher, damit der Chat-Pfad keine Datenbankabfragen braucht.
+    Änderungen werden über eine Versionsdatei (stamp_path) an alle Worker gemeldet: Jeder Worker prüft
+    höchstens alle max_age Sekunden deren Inhalt und lädt bei einer neuen Version alles mit einer Abfrage neu.
+    """
+
+    def __init__(self, loader: Callable[[str], BotSettings], stamp_path: str, max_age: float = DEFAULT_MAX_AGE):
+        self.loader = loader
+        self.stamp_path = stamp_path
+        self.max_age = max_age
+        self._settings: Optional[BotSettings] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_stamp(self) -> str:
+        try:
+            with open(self.stamp_path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def get(self) -> BotSettings:
+        """
+        Liefert die aktuelle Konfiguration. Braucht einen App-Kontext, falls neu geladen werden muss.
+        """
+        settings = self._settings
+        if settings is not None and time.monotonic() - self._checked_at < self.max_age:
+            return settings
+        with self._lock:
+            stamp = self._read_stamp()
+            if self._settings is None or self._settings.stamp != stamp:
+                self._settings = self.loader(stamp)
+            self._checked_at = time.monotonic()
+            return self._settings
+
+    def invalidate(self) -> None:
+        """
+        Nach dem Speichern aufrufen: schreibt eine neue Version und lädt in diesem Worker sofort neu.
+        """
+        tmp_path = self.stamp_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, self.stamp_path)
+        with self._lock:
+            self._settings = None
+            self._checked_at = 0.0
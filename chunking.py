@@ -0,0 +1,211 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional: ohne tiktoken wird die Tokenzahl geschätzt
+    tiktoken = None
+
+# Chunk-Größe und Überlappung in Tokens (ada-002 verarbeitet bis 8191 Tokens pro Text)
+DEFAULT_CHUNK_TOKENS = int(os.getenv("SHOPBOT_CHUNK_TOKENS", "200"))
+DEFAULT_OVERLAP_TOKENS = int(os.getenv("SHOPBOT_CHUNK_OVERLAP", "30"))
+# Eine Überschrift beginnt nur dann einen neuen Chunk, wenn der bisherige mindestens so groß ist
+# (Anteil an der Chunk-Größe); sonst entstehen bei vielen kurzen Abschnitten winzige Chunks.
+MIN_FILL_BEFORE_HEADING = 0.25
+
+ENCODING_NAME = "cl100k_base"
+
+# Markdown-Überschriften und die Kopfzeilen der Wissensabschnitte ("URL: ...", "Datei: ...")
+_HEADING = re.compile(r"^\s{0,3}(?:#{1,6}\s+\S|URL: |Datei: )")
+# Unterstrichene Überschrift (nächste Zeile besteht nur aus = oder -)
+_UNDERLINE = re.compile(r"^\s*(?:=+|-+)\s*$")
+# Satzende: Satzzeichen vor Leerraum (ein Satz reicht bis dorthin oder bis zum Zeilenende)
+_SENTENCE_END = re.compile(r"[.!?]+(?=\s)")
+_WORD = re.compile(r"\S+")
+# Schätzung ohne tiktoken: je angefangene sechs Wortzeichen ein Token, jedes Satzzeichen ein Token
+_ROUGH_TOKEN = re.compile(r"\w{1,6}|[^\w\s]")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """
+    Ein Chunk mit Herkunft: Quelle (z. B. "url:https://..."), Zeichenbereich [start, end) im Dokumenttext,
+    die zuletzt gesehene Überschrift und die laufende Nummer innerhalb des Dokuments.
+    """
+    source: str
+    text: str
+    start: int
+    end: int
+    heading: Optional[str] = None
+    position: int = 0
+
+
+class TokenCounter:
+    """
+    Zählt Tokens wie das Embedding-Modell (tiktoken, cl100k_base). Ist tiktoken nicht installiert oder
+    das Encoding nicht ladbar, wird geschätzt: ein Token je angefangene sechs Zeichen eines Worts (lange
+    deutsche Komposita zerfallen in mehrere Tokens) und je Satzzeichen. Die Schätzung ist additiv,
+    die Summe über die Wörter entspricht also der Zählung des ganzen Texts.
+    """
+
+    def __init__(self):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(ENCODING_NAME)
+            except Exception as e:
+                print("tiktoken-Encoding nicht verfügbar, Tokens werden geschätzt:", e)
+
+    @property
+    def exact(self):
+        return self._encoding is not None
+
+    def count(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(_ROUGH_TOKEN.findall(text))
+
+
+_counter = None
+
+
+def get_token_counter():
+    global _counter
+    if _counter is None:
+        _counter = TokenCounter()
+    return _counter
+
+
+def chunker_signature(max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    """
+    Kennung der Chunking-Einstellungen; ändert sie sich, müssen alle Dokumente neu zerlegt werden.
+    """
+    counter = "tiktoken" if get_token_counter().exact else "geschaetzt"
+    return f"chunker-v2:{max_tokens}:{overlap_tokens}:{counter}"
+
+
+def _sentences(line):
+    """
+    Bereiche (start, end) der Sätze einer Zeile, ohne führenden und abschließenden Leerraum.
+    """
+    position = 0
+    for match in _SENTENCE_END.finditer(line):
+        start = _WORD.search(line, position).start()
+        yield start, match.end()
+        position = match.end()
+    rest = _WORD.search(line, position)
+    if rest is not None:
+        yield rest.start(), len(line.rstrip())
+
+
+def _units(text, max_tokens, counter):
+    """
+    Zerlegt einen Dokumenttext in aufeinanderfolgende Einheiten (start, end, tokens, is_heading):
+    Überschriften, Sätze und – für überlange Sätze – Wortgruppen. Der Text wird nicht kopiert,
+    sondern nur über Positionen beschrieben.
+    """
+    lines = text.splitlines(keepends=True)
+    offset = 0
+    for number, line in enumerate(lines):
+        line_start = offset
+        offset += len(line)
+        content = line.rstrip("\r\n")
+        if not content.strip() or _UNDERLINE.match(content):
+            continue
+        if _HEADING.match(content):
+            yield line_start, line_start + len(content.rstrip()), counter.count(content), True
+            continue
+        next_line = lines[number + 1].rstrip("\r\n") if number + 1 < len(lines) else ""
+        if next_line.strip() and _UNDERLINE.match(next_line):
+            # Überschrift samt Unterstreichung; die Unterstreichung selbst wird oben übersprungen
+            end = offset + len(next_line.rstrip())
+            yield line_start, end, counter.count(text[line_start:end]), True
+            continue
+        for sentence_start, sentence_end in _sentences(content):
+            sentence = content[sentence_start:sentence_end]
+            tokens = counter.count(sentence)
+            if tokens <= max_tokens:
+                yield line_start + sentence_start, line_start + sentence_end, tokens, False
+                continue
+            # Überlanger Satz (z. B. eine ganze Seite ohne Satzzeichen): in Wortgruppen teilen
+            offset_in_line = line_start + sentence_start
+            group_start = group_end = None
+            group_tokens = 0
+            for word in _WORD.finditer(sentence):
+                word_tokens = counter.count(word.group())
+                if group_start is not None and group_tokens + word_tokens > max_tokens:
+                    yield offset_in_line + group_start, offset_in_line + group_end, group_tokens, False
+                    group_start, group_tokens = None, 0
+                if group_start is None:
+                    group_start = word.start()
+                group_end = word.end()
+                group_tokens += word_tokens
+            if group_start is not None:
+                yield offset_in_line + group_start, offset_in_line + group_end, group_tokens, False
+
+
+def chunk_document(source, text, max_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                   counter=None) -> Iterator[Chunk]:
+    """
+    Zerlegt ein Dokument in Chunks von höchstens max_tokens Tokens. Grenzen liegen zwischen Sätzen;
+    eine Überschrift beginnt einen neuen Chunk. Aufeinanderfolgende Chunks desselben Abschnitts
+    überlappen um bis zu overlap_tokens (ganze Sätze), damit Aussagen an der Grenze nicht verloren gehen.
+    Der Chunk-Text ist der zusammenhängende Ausschnitt text[start:end] des Dokuments.
+    """
+    counter = counter or get_token_counter()
+    current = []  # (start, end, tokens)
+    current_tokens = 0
+    current_has_body = False  # nur Überschriften ergeben keinen eigenen Chunk
+    heading = None
+    chunk_heading = None
+    position = 0
+
+    def emit():
+        nonlocal position
+        start, end = current[0][0], current[-1][1]
+        chunk = Chunk(source, text[start:end], start, end, chunk_heading, position)
+        position += 1
+        return chunk
+
+    for start, end, tokens, is_heading in _units(text, max_tokens, counter):
+        if is_heading:
+            if current_has_body and current_tokens >= max_tokens * MIN_FILL_BEFORE_HEADING:
+                yield emit()
+                current, current_tokens, current_has_body = [], 0, False
+            heading = text[start:end].splitlines()[0].strip()
+            if not current:
+                chunk_heading = heading
+        elif current_has_body and current_tokens + tokens > max_tokens:
+            # Bestehen die gesammelten Einheiten nur aus Überschriften, gehen sie mit dem folgenden Satz in
+            # einen Chunk (der dann höchstens um die Überschrift über max_tokens liegt)
+            yield emit()
+            # Überlappung: die letzten Sätze des vorigen Chunks, solange sie in overlap_tokens passen
+            overlap, overlap_size = [], 0
+            for unit in reversed(current):
+                if overlap_size + unit[2] > overlap_tokens or overlap_size + unit[2] + tokens > max_tokens:
+                    break
+                overlap.insert(0, unit)
+                overlap_size += unit[2]
+            current, current_tokens = overlap, overlap_size
+            chunk_heading = heading
+        if not current:
+            chunk_heading = heading
+        current.append((start, end, tokens))
+        current_tokens += tokens
+        current_has_body = current_has_body or not is_heading
+    # Überschriften am Dokumentende ohne folgenden Text ergeben keinen Chunk
+    if current_has_body:
+        yield emit()
+
+
+def iter_chunks(documents: Iterable[Tuple[str, str]], max_tokens=DEFAULT_CHUNK_TOKENS,
+                overlap_tokens=DEFAULT_OVERLAP_TOKENS) -> Iterator[Chunk]:
+    """
+    Streamt die Chunks aller Dokumente (Quelle, Text) nacheinander; es liegt immer nur ein Dokument
+    im Speicher, und kein Chunk reicht über eine Dokumentgrenze.
+    """
+    counter = get_token_counter()
+    for source, text in documents:
+        yield from chunk_document(source, text, max_tokens, overlap_tokens, counter)
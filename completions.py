@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+
+CHAT_MODEL = "gpt-4"
+
+
+class OpenAIChatBackend:
+    """
+    Chat-Completions über die OpenAI-API (openai==0.28.0).
+    """
+
+    def __init__(self, model=CHAT_MODEL):
+        self.model = model
+
+    def complete(self, messages):
+        import openai
+
+        response = openai.ChatCompletion.create(model=self.model, messages=messages)
+        return response.choices[0].message.content
+
+    def stream(self, messages):
+        """
+        Liefert die Antwort stückweise (Token für Token), sobald die API sie sendet.
+        """
+        import openai
+
+        for part in openai.ChatCompletion.create(model=self.model, messages=messages, stream=True):
+            delta = part["choices"][0].get("delta", {})
+            content = delta.get("content")
+            if content:
+                yield content
+
+
+class FakeChatBackend:
+    """
+    Lokaler Ersatz für GPT-4 (für Tests und Benchmarks ohne Netzwerk).
+    Simuliert die Wartezeit bis zum ersten Token (first_token_latency) und die Zeit pro weiterem Token.
+    Mit capacity bedient die simulierte API nur so viele gleichzeitige Aufrufe des Prozesses in voller
+    Geschwindigkeit; darüber hinaus wächst die Wartezeit anteilig (wie bei einer überlasteten API).
+    Die Antwort wiederholt den Anfang des mitgeschickten Kontexts.
+    """
+
+    _active = 0
+    _active_lock = threading.Lock()
+
+    def __init__(self, first_token_latency=1.0, token_latency=0.02, tokens=40, model="fake-chat", capacity=0):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.model = model
+        self.capacity = capacity
+
+    def _wait_first_token(self):
+        with FakeChatBackend._active_lock:
+            FakeChatBackend._active += 1
+            active = FakeChatBackend._active
+        try:
+            overload = max(1.0, active / self.capacity) if self.capacity else 1.0
+            time.sleep(self.first_token_latency * overload)
+        finally:
+            with FakeChatBackend._active_lock:
+                FakeChatBackend._active -= 1
+
+    def _answer_tokens(self, messages):
+        context = " ".join(m["content"] for m in messages if m["role"] == "system")
+        words = context.split()[:self.tokens] or ["Keine", "Informationen", "gefunden."]
+        return [word + " " for word in words]
+
+    def complete(self, messages):
+        tokens = self._answer_tokens(messages)
+        self._wait_first_token()
+        time.sleep(self.token_latency * (len(tokens) - 1))
+        return "".join(tokens).strip()
+
+    def stream(self, messages):
+        tokens = self._answer_tokens(messages)
+        self._wait_first_token()
+        for position, token in enumerate(tokens):
+            if position:
+                time.sleep(self.token_latency)
+            yield token
+
+
+def get_chat_backend():
+    """
+    Wählt das Chat-Backend. Mit SHOPBOT_COMPLETIONS=fake wird ohne OpenAI-Zugriff geantwortet.
+    """
+    if os.getenv("SHOPBOT_COMPLETIONS", "openai").lower() == "fake":
+        return FakeChatBackend(
+            first_token_latency=float(os.getenv("SHOPBOT_FAKE_FIRST_TOKEN_SECONDS", "1.0")),
+            token_latency=float(os.getenv("SHOPBOT_FAKE_TOKEN_SECONDS", "0.02")),
+            capacity=int(os.getenv("SHOPBOT_FAKE_CAPACITY", "0")),
+        )
+    return OpenAIChatBackend()
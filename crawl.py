@@ -1,32 +1,27 @@
 import os
+import json
 import time
 import datetime
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-
-# Flask-App und Datenbank-Konfiguration
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///shopbot.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-db = SQLAlchemy(app)
-
-# Models für gecrawlte Seiten und die zu crawlenden Webseiten
-class CrawledPage(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(500), nullable=False, unique=True)
-    content = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
-class CrawledWebsite(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(500), nullable=False, unique=True)
-
-# Erstelle die Tabellen, falls sie noch nicht existieren
-with app.app_context():
-    db.create_all()
+from dataclasses import dataclass, field
+from typing import List
+from urllib.parse import urlparse
+from contextlib import nullcontext
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.sqlite import insert
+from crawl_engine import Crawler, KnownPage, content_hash, create_session, fetch_page, normalize_url
+from knowledge_store import KnowledgeStore, sync_upload_directory
+from metrics import CRAWL_PAGES, CRAWL_PAGES_PER_SECOND
+from models import CrawledPage, CrawlFrontier, db
+
+# Standard-Budget für Websites ohne eigene Grenzen (leer = unbegrenzt)
+DEFAULT_MAX_PAGES = int(os.getenv("SHOPBOT_CRAWL_MAX_PAGES", "0")) or None
+DEFAULT_MAX_DEPTH = int(os.getenv("SHOPBOT_CRAWL_MAX_DEPTH", "0")) or None
+
+# Ergebnisse eines Crawls werden blockweise geschrieben: nach so vielen Seiten bzw. spätestens nach so
+# vielen Sekunden eine Transaktion (statt einer pro Seite)
+CRAWL_BATCH_SIZE = int(os.getenv("SHOPBOT_CRAWL_BATCH_SIZE", "100"))
+CRAWL_FLUSH_INTERVAL = 5.0
 
 # Verzeichnis, in dem hochgeladene TXT-Dateien liegen (anpassen, falls nötig)
 UPLOADS_DIR = os.path.abspath("uploads")
@@ -36,96 +31,257 @@ def get_text_from_page(url):
     Lädt eine Webseite und extrahiert den sichtbaren Text (falls HTML).
     Bei anderen Inhalten (z. B. PDFs, Bildern) wird None zurückgegeben.
     """
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/110.0.0.0 Safari/537.36"
-        )
-    }
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-
-        # Prüfen, ob es sich um HTML handelt
-        content_type = response.headers.get("Content-Type", "").lower()
-        if "text/html" not in content_type:
-            print(f"❌ Kein HTML-Inhalt für {url} ({content_type})")
-            return None
-
-        # HTML parsen – hier verwenden wir den lxml-Parser
-        soup = BeautifulSoup(response.text, "lxml")
-
-        # Entferne unerwünschte Tags (Script, Style, Header, Footer, Navigation)
-        for tag in soup(["script", "style", "header", "footer", "nav"]):
-            tag.decompose()
-
-        text = soup.get_text(separator=" ", strip=True)
-        return text
-
-    except requests.RequestException as e:
-        print(f"❌ Fehler beim Laden von {url}: {e}")
-        return None
-    except Exception as e:
-        print(f"❌ Parser-Fehler bei {url}: {e}")
-        return None
+    return fetch_page(create_session(1), url).text
 
 def find_all_links(url, base_domain):
     """
     Sucht alle internen Links auf einer Seite, die zur Domain base_domain gehören.
     """
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/110.0.0.0 Safari/537.36"
-        )
-    }
-    found_links = set()
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-
-        content_type = response.headers.get("Content-Type", "").lower()
-        if "text/html" not in content_type:
-            return found_links
-
-        soup = BeautifulSoup(response.text, "lxml")
-        for link in soup.find_all("a", href=True):
-            absolute_link = urljoin(url, link["href"])
-            parsed_link = urlparse(absolute_link)
-            if parsed_link.netloc == base_domain:
-                found_links.add(absolute_link)
-    except requests.RequestException as e:
-        print(f"❌ Fehler beim Suchen von Links auf {url}: {e}")
-
-    return found_links
-
-def load_uploaded_txts():
-    """
-    Liest alle .txt-Dateien im UPLOADS_DIR und gibt ihren Inhalt als String zurück.
-    """
-    texts = []
-    if not os.path.isdir(UPLOADS_DIR):
-        print(f"Upload-Verzeichnis nicht gefunden: {UPLOADS_DIR}")
-        return ""
-    for filename in os.listdir(UPLOADS_DIR):
-        if filename.lower().endswith(".txt"):
-            file_path = os.path.join(UPLOADS_DIR, filename)
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    file_content = f.read()
-                    print(f"Inhalt von {filename} (erste 100 Zeichen):", file_content[:100])
-                    texts.append(f"Datei: {filename}\n{file_content}\n")
-            except Exception as e:
-                print(f"❌ Fehler beim Lesen von {filename}: {e}")
-    return "\n".join(texts)
-
-def crawl_website(start_url, visited=None):
-    """
-    Crawlt eine Webseite und gibt den gesamten gefundenen Text (aller Unterseiten) als String zurück.
-    Gleichzeitig speichert es den Text in der Datenbank und sammelt den Text, um ihn später in die
-    knowledge.txt zu schreiben.
+    page = fetch_page(create_session(1), url)
+    return {link for link in page.links if urlparse(link).netloc == base_domain}
+
+def app_context():
+    """
+    App-Kontext für die Datenbankzugriffe des Crawls: innerhalb der Web-App (Job, Route) der vorhandene,
+    sonst (crawl.py direkt ausgeführt) ein neuer der über app.create_app eingerichteten App.
+    """
+    if has_app_context():
+        return nullcontext()
+    from app import create_app
+    return create_app().app_context()
+
+def open_knowledge_store():
+    """
+    Öffnet die Wissensbasis der App (instance/knowledge.db), z. B. wenn crawl.py direkt ausgeführt wird.
+    Muss innerhalb eines App-Kontexts aufgerufen werden.
+    """
+    os.makedirs(current_app.instance_path, exist_ok=True)
+    return KnowledgeStore(os.path.join(current_app.instance_path, "knowledge.db"))
+
+def page_document(url, text):
+    """
+    Dokument (Quelle, Text) einer gecrawlten Seite für die Wissensbasis; die URL-Zeile bleibt Teil des Textes,
+    damit sie im Chat-Kontext als Herkunft erscheint.
+    """
+    return "url:" + url, f"URL: {url}\n{text}\n"
+
+@dataclass
+class CrawlReport:
+    """
+    Ergebnis eines (Re-)Crawls: URLs der neuen bzw. geänderten und der entfernten Seiten. Die Wissensbasis
+    ist bereits aktualisiert; nur diese Dokumente müssen neu in den Index.
+    """
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    failed: int = 0
+    resumed: bool = False
+    budget_exhausted: bool = False
+
+@dataclass
+class StoredPage:
+    """
+    Gespeicherter Crawl-Stand einer Seite (Zeile von CrawledPage ohne Seitentext).
+    """
+    url: str
+    timestamp: datetime.datetime
+    etag: str
+    last_modified: str
+    links: str
+    content_hash: str
+
+class DatabaseFrontier:
+    """
+    Frontier in der Tabelle crawl_frontier (Schnittstelle wie crawl_engine.MemoryFrontier).
+    Eine URL bleibt "pending", bis ihre Seite verarbeitet ist; laufende Abrufe merkt sich nur der Prozess.
+    Neue Links und erledigte URLs werden gesammelt und mit write() in die laufende Transaktion geschrieben
+    (siehe PageWriter), damit Frontier und Crawl-Stand gemeinsam festgeschrieben werden. Erledigte, noch
+    nicht geschriebene URLs gelten bis dahin weiter als in Arbeit.
+    Muss innerhalb eines App-Kontexts verwendet werden.
+    """
+
+    def __init__(self, site):
+        self.site = site
+        self._in_flight = set()
+        self._added = {}
+        self._completed = {}
+
+    def _query(self):
+        return CrawlFrontier.query.filter_by(site=self.site)
+
+    def is_new_run(self):
+        return not self._added and self._query().first() is None
+
+    def add(self, urls, depth):
+        for url in urls:
+            self._added.setdefault(url, depth)
+
+    def _take(self, limit):
+        rows = (self._query().filter_by(status="pending").order_by(CrawlFrontier.id)
+                .with_entities(CrawlFrontier.url, CrawlFrontier.depth, CrawlFrontier.attempts)
+                .limit(limit + len(self._in_flight)).all())
+        batch = [(url, depth, attempts) for url, depth, attempts in rows if url not in self._in_flight][:limit]
+        self._in_flight.update(url for url, _, _ in batch)
+        return batch
+
+    def take(self, limit):
+        batch = self._take(limit)
+        if len(batch) < limit and self._added:
+            # Ohne die gesammelten Links liefe der Crawl leer: jetzt schreiben. Erledigte URLs warten
+            # weiter auf ihre Seiten (PageWriter.flush), damit keine als erledigt gilt, die nicht gespeichert ist.
+            self._write_added()
+            db.session.commit()
+            batch += self._take(limit - len(batch))
+        return batch
+
+    def _write_added(self):
+        if self._added:
+            db.session.execute(
+                insert(CrawlFrontier).on_conflict_do_nothing(index_elements=["site", "url"]),
+                [{"site": self.site, "url": url, "depth": depth, "attempts": 1, "status": "pending"}
+                 for url, depth in self._added.items()],
+            )
+            self._added.clear()
+
+    def write(self):
+        """
+        Schreibt gesammelte Links und erledigte URLs (ohne Commit).
+        """
+        self._write_added()
+        if self._completed:
+            db.session.connection().execute(
+                update(CrawlFrontier)
+                .where(CrawlFrontier.site == self.site, CrawlFrontier.url == bindparam("completed_url"))
+                .values(status=bindparam("completed_status")),
+                [{"completed_url": url, "completed_status": status} for url, status in self._completed.items()],
+            )
+        self._in_flight.difference_update(self._completed)
+        self._completed.clear()
+
+    def retry(self, url, depth, attempt):
+        self._query().filter_by(url=url).update({"attempts": attempt})
+        db.session.commit()
+        self._in_flight.discard(url)
+
+    def complete(self, url, failed=False):
+        self._completed[url] = "failed" if failed else "done"
+
+    def processed_count(self):
+        return self._query().filter(CrawlFrontier.status != "pending").count() + len(self._completed)
+
+    def urls_with_status(self, status):
+        return [row.url for row in self._query().filter_by(status=status).with_entities(CrawlFrontier.url)]
+
+    def finish(self):
+        # Crawl vollständig (oder Budget erreicht): der nächste Crawl beginnt wieder bei Start-URL und Sitemap.
+        # Festgeschrieben wird das mit den letzten Seiten (PageWriter.flush).
+        self._added.clear()
+        self._completed.clear()
+        self._query().delete()
+
+class PageWriter:
+    """
+    Sammelt die Ergebnisse eines Crawls und schreibt sie blockweise (alle batch_size Seiten bzw.
+    flush_interval Sekunden): zuerst die Seitentexte in einer Transaktion in die Wissensbasis, danach
+    Crawl-Stand (Upsert nach URL), gelöschte Seiten und Frontier gemeinsam in einer Transaktion.
+    Bricht der Crawl zwischen zwei Blöcken ab, sind die Seiten des offenen Blocks im Frontier noch
+    offen und werden bei der Fortsetzung erneut geladen.
+    """
+
+    def __init__(self, store, frontier, batch_size=None, flush_interval=None):
+        self.store = store
+        self.frontier = frontier
+        self.batch_size = max(1, batch_size or CRAWL_BATCH_SIZE)
+        self.flush_interval = flush_interval if flush_interval is not None else CRAWL_FLUSH_INTERVAL
+        self._pages = {}
+        self._documents = []
+        self._removed = []
+        self._count = 0
+        self._flushed_at = time.monotonic()
+
+    def save(self, row, document=None):
+        """
+        Merkt den Crawl-Stand einer Seite (Spalten von CrawledPage) und optional ihr neues Dokument vor.
+        """
+        self._pages[row["url"]] = row
+        if document is not None:
+            self._documents.append(document)
+        self._page_done()
+
+    def remove(self, url):
+        self._pages.pop(url, None)
+        self._removed.append(url)
+        self._page_done()
+
+    def skip(self):
+        self._page_done()
+
+    def _page_done(self):
+        self._count += 1
+        if self._count >= self.batch_size or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._documents:
+            self.store.put_many(self._documents)
+        if self._removed:
+            self.store.delete_many("url:" + url for url in self._removed)
+        # Alle Anweisungen als executemany: eine vorbereitete Anweisung für den ganzen Block, damit die
+        # Schreibsperre der Datenbank nur kurz gehalten wird
+        if self._removed:
+            db.session.connection().execute(
+                CrawledPage.__table__.delete().where(CrawledPage.url == bindparam("removed_url")),
+                [{"removed_url": url} for url in self._removed],
+            )
+        if self._pages:
+            statement = insert(CrawledPage)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=["url"],
+                set_={column: statement.excluded[column]
+                      for column in ("content", "timestamp", "etag", "last_modified", "content_hash", "links")},
+            ), list(self._pages.values()))
+        self.frontier.write()
+        db.session.commit()
+        self._pages.clear()
+        self._documents.clear()
+        self._removed.clear()
+        self._count = 0
+        self._flushed_at = time.monotonic()
+
+def known_pages_for(origin):
+    """
+    Lädt den Stand des letzten Crawls aller Seiten unterhalb von origin (Schema + Host),
+    nach normalisierter URL. Der Seitentext (content) wird nur für Einträge ohne Hash gelesen.
+    Nur Seiten genau dieses Hosts zählen: "https://shop.de" umfasst weder "https://shop.de.example.com/..."
+    noch "https://shop.dev/...".
+    """
+    expected = urlparse(origin)
+    rows = CrawledPage.query.filter(db.or_(
+        CrawledPage.url == origin, CrawledPage.url.startswith(origin + "/", autoescape=True),
+    )).with_entities(
+        CrawledPage.url, CrawledPage.timestamp, CrawledPage.etag, CrawledPage.last_modified, CrawledPage.links,
+        CrawledPage.content_hash, db.case((CrawledPage.content_hash.is_(None), CrawledPage.content)),
+    )
+    pages = {}
+    for url, timestamp, etag, last_modified, links, stored_hash, legacy_content in rows:
+        parsed = urlparse(url)
+        if (parsed.scheme, parsed.netloc) != (expected.scheme, expected.netloc):
+            continue
+        # Ältere Einträge haben noch keinen Hash gespeichert
+        stored_hash = stored_hash or content_hash(legacy_content or "")
+        pages[normalize_url(url) or url] = StoredPage(url, timestamp, etag, last_modified, links, stored_hash)
+    return pages
+
+def crawl_website(start_url, visited=None, max_pages=None, max_depth=None, store=None, progress=None):
+    """
+    Crawlt eine Webseite inkrementell: bekannte Seiten werden bedingt abgefragt (ETag/Last-Modified),
+    unveränderte Seiten (304 oder gleicher Text-Hash) übersprungen. Der Text neuer und geänderter Seiten
+    wird in der Wissensbasis store gespeichert, der Crawl-Stand in CrawledPage; nicht mehr vorhandene
+    Seiten (404/410) werden aus beiden gelöscht.
+    Der Frontier liegt in der Datenbank; ein abgebrochener Crawl wird beim nächsten Aufruf fortgesetzt.
+    progress(seiten) wird vor jeder Seite mit der Zahl der bisher verarbeiteten Seiten aufgerufen; eine
+    Exception daraus bricht den Crawl ab (der Frontier bleibt dann für die Fortsetzung stehen).
+    Gibt einen CrawlReport zurück.
     """
     if visited is None:
         visited = set()
@@ -133,60 +289,109 @@ def crawl_website(start_url, visited=None):
     parsed_url = urlparse(start_url)
     if not parsed_url.scheme:
         start_url = "https://" + start_url
+    start_url = normalize_url(start_url) or start_url
+    parsed_url = urlparse(start_url)
+    base_domain = parsed_url.netloc
+    max_pages = max_pages or DEFAULT_MAX_PAGES
+    max_depth = max_depth if max_depth is not None else DEFAULT_MAX_DEPTH
 
-    base_domain = urlparse(start_url).netloc
-    to_visit = {start_url}
-    collected_texts = []
+    # Eine Seite wird genau einmal geladen; Parallelität und Pausen regelt der Crawler pro Host
+    crawler = Crawler()
+    report = CrawlReport()
+    started = time.perf_counter()
 
-    while to_visit:
-        url = to_visit.pop()
-        if url in visited:
-            continue
+    with app_context():
+        if store is None:
+            store = open_knowledge_store()
+        frontier = DatabaseFrontier(start_url)
+        report.resumed = not frontier.is_new_run()
+        if report.resumed:
+            print(f"Setze unterbrochenen Crawl von {start_url} fort.")
+        stored = known_pages_for(f"{parsed_url.scheme}://{base_domain}")
+        known = {
+            url: KnownPage(page.etag, page.last_modified, page.content_hash, json.loads(page.links or "[]"))
+            for url, page in stored.items()
+        }
+        if report.resumed:
+            # Vor dem Abbruch verarbeitete Seiten sind evtl. noch nicht im Index angekommen.
+            # Unveränderte Dokumente erkennt der Index-Abgleich am Hash und bettet sie nicht erneut ein.
+            report.changed.extend(stored[url].url for url in frontier.urls_with_status("done") if url in stored)
+            report.removed.extend(url for url in frontier.urls_with_status("failed") if url not in stored)
+        writer = PageWriter(store, frontier)
+        try:
+            for processed, page in enumerate(crawler.crawl(start_url, visited, known, frontier, max_pages, max_depth)):
+                if progress is not None:
+                    progress(processed)
+                existing_page = stored.get(page.url)
+                if page.not_modified:
+                    report.unchanged += 1
+                    writer.skip()
+                    continue
+                if page.status in (404, 410) and existing_page is not None:
+                    report.removed.append(existing_page.url)
+                    writer.remove(existing_page.url)
+                    print(f"🗑️ Entfernt: {page.url}")
+                    continue
+                if not page.text:
+                    report.failed += 1
+                    writer.skip()
+                    continue
+                internal_links = json.dumps(sorted({link for link in page.links if urlparse(link).netloc == base_domain}))
+                url = existing_page.url if existing_page is not None else page.url
+                is_changed = existing_page is None or existing_page.content_hash != page.content_hash
+                row = {
+                    "url": url,
+                    "content": "",
+                    "timestamp": datetime.datetime.utcnow() if is_changed else existing_page.timestamp,
+                    "etag": page.etag,
+                    "last_modified": page.last_modified,
+                    "content_hash": page.content_hash,
+                    "links": internal_links,
+                }
+                if is_changed:
+                    writer.save(row, page_document(url, page.text))
+                    report.changed.append(url)
+                    print(f"✅ Gespeichert: {page.url}")
+                else:
+                    writer.save(row)
+                    report.unchanged += 1
+        finally:
+            # Auch bei einem Abbruch: verarbeitete Seiten festschreiben, der Frontier setzt danach fort
+            writer.flush()
 
-        print(f"🔍 Crawling: {url}")
-        text = get_text_from_page(url)
-        if text:
-            with app.app_context():
-                existing_page = CrawledPage.query.filter_by(url=url).first()
-                if not existing_page:
-                    new_page = CrawledPage(url=url, content=text)
-                    db.session.add(new_page)
-                    db.session.commit()
-                    print(f"✅ Gespeichert: {url}")
-            collected_texts.append(f"URL: {url}\n{text}\n")
-        visited.add(url)
-        new_links = find_all_links(url, base_domain)
-        to_visit.update(new_links - visited)
-        time.sleep(1)
-
-    return "\n".join(collected_texts)
+    report.budget_exhausted = crawler.budget_exhausted
+    elapsed = time.perf_counter() - started
+    for result, count in (("changed", len(report.changed)), ("unchanged", report.unchanged),
+                          ("removed", len(report.removed)), ("failed", report.failed)):
+        CRAWL_PAGES.inc(count, result=result)
+    if crawler.fetched and elapsed > 0:
+        CRAWL_PAGES_PER_SECOND.set(crawler.fetched / elapsed)
+    print(f"Crawl von {start_url}: {len(report.changed)} neu/geändert, {report.unchanged} unverändert, "
+          f"{len(report.removed)} entfernt, {report.failed} fehlgeschlagen"
+          f"{' (Seitenbudget erreicht)' if report.budget_exhausted else ''}.")
+    return report
 
 def update_knowledge():
     """
-    Führt das Crawling durch und liest zusätzlich alle hochgeladenen TXT-Dateien ein.
-    Schreibt dann den gesamten gesammelten Text in die Datei knowledge.txt.
+    Führt das Crawling durch und übernimmt zusätzlich alle hochgeladenen TXT-Dateien in die Wissensbasis.
+    Den Index aktualisiert danach die App (Admin: "Wissensindex aktualisieren").
     """
     # Hier kannst du festlegen, welche Webseiten gecrawlt werden sollen.
     # Beispielsweise: alle in der Datenbank gespeicherten Webseiten oder eine feste URL.
     # Für dieses Beispiel nutzen wir eine feste URL:
     url_to_crawl = "https://example.com"  # <-- hier die gewünschte Start-URL eintragen
 
-    crawled_text = crawl_website(url_to_crawl)
-    uploaded_text = load_uploaded_txts()
-
-    combined_text = crawled_text + "\n" + uploaded_text
-
-    # Schreibe in die knowledge.txt
-    knowledge_file = os.path.abspath("knowledge.txt")
-    print("Schreibe knowledge.txt in:", knowledge_file)
-    try:
-        with open(knowledge_file, "w", encoding="utf-8") as f:
-            f.write(combined_text)
-        print("knowledge.txt wurde erfolgreich geschrieben.")
-    except Exception as e:
-        print("Fehler beim Schreiben von knowledge.txt:", e)
-
-    return combined_text
+    with app_context():
+        store = open_knowledge_store()
+        report = crawl_website(url_to_crawl, store=store)
+    if os.path.isdir(UPLOADS_DIR):
+        filenames = [name for name in os.listdir(UPLOADS_DIR) if name.lower().endswith(".txt")]
+        sync_upload_directory(store, UPLOADS_DIR, filenames)
+    else:
+        print(f"Upload-Verzeichnis nicht gefunden: {UPLOADS_DIR}")
+    stats = store.stats()
+    print(f"Wissensbasis: {stats['documents']} Dokumente, {stats['characters']} Zeichen.")
+    return report
 
 if __name__ == "__main__":
     # Beispiel: Update der Wissensdatenbank (Crawling + TXT-Dateien)
@@ -0,0 +1,451 @@
+import os
+import re
+import gzip
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import List, Optional
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import etree
+
+from metrics import CRAWL_BYTES, CRAWL_FETCH_SECONDS
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/110.0.0.0 Safari/537.36"
+)
+REQUEST_TIMEOUT = 10
+
+# Gleichzeitige Downloads insgesamt sowie Höflichkeitsgrenzen pro Host
+DEFAULT_MAX_WORKERS = int(os.getenv("SHOPBOT_CRAWL_WORKERS", "8"))
+DEFAULT_HOST_CONCURRENCY = int(os.getenv("SHOPBOT_CRAWL_HOST_CONCURRENCY", "4"))
+DEFAULT_HOST_RPS = float(os.getenv("SHOPBOT_CRAWL_HOST_RPS", "4"))
+# Obergrenze für eine vom Server per Retry-After verlangte Pause
+MAX_RETRY_AFTER = 60.0
+
+# Sitemap-Dateien (inkl. Sitemap-Indizes) und daraus übernommene URLs pro Crawl
+MAX_SITEMAPS = 50
+MAX_SITEMAP_URLS = 50000
+SITEMAP_PARSER = etree.XMLParser(resolve_entities=False, no_network=True, recover=True)
+
+# Sichtbarer Text wie bisher mit BeautifulSoup: ohne Script/Style/Header/Footer/Navigation; Texte in
+# <template>, <rt> und <rp> hat BeautifulSoup nie mitgezählt. Der Text direkt hinter einem entfernten
+# Element (tail) bleibt erhalten, genau wie nach decompose().
+REMOVED_TAGS = ("script", "style", "header", "footer", "nav")
+SKIPPED_STRING_CONTAINERS = ("template", "rt", "rp")
+VISIBLE_TEXT = etree.XPath(
+    "//text()[not(" + " or ".join(f"ancestor::{tag}" for tag in REMOVED_TAGS + SKIPPED_STRING_CONTAINERS) + ")]",
+    smart_strings=False,
+)
+LINK_HREFS = etree.XPath("//a/@href", smart_strings=False)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Query-Parameter ohne Einfluss auf den Inhalt (Tracking, Sessions); weitere per SHOPBOT_CRAWL_IGNORE_PARAMS
+IGNORED_QUERY_PARAMS = {
+    "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "ref",
+    "sid", "sessionid", "phpsessid", "jsessionid",
+} | {p.strip().lower() for p in os.getenv("SHOPBOT_CRAWL_IGNORE_PARAMS", "").split(",") if p.strip()}
+
+
+@dataclass
+class FetchedPage:
+    """
+    Ergebnis eines einzelnen Seitenabrufs: sichtbarer Text (None, falls kein HTML oder Fehler) und
+    alle absoluten Links der Seite. not_modified ist gesetzt, wenn der Server per 304 bestätigt hat,
+    dass sich die Seite seit dem letzten Abruf nicht geändert hat; links stammen dann aus dem letzten Abruf.
+    """
+    url: str
+    status: Optional[int] = None
+    text: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    retry_after: Optional[float] = None
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    depth: int = 0
+    size: int = 0
+
+
+@dataclass
+class KnownPage:
+    """
+    Stand einer Seite aus dem letzten Crawl, für bedingte Anfragen (If-None-Match/If-Modified-Since).
+    """
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+
+
+def normalize_url(url):
+    """
+    Vereinheitlicht eine URL, damit dieselbe Seite nur einmal im Frontier landet: Schema und Host klein,
+    Standard-Port und Fragment entfernt, doppelte Schrägstriche zusammengefasst, Tracking-/Session-Parameter
+    entfernt und die übrigen Query-Parameter sortiert. Gibt None für Nicht-HTTP-URLs zurück.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    host = parts.hostname
+    netloc = f"[{host}]" if ":" in host else host
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc += f":{port}"
+    path = re.sub(r"/{2,}", "/", parts.path) or "/"
+    params = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+              if key.lower() not in IGNORED_QUERY_PARAMS and not key.lower().startswith("utm_")]
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(params)), ""))
+
+
+def create_session(pool_size=DEFAULT_MAX_WORKERS):
+    """
+    requests-Session mit Verbindungspool, die sich alle Crawl-Threads teilen (Keep-Alive statt
+    neuer TCP/TLS-Verbindung pro Seite).
+    """
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def extract_text_and_links(html, url):
+    """
+    Parst eine HTML-Seite einmal mit lxml und liefert (sichtbarer Text, Links).
+    Ergebnis identisch zur früheren BeautifulSoup-Variante (decompose + get_text(" ", strip=True)),
+    aber ohne Aufbau eines Python-Objektbaums; Text und Links kommen aus zwei vorkompilierten XPath-Abfragen.
+    Links umfassen auch die in Header/Footer/Navigation, da gerade dort die Verweise auf Unterseiten stehen.
+    """
+    parser = etree.HTMLParser()
+    try:
+        parser.feed(html)
+        root = parser.close()
+    except etree.XMLSyntaxError:
+        # Leeres Dokument
+        return "", []
+    if root is None:
+        return "", []
+    text = " ".join(stripped for stripped in (string.strip() for string in VISIBLE_TEXT(root)) if stripped)
+    return text, [urljoin(url, href) for href in LINK_HREFS(root)]
+
+
+def load_robots(session, origin):
+    """
+    Lädt die robots.txt eines Hosts. Wie bei urllib.robotparser gilt: 401/403 sperrt alles,
+    fehlende Datei oder andere Fehler erlauben alles.
+    """
+    robots = RobotFileParser(origin + "/robots.txt")
+    try:
+        response = session.get(robots.url, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"robots.txt für {origin} nicht erreichbar: {e}")
+        robots.allow_all = True
+        return robots
+    if response.status_code in (401, 403):
+        robots.disallow_all = True
+    elif response.status_code >= 400:
+        robots.allow_all = True
+    else:
+        robots.parse(response.text.splitlines())
+    return robots
+
+
+def robots_delay(robots):
+    """
+    Mindestabstand zwischen zwei Anfragen laut robots.txt (Crawl-delay bzw. Request-rate), sonst None.
+    """
+    delay = robots.crawl_delay(USER_AGENT)
+    rate = robots.request_rate(USER_AGENT)
+    if rate is not None and rate.requests:
+        delay = max(float(delay or 0), rate.seconds / rate.requests)
+    return float(delay) if delay else None
+
+
+def discover_sitemap_urls(session, origin, robots=None):
+    """
+    Liest die Seiten-URLs aus den Sitemaps eines Hosts: aus der robots.txt angegebene Sitemaps bzw.
+    /sitemap.xml, Sitemap-Indizes werden rekursiv verfolgt, gzip-Dateien entpackt.
+    """
+    sitemaps = (robots.site_maps() if robots is not None else None) or [origin + "/sitemap.xml"]
+    queue, seen, urls = deque(sitemaps), set(), []
+    while queue and len(seen) < MAX_SITEMAPS and len(urls) < MAX_SITEMAP_URLS:
+        sitemap_url = queue.popleft()
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        try:
+            response = session.get(sitemap_url, timeout=REQUEST_TIMEOUT)
+            if response.status_code != 200:
+                continue
+            data = response.content
+            if data[:2] == b"\x1f\x8b":
+                data = gzip.decompress(data)
+            root = etree.fromstring(data, parser=SITEMAP_PARSER)
+        except (requests.RequestException, OSError, etree.XMLSyntaxError, ValueError) as e:
+            print(f"❌ Sitemap {sitemap_url} nicht lesbar: {e}")
+            continue
+        if root is None:
+            continue
+        locations = [loc.text.strip() for loc in root.iter("{*}loc") if loc.text and loc.text.strip()]
+        if etree.QName(root).localname == "sitemapindex":
+            queue.extend(locations)
+        else:
+            urls.extend(locations)
+    return urls[:MAX_SITEMAP_URLS]
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_retry_after(value):
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_page(session, url, known=None):
+    """
+    Lädt eine Seite genau einmal und extrahiert daraus Text und Links.
+    Mit known (KnownPage) wird bedingt angefragt; bei 304 entfällt der Download samt Parsen.
+    """
+    page = FetchedPage(url=url)
+    headers = {}
+    if known is not None:
+        if known.etag:
+            headers["If-None-Match"] = known.etag
+        if known.last_modified:
+            headers["If-Modified-Since"] = known.last_modified
+    try:
+        response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        page.status = response.status_code
+        if response.status_code == 304 and known is not None:
+            page.not_modified = True
+            page.etag = known.etag
+            page.last_modified = known.last_modified
+            page.content_hash = known.content_hash
+            page.links = list(known.links)
+            return page
+        if response.status_code in (429, 503):
+            page.retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        response.raise_for_status()
+        page.etag = response.headers.get("ETag")
+        page.last_modified = response.headers.get("Last-Modified")
+
+        # Prüfen, ob es sich um HTML handelt
+        content_type = response.headers.get("Content-Type", "").lower()
+        if "text/html" not in content_type:
+            print(f"❌ Kein HTML-Inhalt für {url} ({content_type})")
+            return page
+
+        page.size = len(response.content)
+        page.text, page.links = extract_text_and_links(response.text, url)
+        page.content_hash = content_hash(page.text)
+    except requests.RequestException as e:
+        print(f"❌ Fehler beim Laden von {url}: {e}")
+        page.error = str(e)
+    except Exception as e:
+        print(f"❌ Parser-Fehler bei {url}: {e}")
+        page.error = str(e)
+    return page
+
+
+class HostThrottle:
+    """
+    Begrenzt pro Host die Zahl gleichzeitiger Anfragen und die Anfragerate.
+    Ersetzt das globale time.sleep(1) nach jeder Seite: fremde Hosts bremsen sich nicht gegenseitig aus.
+    """
+
+    def __init__(self, concurrency=DEFAULT_HOST_CONCURRENCY, requests_per_second=DEFAULT_HOST_RPS):
+        self.concurrency = concurrency
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._next_allowed = {}
+        self._intervals = {}
+
+    def _slot(self, host):
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.concurrency)
+            return self._slots[host]
+
+    def acquire(self, host):
+        self._slot(host).acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = start + self._intervals.get(host, self.interval)
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, host):
+        self._slot(host).release()
+
+    def set_min_interval(self, host, seconds):
+        """
+        Mindestabstand für einen Host anheben (z. B. Crawl-delay aus der robots.txt).
+        """
+        with self._lock:
+            self._intervals[host] = max(self.interval, seconds)
+
+    def penalize(self, host, seconds):
+        """
+        Verschiebt die nächste erlaubte Anfrage an den Host (z. B. nach 429 mit Retry-After).
+        """
+        with self._lock:
+            self._next_allowed[host] = max(self._next_allowed.get(host, 0.0), time.monotonic() + seconds)
+
+
+class MemoryFrontier:
+    """
+    Frontier im Speicher: noch zu ladende URLs mit Tiefe und Versuchszähler sowie alle bereits gesehenen URLs.
+    crawl.DatabaseFrontier bietet dieselbe Schnittstelle mit Persistenz, damit ein Crawl fortgesetzt werden kann.
+    """
+
+    def __init__(self):
+        self._queue = deque()
+        self._seen = set()
+        self._processed = 0
+
+    def is_new_run(self):
+        return not self._seen
+
+    def add(self, urls, depth):
+        for url in urls:
+            if url not in self._seen:
+                self._seen.add(url)
+                self._queue.append((url, depth, 1))
+
+    def take(self, limit):
+        batch = []
+        while self._queue and len(batch) < limit:
+            batch.append(self._queue.popleft())
+        return batch
+
+    def retry(self, url, depth, attempt):
+        self._queue.append((url, depth, attempt))
+
+    def complete(self, url, failed=False):
+        self._processed += 1
+
+    def processed_count(self):
+        return self._processed
+
+    def finish(self):
+        self._queue.clear()
+
+
+class Crawler:
+    """
+    Nebenläufiger Crawler für eine Website: ein Thread-Pool lädt die Seiten, jede Seite wird genau
+    einmal abgerufen und liefert Text und Links. Die Koordination (Frontier, besuchte URLs) läuft im
+    aufrufenden Thread, sodass Ergebnisse dort z. B. direkt in die Datenbank geschrieben werden können.
+    Startpunkte sind die Start-URL und die Sitemaps; robots.txt (Disallow, Crawl-delay) wird beachtet.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, throttle=None, session=None, max_attempts=2,
+                 respect_robots=True, use_sitemaps=True):
+        self.max_workers = max_workers
+        self.throttle = throttle or HostThrottle()
+        self.session = session or create_session(max_workers)
+        self.max_attempts = max_attempts
+        self.respect_robots = respect_robots
+        self.use_sitemaps = use_sitemaps
+        self.fetched = 0
+        self.budget_exhausted = False
+
+    def _fetch(self, url, known):
+        host = urlparse(url).netloc
+        self.throttle.acquire(host)
+        start = time.perf_counter()
+        try:
+            page = fetch_page(self.session, url, known)
+        finally:
+            self.throttle.release(host)
+        CRAWL_FETCH_SECONDS.observe(time.perf_counter() - start)
+        CRAWL_BYTES.inc(page.size)
+        if page.retry_after is not None:
+            self.throttle.penalize(host, page.retry_after)
+        return page
+
+    def crawl(self, start_url, visited=None, known=None, frontier=None, max_pages=None, max_depth=None):
+        """
+        Generator über alle erreichbaren Seiten derselben Domain (FetchedPage), in Abrufreihenfolge.
+        known bildet URLs auf den Stand des letzten Crawls (KnownPage) ab; diese Seiten werden bedingt
+        abgefragt, und ihre gespeicherten Links halten den Crawl auch bei 304 am Laufen.
+        Enthält frontier noch offene URLs eines abgebrochenen Crawls, wird dieser fortgesetzt.
+        max_pages begrenzt die Zahl der geladenen Seiten, max_depth die Link-Tiefe ab den Startpunkten.
+        """
+        visited = set() if visited is None else visited
+        known = known or {}
+        frontier = frontier or MemoryFrontier()
+        start_url = normalize_url(start_url) or start_url
+        parts = urlsplit(start_url)
+        base_domain = parts.netloc
+        origin = f"{parts.scheme}://{base_domain}"
+
+        robots = load_robots(self.session, origin) if self.respect_robots else None
+        if robots is not None:
+            delay = robots_delay(robots)
+            if delay:
+                print(f"robots.txt verlangt {delay:g}s Abstand zwischen Anfragen an {base_domain}.")
+                self.throttle.set_min_interval(base_domain, delay)
+
+        def allowed(url):
+            return (urlsplit(url).netloc == base_domain and url not in visited
+                    and (robots is None or robots.can_fetch(USER_AGENT, url)))
+
+        if frontier.is_new_run():
+            seeds = [start_url]
+            if self.use_sitemaps:
+                seeds.extend(discover_sitemap_urls(self.session, origin, robots))
+            frontier.add([url for url in dict.fromkeys(map(normalize_url, seeds)) if url and allowed(url)], 0)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {}
+            while True:
+                # Etwas mehr Aufträge als Threads, damit kein Thread auf die Koordination wartet
+                limit = self.max_workers * 2 - len(pending)
+                if max_pages is not None:
+                    limit = min(limit, max_pages - frontier.processed_count() - len(pending))
+                for url, depth, attempt in frontier.take(limit) if limit > 0 else []:
+                    pending[pool.submit(self._fetch, url, known.get(url))] = (url, depth, attempt)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth, attempt = pending.pop(future)
+                    page = future.result()
+                    page.depth = depth
+                    self.fetched += 1
+                    if page.retry_after is not None and attempt < self.max_attempts:
+                        # Der Host hat uns ausgebremst: später noch einmal versuchen
+                        frontier.retry(url, depth, attempt + 1)
+                        continue
+                    visited.add(url)
+                    if max_depth is None or depth < max_depth:
+                        links = dict.fromkeys(normalize_url(link) for link in page.links)
+                        frontier.add([link for link in links if link and allowed(link)], depth + 1)
+                    yield page
+                    # Erst nach der Verarbeitung durch den Aufrufer als erledigt markieren
+                    frontier.complete(url, failed=page.error is not None)
+
+        self.budget_exhausted = max_pages is not None and frontier.processed_count() >= max_pages
+        frontier.finish()
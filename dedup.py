@@ -0,0 +1,115 @@
+import re
+import zlib
+
+import numpy as np
+
+from keyword_index import exact_terms
+
+# Jaccard-Ähnlichkeit (über Wort-Shingles), ab der zwei Chunks als Beinahe-Duplikate gelten
+DEFAULT_THRESHOLD = 0.9
+# Anzahl der MinHash-Funktionen (Länge der Signatur) und Wörter pro Shingle
+NUM_PERM = 64
+SHINGLE_SIZE = 3
+# Mindestwahrscheinlichkeit, mit der ein Paar mit genau der Schwellen-Ähnlichkeit per LSH gefunden wird
+LSH_RECALL = 0.95
+SEED = 1
+# Geht in den Index-Hash jedes Dokuments ein: ändert sich die Duplikat-Erkennung, werden alle Dokumente beim
+# nächsten Abgleich neu zerlegt (Embeddings kommen aus dem Cache)
+DEDUP_VERSION = "dedup-v2"
+
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Menge der Wortfolgen der Länge size (kleingeschrieben, ohne Satzzeichen); kürzere Texte als eine Folge.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """
+    MinHash-Signaturen: für jede von num_perm Hashfunktionen (Multiply-Shift über CRC32 der Shingles)
+    das Minimum über alle Shingles eines Texts. Der Anteil gleicher Stellen zweier Signaturen schätzt
+    die Jaccard-Ähnlichkeit ihrer Shingle-Mengen. Mit festem seed sind Signaturen reproduzierbar und
+    können mit dem Index gespeichert werden.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        self.num_perm = num_perm
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text)), dtype=np.uint64)
+        if not hashes.size:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        # Überlauf modulo 2^64 ist Teil des Verfahrens (Multiply-Shift-Hashing)
+        values = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return values.min(axis=0).astype(np.uint32)
+
+
+def lsh_bands(threshold, num_perm=NUM_PERM, recall=LSH_RECALL):
+    """
+    Aufteilung der Signatur in bands Bänder zu je rows Werten: so viele Zeilen pro Band wie möglich
+    (wenig falsche Kandidaten), solange Paare mit Ähnlichkeit threshold mit Wahrscheinlichkeit recall
+    in mindestens einem Band übereinstimmen.
+    """
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= recall:
+            return bands, rows
+    return num_perm, 1
+
+
+class NearDuplicateIndex:
+    """
+    Sucht zu einer MinHash-Signatur einen bereits bekannten Text mit Jaccard-Ähnlichkeit >= threshold
+    (Locality-Sensitive Hashing über Bänder der Signatur, Kandidaten werden über die Signatur geprüft).
+    Texte mit unterschiedlichen exakten Angaben (siehe keyword_index.exact_terms), etwa Varianten einer
+    Produktseite mit anderem Preis oder anderer Artikelnummer, gelten nie als Duplikate: sonst wären der
+    abweichende Preis bzw. die Artikelnummer weder per Vektor- noch per Stichwortsuche auffindbar.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+        self._terms = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, signature, terms=frozenset()):
+        self._signatures[key] = signature
+        self._terms[key] = terms
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(band_key, []).append(key)
+
+    def find(self, signature, terms=frozenset()):
+        """
+        Schlüssel des ähnlichsten bekannten Texts oberhalb der Schwelle mit denselben exakten Angaben terms,
+        sonst None.
+        """
+        best_key, best_similarity = None, self.threshold
+        seen = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            for key in buckets.get(band_key, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if self._terms[key] != terms:
+                    continue
+                similarity = float(np.mean(self._signatures[key] == signature))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+        return best_key
@@ -0,0 +1,187 @@
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Zugriffszeiten (last_access) werden gesammelt und höchstens so oft (Sekunden) geschrieben
+ACCESS_FLUSH_INTERVAL = 2.0
+
+
+def cache_key(text, model):
+    """
+    Inhaltsadresse eines Chunks: SHA-256 über Modellname und Text.
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistenter Embedding-Cache in einer SQLite-Datei, adressiert über den Hash von Chunk-Text und Modell.
+    Bei Überschreiten von max_bytes werden die am längsten nicht mehr genutzten Einträge verdrängt. Die
+    Gesamtgröße der Vektoren wird beim Schreiben mitgezählt (cache_meta), statt sie jedes Mal zu summieren;
+    so bleibt sie auch für mehrere Worker auf derselben Datei stimmig. Lesen schreibt nichts: die Zugriffszeiten
+    der Treffer sammelt der Worker und schreibt sie gesammelt (alle ACCESS_FLUSH_INTERVAL Sekunden, vor dem
+    Verdrängen und beim Schließen).
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Noch nicht geschriebene Zugriffszeiten: Schlüssel -> last_access
+        self._pending_access = {}
+        self._flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " dimension INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        if self._total_bytes_locked() is None:
+            # Bestehende Cache-Dateien einmalig nachzählen
+            self._conn.execute(
+                "INSERT OR IGNORE INTO cache_meta (name, value) "
+                "SELECT 'total_bytes', COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            )
+        self._conn.commit()
+
+    def _total_bytes_locked(self):
+        row = self._conn.execute("SELECT value FROM cache_meta WHERE name = 'total_bytes'").fetchone()
+        return row[0] if row else None
+
+    def _add_bytes_locked(self, delta):
+        self._conn.execute("UPDATE cache_meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+
+    def get_many(self, texts, model):
+        """
+        Liefert für jeden Text das gespeicherte Embedding (float32-Array) oder None.
+        """
+        keys = [cache_key(text, model) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite erlaubt nur eine begrenzte Zahl an Parametern pro Abfrage
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32")
+            if found:
+                now = time.time()
+                self._pending_access.update((key, now) for key in found)
+                if time.monotonic() - self._flushed_at >= ACCESS_FLUSH_INTERVAL:
+                    self._flush_locked()
+                    self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def _flush_locked(self):
+        """
+        Schreibt die gesammelten Zugriffszeiten (ohne commit, das übernimmt der Aufrufer).
+        """
+        self._flushed_at = time.monotonic()
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+            [(last_access, key) for key, last_access in self._pending_access.items()],
+        )
+        self._pending_access = {}
+
+    def put_many(self, texts, model, embeddings):
+        """
+        Speichert Embeddings (Einträge mit None werden übersprungen) und verdrängt danach bei Bedarf alte Einträge.
+        """
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                continue
+            vector = np.asarray(embedding, dtype="float32")
+            key = cache_key(text, model)
+            rows[key] = (key, model, vector.shape[0], vector.tobytes(), now)
+        if not rows:
+            return
+        with self._lock:
+            # Schreibsperre vorab, damit die Größen ersetzter Einträge nicht zwischendurch ein anderer Worker ändert
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Erst die gesammelten Zugriffe, damit die Verdrängung keine gerade genutzten Einträge trifft
+                for key in rows:
+                    self._pending_access.pop(key, None)
+                self._flush_locked()
+                keys = list(rows)
+                replaced = 0
+                for start in range(0, len(keys), 500):
+                    part = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(part))
+                    replaced += self._conn.execute(
+                        f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})", part
+                    ).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, dimension, vector, last_access)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    list(rows.values()),
+                )
+                self._add_bytes_locked(sum(len(row[3]) for row in rows.values()) - replaced)
+                self._evict_locked()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _evict_locked(self):
+        total = self._total_bytes_locked()
+        if total <= self.max_bytes:
+            return
+        # Älteste Einträge löschen, bis der Cache wieder unter der Grenze liegt
+        excess = total - self.max_bytes
+        stale_keys = []
+        freed = 0
+        for key, size in self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale_keys)
+        self._add_bytes_locked(-freed)
+        self.evictions += len(stale_keys)
+        print(f"Embedding-Cache: {len(stale_keys)} Einträge verdrängt ({freed / 1024 / 1024:.1f} MB).")
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size = self._total_bytes_locked()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.commit()
+            self._conn.close()
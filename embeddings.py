@@ -0,0 +1,210 @@
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from metrics import EMBEDDING_BATCH_SECONDS, EMBEDDING_TEXTS
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_DIMENSION = 1536
+
+# Standardwerte für die Batch-Pipeline. Der Embedding-Endpunkt akzeptiert bis zu
+# 2048 Eingaben pro Aufruf; 100 Chunks à ~500 Zeichen bleiben deutlich unter dem Token-Limit.
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 6
+
+
+def retryable_errors():
+    """
+    Fehler, bei denen sich ein erneuter Versuch lohnt (Rate-Limit, überlastete API). openai wird erst
+    beim ersten Embedding-Abruf importiert, nicht schon beim Start der App.
+    """
+    import openai
+
+    return (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.Timeout,
+        openai.error.APIConnectionError,
+    )
+
+
+# --------------------------
+# Embedding-Provider
+# --------------------------
+class OpenAIEmbeddingProvider:
+    """
+    Ruft Embeddings über die OpenAI-API (openai==0.28.0) ab. Ein Aufruf verarbeitet eine ganze Liste von Texten.
+    """
+
+    def __init__(self, model=EMBEDDING_MODEL):
+        self.model = model
+
+    def embed_batch(self, texts):
+        import openai
+
+        response = openai.Embedding.create(input=list(texts), model=self.model)
+        # Die API liefert zu jedem Embedding den Index der Eingabe mit – danach sortieren.
+        data = sorted(response["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+
+class FakeEmbeddingProvider:
+    """
+    Lokaler Ersatz für die Embedding-API (für Tests und Benchmarks ohne Netzwerk).
+    Erzeugt deterministische, normierte Vektoren per Feature-Hashing über Wörter und Zeichen-Trigramme,
+    sodass Texte mit ähnlichem Wortlaut auch ähnliche Vektoren erhalten.
+    Optional lassen sich Latenz pro Aufruf und Rate-Limit-Fehler simulieren.
+    """
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION, latency=0.0, rate_limit_every=0, model="fake-embedding"):
+        self.dimension = dimension
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.model = model
+        self.calls = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    def embed_batch(self, texts):
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_limit_every and call_number % self.rate_limit_every == 0:
+            import openai
+
+            raise openai.error.RateLimitError("Simuliertes Rate-Limit (FakeEmbeddingProvider)")
+        with self._lock:
+            self.texts_embedded += len(texts)
+        return [fake_embedding(text, self.dimension).tolist() for text in texts]
+
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _feature_slot(feature, dimension):
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dimension, 1.0 if (value >> 63) & 1 else -1.0
+
+
+def fake_embedding(text, dimension=EMBEDDING_DIMENSION):
+    """
+    Deterministisches Pseudo-Embedding eines Textes (normiert auf Länge 1).
+    """
+    vector = np.zeros(dimension, dtype="float32")
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        slot, sign = _feature_slot("w:" + token, dimension)
+        vector[slot] += sign * 2.0
+        padded = f"<{token}>"
+        for i in range(len(padded) - 2):
+            slot, sign = _feature_slot("t:" + padded[i:i + 3], dimension)
+            vector[slot] += sign
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def get_embedding_provider():
+    """
+    Wählt den Embedding-Provider. Mit SHOPBOT_EMBEDDINGS=fake wird ohne OpenAI-Zugriff gearbeitet.
+    """
+    if os.getenv("SHOPBOT_EMBEDDINGS", "openai").lower() == "fake":
+        return FakeEmbeddingProvider(latency=float(os.getenv("SHOPBOT_FAKE_EMBEDDING_SECONDS", "0")))
+    return OpenAIEmbeddingProvider()
+
+
+# --------------------------
+# Batch-Pipeline
+# --------------------------
+def _embed_batch_with_retry(provider, texts, max_retries, base_delay, max_delay):
+    attempt = 0
+    retryable = retryable_errors()
+    while True:
+        start = time.perf_counter()
+        try:
+            embeddings = provider.embed_batch(texts)
+            EMBEDDING_BATCH_SECONDS.observe(time.perf_counter() - start, outcome="ok")
+            return embeddings
+        except retryable as e:
+            attempt += 1
+            EMBEDDING_BATCH_SECONDS.observe(time.perf_counter() - start,
+                                            outcome="error" if attempt > max_retries else "retry")
+            if attempt > max_retries:
+                raise
+            # Exponentielles Backoff mit Jitter, damit parallele Batches nicht gleichzeitig erneut anfragen
+            delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+            delay *= 0.5 + random.random() / 2
+            print(f"Rate-Limit/Überlastung beim Embedding ({e}). Neuer Versuch {attempt}/{max_retries} in {delay:.1f}s.")
+            time.sleep(delay)
+        except Exception:
+            EMBEDDING_BATCH_SECONDS.observe(time.perf_counter() - start, outcome="error")
+            raise
+
+
+def embed_texts(texts, provider=None, batch_size=DEFAULT_BATCH_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                max_retries=DEFAULT_MAX_RETRIES, base_delay=1.0, max_delay=30.0, cache=None, progress=None):
+    """
+    Berechnet die Embeddings für eine Liste von Texten in Batches, von denen bis zu max_workers parallel laufen.
+    Das Ergebnis hat dieselbe Reihenfolge wie texts. Für Batches, die auch nach allen Wiederholungen
+    fehlschlagen, steht an den betroffenen Positionen None.
+    Mit einem EmbeddingCache werden nur Texte an die API geschickt, die dort noch nicht hinterlegt sind.
+    progress(abgerufene Texte, fehlende Texte insgesamt) wird nach jedem Batch im aufrufenden Thread
+    aufgerufen; löst es eine Exception aus (z. B. Abbruch eines Jobs), werden die übrigen Batches verworfen.
+    """
+    provider = provider or get_embedding_provider()
+    texts = list(texts)
+    results = cache.get_many(texts, provider.model) if cache is not None else [None] * len(texts)
+    # Nur fehlende Texte abrufen; identische Chunks werden dabei nur einmal angefragt
+    pending = {}
+    for position, (text, cached) in enumerate(zip(texts, results)):
+        if cached is None:
+            pending.setdefault(text, []).append(position)
+    EMBEDDING_TEXTS.inc(len(texts) - sum(len(positions) for positions in pending.values()), source="cache")
+    if not pending:
+        return results
+
+    missing_texts = list(pending)
+    batches = [(start, missing_texts[start:start + batch_size]) for start in range(0, len(missing_texts), batch_size)]
+
+    def run(batch):
+        start, batch_texts = batch
+        try:
+            embeddings = _embed_batch_with_retry(provider, batch_texts, max_retries, base_delay, max_delay)
+        except Exception as e:
+            print(f"Fehler beim Abrufen der Embeddings für {len(batch_texts)} Chunks:", e)
+            return len(batch_texts)
+        EMBEDDING_TEXTS.inc(len(batch_texts), source="api")
+        # Als float32-Arrays weiterreichen wie die Treffer aus dem Cache: eine Python-Liste mit 1536 floats
+        # belegt rund 49 KB, das Array 6 KB
+        embeddings = [np.asarray(embedding, dtype="float32") for embedding in embeddings]
+        if cache is not None:
+            cache.put_many(batch_texts, provider.model, embeddings)
+        for text, embedding in zip(batch_texts, embeddings):
+            for position in pending[text]:
+                results[position] = embedding
+        return len(batch_texts)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        futures = [executor.submit(run, batch) for batch in batches]
+        done = 0
+        try:
+            # Alle Batches müssen abgeschlossen sein, bevor das Ergebnis zurückgegeben wird
+            for future in as_completed(futures):
+                done += future.result()
+                if progress is not None:
+                    progress(done, len(missing_texts))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return results
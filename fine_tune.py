@@ -1,14 +1,31 @@
+import os
 import openai
-from app import app, db, APIKey  # Importiere deine Flask-App und das APIKey-Modell
+from sqlalchemy import create_engine, select
+from models import APIKey, database_uri
 
-# Setze den API-Key aus der Datenbank innerhalb des Anwendungskontexts
-with app.app_context():
-    stored_key = APIKey.query.first()
-    if stored_key:
-        openai.api_key = stored_key.key
-    else:
-        print("Kein API-Key gefunden. Bitte gib einen API-Key in der Admin-Oberfläche ein.")
-        exit(1)
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+
+def stored_api_key():
+    """
+    API-Key aus der Umgebung (OPENAI_API_KEY) oder, wie in der Web-App, der in der Admin-Oberfläche
+    gespeicherte Schlüssel. Liest direkt aus der Datenbank, ohne die Web-App (Index, Caches) zu laden.
+    """
+    if os.getenv("OPENAI_API_KEY"):
+        return os.getenv("OPENAI_API_KEY")
+    engine = create_engine(database_uri(os.getenv("SHOPBOT_INSTANCE_PATH") or INSTANCE_DIR))
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(APIKey.key).order_by(APIKey.id).limit(1)).scalar()
+    except Exception as e:
+        print("API-Key konnte nicht gelesen werden:", e)
+        return None
+    finally:
+        engine.dispose()
+
+openai.api_key = stored_api_key()
+if not openai.api_key:
+    print("Kein API-Key gefunden. Bitte gib einen API-Key in der Admin-Oberfläche ein.")
+    exit(1)
 
 # Trainingsdaten-Datei hochladen
 file_response = openai.File.create(
@@ -0,0 +1,46 @@
+"""
+Gunicorn-Konfiguration der Web-App (wird aus dem Arbeitsverzeichnis automatisch gelesen).
+
+Mit preload_app richtet der Master die App einmal ein (app.create_app: Schema, Übernahme der knowledge.txt,
+gespeicherter Index) und startet erst dann die Worker per Fork. Die Worker teilen sich die Speicherseiten
+des geladenen Index (Copy-on-Write) und beantworten den ersten Chat ohne Import oder Laden des Index.
+Offene SQLite-Verbindungen werden vor dem Fork geschlossen und in jedem Worker neu geöffnet.
+
+Umgebungsvariablen: PORT, WEB_CONCURRENCY (Worker, Standard 4), SHOPBOT_WORKER_CLASS (gevent oder sync),
+SHOPBOT_PRELOAD=0 (jeder Worker richtet die App selbst ein).
+
+Aufruf:
+    gunicorn -c gunicorn.conf.py
+"""
+import os
+
+worker_class = os.getenv("SHOPBOT_WORKER_CLASS", "gevent")
+if worker_class == "gevent":
+    # Vor dem Laden der App patchen: sonst importiert der Master (preload) ssl, threading usw. ungepatcht
+    from gevent import monkey
+
+    monkey.patch_all()
+
+wsgi_app = "app:create_app()"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_connections = 500
+preload_app = os.getenv("SHOPBOT_PRELOAD", "1") != "0"
+
+
+def pre_fork(server, worker):
+    if server.cfg.preload_app:
+        import app as shopbot
+
+        shopbot.close_process_resources()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import app as shopbot
+
+        shopbot.open_process_resources()
+
+
+def post_worker_init(worker):
+    print(f"Worker {worker.pid} bereit.", flush=True)
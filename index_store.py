@@ -0,0 +1,789 @@
+import os
+import json
+import mmap
+import time
+import shutil
+import fcntl
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import faiss
+
+from dedup import NUM_PERM, MinHasher, NearDuplicateIndex
+from keyword_index import KeywordIndex, exact_terms, write_keyword_index
+from ann_index import (DEFAULT_INDEX_TYPE, DEFAULT_VECTOR_STORAGE, apply_search_params, create_index, is_lossy,
+                       normalize_vectors, rebuild_without, rescore, supports_remove, tune_search_params)
+
+# Anzahl der Index-Versionen, die auf der Platte behalten werden (ältere Worker lesen evtl. noch daraus)
+KEEP_VERSIONS = 3
+# Entfernte Chunks bleiben im Builder als Lücke stehen, bis ihr Anteil diesen Wert übersteigt oder gespeichert wird
+COMPACT_FRACTION = 0.25
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.npy"
+SOURCES_FILE = "sources.json"
+SPANS_FILE = "spans.npy"
+HEADINGS_FILE = "headings.json"
+KEYWORDS_FILE = "keywords.db"
+DUPLICATES_FILE = "duplicates.json"
+MINHASH_FILE = "minhash.npy"
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+
+
+class ChunkStore:
+    """
+    Kompakte, memory-gemappte Chunk-Tabelle: alle Chunks UTF-8-kodiert hintereinander in chunks.bin,
+    die Startpositionen in offsets.npy und die (aufsteigend sortierten) Chunk-IDs in ids.npy.
+    Zu jedem Chunk gehören Metadaten: die Quelle (sources.json), der Zeichenbereich im Dokument
+    (spans.npy, -1 wenn unbekannt) und die Überschrift des Abschnitts (headings.json). Beinahe-Duplikate
+    aus anderen Dokumenten werden nicht gespeichert, sondern als weitere Fundstellen (Quelle, Bereich,
+    Überschrift) beim übernommenen Chunk vermerkt (duplicates.json).
+    Verhält sich beim Lesen wie eine Liste von Strings; get() löst eine Chunk-ID auf.
+    """
+
+    def __init__(self, directory):
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(directory, IDS_FILE), mmap_mode="r")
+        with open(os.path.join(directory, SOURCES_FILE), "r", encoding="utf-8") as f:
+            self.sources = json.load(f)
+        # Versionen vor dem strukturierten Chunking haben keine Bereiche und Überschriften
+        spans_path = os.path.join(directory, SPANS_FILE)
+        self.spans = np.load(spans_path, mmap_mode="r") if os.path.exists(spans_path) else None
+        self.headings = None
+        if os.path.exists(os.path.join(directory, HEADINGS_FILE)):
+            with open(os.path.join(directory, HEADINGS_FILE), "r", encoding="utf-8") as f:
+                self.headings = json.load(f)
+        self.duplicates = {}
+        if os.path.exists(os.path.join(directory, DUPLICATES_FILE)):
+            with open(os.path.join(directory, DUPLICATES_FILE), "r", encoding="utf-8") as f:
+                self.duplicates = {int(chunk_id): references for chunk_id, references in json.load(f).items()}
+        self._data = b""
+        with open(os.path.join(directory, CHUNKS_FILE), "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        if position < 0 or position >= len(self):
+            raise IndexError(position)
+        return self._data[int(self.offsets[position]):int(self.offsets[position + 1])].decode("utf-8")
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def position(self, chunk_id):
+        """
+        Position einer Chunk-ID in der Tabelle oder None, wenn es die ID nicht (mehr) gibt.
+        """
+        position = int(np.searchsorted(self.ids, chunk_id))
+        if position < len(self.ids) and self.ids[position] == chunk_id:
+            return position
+        return None
+
+    def positions(self, chunk_ids):
+        """
+        Positionen mehrerer Chunk-IDs auf einmal (-1 für unbekannte IDs).
+        """
+        chunk_ids = np.asarray(chunk_ids, dtype="int64")
+        if not len(self.ids):
+            return np.full(len(chunk_ids), -1, dtype="int64")
+        positions = np.minimum(np.searchsorted(self.ids, chunk_ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == chunk_ids, positions, -1)
+
+    def get(self, chunk_id):
+        position = self.position(chunk_id)
+        return self[position] if position is not None else None
+
+    def span(self, position):
+        if self.spans is None:
+            return (-1, -1)
+        return int(self.spans[position][0]), int(self.spans[position][1])
+
+    def heading(self, position):
+        return self.headings[position] if self.headings is not None else None
+
+    def metadata(self, chunk_id):
+        """
+        Metadaten eines Chunks (Quelle, Zeichenbereich im Dokument, Überschrift und weitere Fundstellen
+        als Beinahe-Duplikat) oder None, wenn es die ID nicht gibt.
+        """
+        position = self.position(chunk_id)
+        if position is None:
+            return None
+        start, end = self.span(position)
+        return {"source": self.sources[position], "start": start, "end": end, "heading": self.heading(position),
+                "duplicates": [{"source": source, "start": start, "end": end, "heading": heading}
+                               for source, start, end, heading in self.duplicates.get(int(chunk_id), [])]}
+
+    @staticmethod
+    def write(directory, ids, sources, chunks, spans=None, headings=None, duplicates=None):
+        offsets = [0]
+        with open(os.path.join(directory, CHUNKS_FILE), "wb") as f:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(os.path.join(directory, OFFSETS_FILE), np.array(offsets, dtype="int64"))
+        np.save(os.path.join(directory, IDS_FILE), np.asarray(ids, dtype="int64"))
+        with open(os.path.join(directory, SOURCES_FILE), "w", encoding="utf-8") as f:
+            json.dump(list(sources), f, ensure_ascii=False)
+        if spans is not None:
+            np.save(os.path.join(directory, SPANS_FILE), np.asarray(spans, dtype="int64").reshape(-1, 2))
+        if headings is not None:
+            with open(os.path.join(directory, HEADINGS_FILE), "w", encoding="utf-8") as f:
+                json.dump(list(headings), f, ensure_ascii=False)
+        if duplicates:
+            with open(os.path.join(directory, DUPLICATES_FILE), "w", encoding="utf-8") as f:
+                json.dump({str(chunk_id): references for chunk_id, references in duplicates.items()}, f,
+                          ensure_ascii=False)
+
+
+class ChunkTexts:
+    """
+    Chunk-Texte eines IndexBuilders in Tabellenreihenfolge: Chunks einer geladenen Version bleiben in deren
+    ChunkStore (memory-gemappt, nur die Position wird gehalten), neu hinzugefügte liegen als Strings vor.
+    Verhält sich beim Lesen wie eine Liste von Strings.
+    """
+
+    def __init__(self, texts=None, store=None):
+        self._store = store
+        self._refs = list(range(len(store))) if store is not None else []
+        self._refs.extend(texts or [])
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __getitem__(self, position):
+        ref = self._refs[position]
+        return self._store[ref] if isinstance(ref, int) else ref
+
+    def __iter__(self):
+        for position in range(len(self._refs)):
+            yield self[position]
+
+    def extend(self, texts):
+        self._refs.extend(texts)
+
+    def keep(self, positions):
+        """
+        Behält nur die Texte an den (aufsteigenden) Positionen.
+        """
+        self._refs = [self._refs[position] for position in positions]
+
+
+class VectorBuffer:
+    """
+    Wachsende float32-Matrix mit einer Zeile pro Chunk (in der Reihenfolge der Chunk-Tabelle). Der Speicher wird
+    vorab reserviert und bei Bedarf verdoppelt, sodass Anhängen nur die neuen Zeilen kopiert.
+    """
+
+    def __init__(self, dimension, vectors=None, capacity=1024):
+        rows = len(vectors) if vectors is not None else 0
+        self._data = np.empty((max(rows, capacity), dimension), dtype="float32")
+        self._count = 0
+        if vectors is not None:
+            self.extend(vectors)
+
+    def __len__(self):
+        return self._count
+
+    def extend(self, vectors):
+        needed = self._count + len(vectors)
+        if needed > len(self._data):
+            grown = np.empty((max(needed, 2 * len(self._data)), self._data.shape[1]), dtype="float32")
+            grown[:self._count] = self._data[:self._count]
+            self._data = grown
+        self._data[self._count:needed] = vectors
+        self._count = needed
+
+    def keep(self, positions):
+        """
+        Behält nur die Zeilen an den (aufsteigenden) Positionen.
+        """
+        kept = self._data[np.asarray(positions, dtype="int64")]
+        self._data[:len(kept)] = kept
+        self._count = len(kept)
+
+    @property
+    def array(self):
+        return self._data[:self._count]
+
+
+class IndexSnapshot:
+    """
+    Ein geladener Index-Stand: FAISS-Index, zugehörige Chunks und Stichwortindex derselben Version.
+    Wird immer als Ganzes ausgetauscht, damit Index und Chunks nie auseinanderlaufen.
+    """
+
+    def __init__(self, version, index, chunks, documents=None, next_id=0, index_type=DEFAULT_INDEX_TYPE,
+                 keywords=None, vectors=None, size_bytes=0):
+        self.version = version
+        self.index = index
+        self.chunks = chunks
+        # Stichwortindex (FTS5) über dieselben Chunk-IDs; None bei Versionen aus der Zeit davor
+        self.keywords = keywords
+        # Quelle (z. B. "url:https://..." oder "upload:datei.txt") -> Hash des indexierten Dokumenttexts
+        self.documents = documents or {}
+        self.next_id = next_id
+        self.index_type = index_type
+        # Exakte, normierte Vektoren in Chunk-Reihenfolge (memory-gemappt), nur bei verlustbehaftetem Index
+        self.vectors = vectors
+        # Größe der Dateien dieser Version: obere Schranke des Speichers, den der Stand belegen kann
+        self.size_bytes = size_bytes
+
+    def search(self, query, k, rescore_candidates=0):
+        """
+        Die k nächsten Chunks zu einem normierten Anfragevektor (1 x d) als (Scores, Chunk-IDs) wie bei
+        faiss. Speichert der Index die Vektoren nur angenähert (float16, int8, ivf_pq), werden
+        max(k, rescore_candidates) Kandidaten geholt und anhand der exakten Vektoren neu bewertet.
+        """
+        if self.vectors is None or not rescore_candidates:
+            return self.index.search(query, k)
+        _, ids = self.index.search(query, max(k, rescore_candidates))
+        return rescore(query, ids[0], self.chunks.positions(ids[0]), self.vectors, k)
+
+
+class IndexBuilder:
+    """
+    Veränderbare Arbeitskopie eines Index-Stands für inkrementelle Updates.
+    Jeder Chunk erhält eine stabile ID und merkt sich Quelle, Zeichenbereich und Überschrift, sodass einzelne Dokumente
+    hinzugefügt oder über remove_ids entfernt werden können, ohne den Rest neu einzubetten.
+    index_type ist der gewünschte Index-Typ (siehe ann_index.INDEX_TYPES); der tatsächlich verwendete
+    Typ kann bei zu wenigen Vektoren einfacher ausfallen. vector_storage legt die Speicherform der Vektoren
+    im Index fest (siehe ann_index.VECTOR_STORAGES); ist sie verlustbehaftet, führt der Builder die exakten
+    Vektoren in vectors mit und speichert sie für die Neubewertung der Treffer (vectors.npy).
+    Beinahe-Duplikate (siehe duplicate_finder) belegen keinen eigenen Vektor, sondern werden per
+    add_duplicate als weitere Fundstelle eines vorhandenen Chunks geführt (duplicates: Chunk-ID ->
+    Liste von [Quelle, Start, Ende, Überschrift]). Je Quelle merkt sich der Builder die IDs ihrer Chunks
+    und der Chunks, auf die ihre Duplikate verweisen, und zu jeder Chunk-ID ihre Position, damit
+    remove_sources nur diese Chunks anfasst. Entfernte Chunks bleiben als Lücke (dead) in den Tabellen
+    stehen und werden erst verdichtet, wenn ihr Anteil COMPACT_FRACTION übersteigt, spätestens beim Speichern.
+    """
+
+    def __init__(self, index=None, ids=None, sources=None, texts=None, documents=None, next_id=0,
+                 index_type=DEFAULT_INDEX_TYPE, actual_index_type=None, search_params=None,
+                 spans=None, headings=None, knowledge_seq=None, base_version=None, duplicates=None,
+                 signatures=None, vector_storage=DEFAULT_VECTOR_STORAGE, vectors=None):
+        self.index = index
+        self.ids = list(ids or [])
+        self.sources = list(sources or [])
+        self.texts = texts if isinstance(texts, ChunkTexts) else ChunkTexts(texts)
+        self.spans = list(spans) if spans is not None else [(-1, -1)] * len(self.ids)
+        self.headings = list(headings) if headings is not None else [None] * len(self.ids)
+        self.duplicates = {chunk_id: list(references) for chunk_id, references in (duplicates or {}).items()}
+        # Quelle -> IDs ihrer Chunks bzw. der Chunks mit einer Duplikat-Fundstelle aus dieser Quelle
+        self._source_ids = {}
+        for chunk_id, source in zip(self.ids, self.sources):
+            self._source_ids.setdefault(source, set()).add(chunk_id)
+        self._reference_ids = {}
+        for chunk_id, references in self.duplicates.items():
+            for reference in references:
+                self._reference_ids.setdefault(reference[0], set()).add(chunk_id)
+        # Chunk-ID -> Position in den Tabellen; Positionen entfernter Chunks bis zum Verdichten
+        self._positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+        self._dead = set()
+        # MinHash-Signaturen der Chunks (None = noch nicht berechnet)
+        self.signatures = list(signatures) if signatures is not None else [None] * len(self.ids)
+        self.documents = dict(documents or {})
+        self.next_id = next_id
+        self.index_type = index_type
+        self.actual_index_type = actual_index_type
+        self.vector_storage = vector_storage
+        self.vectors = vectors
+        self.search_params = dict(search_params or {})
+        # Änderungsnummer der Wissensbasis, deren Stand dieser Index abbildet (siehe KnowledgeStore)
+        self.knowledge_seq = knowledge_seq
+        # Geladene Version; ihr Stichwortindex wird beim Speichern nur um die Änderungen ergänzt
+        self.base_version = base_version
+
+    @classmethod
+    def from_version(cls, base_dir, version=None, index_type=DEFAULT_INDEX_TYPE,
+                     vector_storage=DEFAULT_VECTOR_STORAGE):
+        """
+        Lädt eine gespeicherte Version als veränderbare Kopie (ohne Memory-Mapping, da gemappte
+        Indizes schreibgeschützt sind). Ohne gespeicherte Version entsteht ein leerer Builder vom Typ
+        index_type mit der Speicherform vector_storage.
+        """
+        if version is None:
+            version = current_version(base_dir)
+        if version is None:
+            return cls(index_type=index_type, vector_storage=vector_storage)
+        directory = os.path.join(base_dir, _version_name(version))
+        chunks = ChunkStore(directory)
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = faiss.read_index(os.path.join(directory, INDEX_FILE))
+        search_params = meta.get("search_params", {})
+        apply_search_params(index, search_params)
+        signatures = None
+        minhash_path = os.path.join(directory, MINHASH_FILE)
+        if os.path.exists(minhash_path):
+            signatures = np.load(minhash_path)
+            if signatures.shape != (len(chunks), NUM_PERM):
+                signatures = None
+        vectors = None
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        if os.path.exists(vectors_path):
+            stored = np.load(vectors_path, mmap_mode="r")
+            if stored.shape == (len(chunks), index.d):
+                vectors = VectorBuffer(index.d, stored)
+        return cls(
+            index=index,
+            ids=[int(chunk_id) for chunk_id in chunks.ids],
+            sources=chunks.sources,
+            # Texte bleiben memory-gemappt; gelesen werden nur die, die ein Abgleich wirklich braucht
+            texts=ChunkTexts(store=chunks),
+            spans=[chunks.span(position) for position in range(len(chunks))],
+            headings=chunks.headings,
+            duplicates=chunks.duplicates,
+            signatures=list(signatures) if signatures is not None else None,
+            documents=meta.get("documents", {}),
+            next_id=meta.get("next_id", len(chunks)),
+            # Ältere Versionen ohne Angabe gelten als "unbekannt" und werden beim nächsten Abgleich neu aufgebaut
+            index_type=meta.get("requested_index_type"),
+            actual_index_type=meta.get("index_type"),
+            # Versionen aus der Zeit davor speichern die Vektoren unverändert
+            vector_storage=meta.get("vector_storage", "float32"),
+            vectors=vectors,
+            search_params=search_params,
+            knowledge_seq=meta.get("knowledge_seq"),
+            base_version=version,
+        )
+
+    def source_names(self):
+        """
+        Alle Quellen mit Chunks oder Duplikat-Fundstellen im Index.
+        """
+        return set(self._source_ids) | set(self._reference_ids)
+
+    def remove_source(self, source):
+        return self.remove_sources([source])
+
+    def remove_sources(self, sources):
+        """
+        Entfernt alle Chunks der Quellen aus Index und Chunk-Tabelle. Hat ein Chunk Beinahe-Duplikate in
+        anderen Quellen, wird stattdessen die erste dieser Fundstellen zur Quelle des Chunks (Text und
+        Vektor bleiben, es wird nichts neu eingebettet). Gibt die Anzahl entfernter Chunks und Fundstellen zurück.
+        Angefasst werden nur die Chunks und Fundstellen der Quellen; die Tabellen werden nicht sofort verdichtet
+        (siehe COMPACT_FRACTION), das Entfernen aus dem FAISS-Index selbst kostet je nach Typ O(N).
+        """
+        sources = set(sources)
+        removed = 0
+        # Zuerst die Fundstellen aller Quellen streichen, damit keine davon zur neuen Quelle eines Chunks wird
+        for source in sources:
+            self.documents.pop(source, None)
+            for chunk_id in self._reference_ids.pop(source, ()):
+                if chunk_id not in self.duplicates:
+                    # Schon mit einer anderen der Quellen gestrichen
+                    continue
+                references = [reference for reference in self.duplicates[chunk_id] if reference[0] not in sources]
+                removed += len(self.duplicates[chunk_id]) - len(references)
+                if references:
+                    self.duplicates[chunk_id] = references
+                else:
+                    del self.duplicates[chunk_id]
+        affected = set()
+        for source in sources:
+            affected.update(self._source_ids.pop(source, ()))
+        doomed = []
+        for chunk_id in affected:
+            position = self._positions[chunk_id]
+            references = self.duplicates.pop(chunk_id, None)
+            if not references:
+                doomed.append(chunk_id)
+                del self._positions[chunk_id]
+                self._dead.add(position)
+                continue
+            promoted_source, start, end, heading = references[0]
+            self.sources[position] = promoted_source
+            self.spans[position] = (start, end)
+            self.headings[position] = heading
+            self._source_ids.setdefault(promoted_source, set()).add(chunk_id)
+            if len(references) > 1:
+                self.duplicates[chunk_id] = references[1:]
+            if not any(reference[0] == promoted_source for reference in references[1:]):
+                self._discard_reference(promoted_source, chunk_id)
+            removed += 1
+        if not doomed:
+            return removed
+        if self.index is not None:
+            if supports_remove(self.index):
+                self.index.remove_ids(np.array(doomed, dtype="int64"))
+            else:
+                self.index = rebuild_without(self.index, doomed)
+        if len(self._dead) > COMPACT_FRACTION * len(self.ids):
+            self._compact()
+        return removed + len(doomed)
+
+    def _compact(self):
+        """
+        Schließt die Lücken entfernter Chunks in allen Tabellen.
+        """
+        if not self._dead:
+            return
+        keep = [position for position in range(len(self.ids)) if position not in self._dead]
+        if self.vectors is not None:
+            self.vectors.keep(keep)
+        self.texts.keep(keep)
+        self.ids = [self.ids[i] for i in keep]
+        self.sources = [self.sources[i] for i in keep]
+        self.spans = [self.spans[i] for i in keep]
+        self.headings = [self.headings[i] for i in keep]
+        self.signatures = [self.signatures[i] for i in keep]
+        self._positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+        self._dead = set()
+
+    def _discard_reference(self, source, chunk_id):
+        chunk_ids = self._reference_ids.get(source)
+        if chunk_ids is not None:
+            chunk_ids.discard(chunk_id)
+            if not chunk_ids:
+                del self._reference_ids[source]
+
+    def duplicate_finder(self, threshold, hasher=None):
+        """
+        NearDuplicateIndex über alle Chunks (Schlüssel = Chunk-ID); fehlende Signaturen werden dabei berechnet.
+        """
+        hasher = hasher or MinHasher()
+        finder = NearDuplicateIndex(threshold, hasher.num_perm)
+        for position, chunk_id in enumerate(self.ids):
+            if position in self._dead:
+                continue
+            if self.signatures[position] is None:
+                self.signatures[position] = hasher.signature(self.texts[position])
+            finder.add(chunk_id, self.signatures[position], exact_terms(self.texts[position]))
+        return finder
+
+    def add_duplicate(self, chunk_id, source, chunk):
+        """
+        Vermerkt chunk (aus source) als Beinahe-Duplikat des vorhandenen Chunks chunk_id.
+        """
+        start, end = (-1, -1) if isinstance(chunk, str) else (chunk.start, chunk.end)
+        heading = None if isinstance(chunk, str) else chunk.heading
+        self.duplicates.setdefault(chunk_id, []).append([source, start, end, heading])
+        self._reference_ids.setdefault(source, set()).add(chunk_id)
+
+    def add_chunks(self, source, chunks, embeddings, document_hash=None):
+        """
+        Fügt die Chunks einer Quelle mit neuen, fortlaufenden IDs hinzu.
+        """
+        self.add_documents([(source, chunks, embeddings, document_hash)])
+
+    def add_documents(self, entries, signatures=None):
+        """
+        Fügt mehrere Dokumente (Quelle, Chunks, Embeddings, Dokument-Hash) in einem Schritt hinzu.
+        Chunks sind Strings oder chunking.Chunk-Objekte (mit Zeichenbereich und Überschrift); signatures
+        enthält optional die MinHash-Signaturen aller Chunks in derselben Reihenfolge.
+        Ist noch kein Index vorhanden, wird er mit allen übergebenen Vektoren trainiert und abgestimmt.
+        Gibt die neuen Chunk-IDs zurück.
+        """
+        entries = list(entries)
+        # Alle Vektoren direkt in eine vorab angelegte float32-Matrix schreiben und dort normieren,
+        # statt sie erst in einer Liste zu sammeln und dann (mehrfach) zu kopieren
+        total = sum(len(embeddings) for _, _, embeddings, _ in entries)
+        dimension = next((len(embeddings[0]) for _, _, embeddings, _ in entries if len(embeddings)), 0)
+        matrix = np.empty((total, dimension), dtype="float32")
+        row = 0
+        sources, chunks, spans, headings = [], [], [], []
+        for source, document_chunks, embeddings, document_hash in entries:
+            if document_hash is not None:
+                self.documents[source] = document_hash
+            for chunk in document_chunks:
+                sources.append(source)
+                if isinstance(chunk, str):
+                    chunks.append(chunk)
+                    spans.append((-1, -1))
+                    headings.append(None)
+                else:
+                    chunks.append(chunk.text)
+                    spans.append((chunk.start, chunk.end))
+                    headings.append(chunk.heading)
+            for embedding in embeddings:
+                matrix[row] = embedding
+                row += 1
+        if not chunks:
+            return []
+        embeddings = normalize_vectors(matrix, copy=False)
+        new_ids = np.arange(self.next_id, self.next_id + len(chunks), dtype="int64")
+        created = self.index is None
+        if created:
+            # Beim vollständigen Aufbau wird mit allen Vektoren trainiert
+            self.index, self.actual_index_type = create_index(self.index_type, embeddings, self.vector_storage)
+            if is_lossy(self.actual_index_type, self.vector_storage):
+                self.vectors = VectorBuffer(dimension, capacity=len(embeddings))
+        self.index.add_with_ids(embeddings, new_ids)
+        if self.vectors is not None:
+            self.vectors.extend(embeddings)
+        if created:
+            self.search_params = tune_search_params(self.index, embeddings, new_ids)
+        self.next_id += len(chunks)
+        for chunk_id, source in zip(new_ids, sources):
+            self._positions[int(chunk_id)] = len(self.ids)
+            self.ids.append(int(chunk_id))
+            self._source_ids.setdefault(source, set()).add(int(chunk_id))
+        self.sources.extend(sources)
+        self.texts.extend(chunks)
+        self.spans.extend(spans)
+        self.headings.extend(headings)
+        self.signatures.extend(signatures if signatures is not None else [None] * len(chunks))
+        return [int(chunk_id) for chunk_id in new_ids]
+
+    def save(self, base_dir):
+        # Eine Version wird ohnehin vollständig geschrieben; die Lücken entfernter Chunks fallen dabei weg
+        self._compact()
+        return save_index(base_dir, self.index, self.ids, self.sources, self.texts,
+                          spans=self.spans, headings=self.headings, base_version=self.base_version, documents=self.documents, next_id=self.next_id,
+                          duplicates=self.duplicates, signatures=self.signatures,
+                          vectors=self.vectors.array if self.vectors is not None else None,
+                          index_info={
+                              "duplicates": sum(len(references) for references in self.duplicates.values()),
+                              "index_type": self.actual_index_type,
+                              "requested_index_type": self.index_type,
+                              "vector_storage": self.vector_storage,
+                              "search_params": self.search_params,
+                              "knowledge_seq": self.knowledge_seq,
+                          })
+
+
+def _version_name(version):
+    return f"v{version:06d}"
+
+
+def _list_versions(base_dir):
+    versions = []
+    if os.path.isdir(base_dir):
+        for name in os.listdir(base_dir):
+            if name.startswith("v") and name[1:].isdigit():
+                versions.append(int(name[1:]))
+    return sorted(versions)
+
+
+def current_version(base_dir):
+    """
+    Liefert die aktuell veröffentlichte Index-Version (oder None, wenn noch keine existiert).
+    """
+    try:
+        with open(os.path.join(base_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return int(name[1:]) if name.startswith("v") and name[1:].isdigit() else None
+
+
+@contextmanager
+def build_lock(base_dir, poll_interval=0.1):
+    """
+    Prozessübergreifende Sperre, damit nicht mehrere Gunicorn-Worker gleichzeitig denselben Index bauen.
+    Gewartet wird per Polling mit time.sleep statt blockierendem flock, damit unter gevent nur das
+    wartende Greenlet pausiert und nicht der ganze Worker.
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    with open(os.path.join(base_dir, ".build.lock"), "w") as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(poll_interval)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_index(base_dir, index, ids, sources, chunks, documents=None, next_id=None, index_info=None,
+               spans=None, headings=None, base_version=None, duplicates=None, signatures=None, vectors=None):
+    """
+    Schreibt Index, Chunks und Stichwortindex als neue Version nach base_dir und veröffentlicht sie atomar
+    über die Datei CURRENT. Ist base_version die Version, aus der die Chunks hervorgegangen sind, wird deren
+    Stichwortindex übernommen und nur um die Änderungen ergänzt. Sind alle MinHash-Signaturen bekannt,
+    werden sie für den nächsten Abgleich mitgespeichert, ebenso die exakten Vektoren (vectors, eine Zeile je
+    Chunk) eines verlustbehafteten Index. Gibt die neue Versionsnummer zurück.
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    versions = _list_versions(base_dir)
+    version = (versions[-1] if versions else 0) + 1
+    final_dir = os.path.join(base_dir, _version_name(version))
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+    ChunkStore.write(tmp_dir, ids, sources, chunks, spans, headings, duplicates)
+    if signatures is not None and len(signatures) and all(signature is not None for signature in signatures):
+        np.save(os.path.join(tmp_dir, MINHASH_FILE), np.asarray(signatures, dtype="uint32"))
+    if vectors is not None and len(vectors) == len(ids):
+        np.save(os.path.join(tmp_dir, VECTORS_FILE), np.asarray(vectors, dtype="float32"))
+    base = None
+    base_meta = read_meta(base_dir, base_version) if base_version is not None else None
+    if base_meta is not None:
+        base_directory = os.path.join(base_dir, _version_name(base_version))
+        base = (os.path.join(base_directory, KEYWORDS_FILE), np.load(os.path.join(base_directory, IDS_FILE)),
+                base_meta.get("next_id", 0))
+    write_keyword_index(os.path.join(tmp_dir, KEYWORDS_FILE), ids, chunks, base)
+    meta = {
+        "version": version,
+        "chunks": len(chunks),
+        "created": time.time(),
+        "next_id": next_id if next_id is not None else (max(ids) + 1 if len(ids) else 0),
+        "documents": documents or {},
+    }
+    meta.update(index_info or {})
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.rename(tmp_dir, final_dir)
+
+    # CURRENT erst umstellen, wenn die Version vollständig auf der Platte liegt
+    current_tmp = os.path.join(base_dir, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(_version_name(version))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(base_dir, CURRENT_FILE))
+
+    for old_version in _list_versions(base_dir)[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(base_dir, _version_name(old_version)), ignore_errors=True)
+    return version
+
+
+def has_keyword_index(base_dir, version):
+    return os.path.exists(os.path.join(base_dir, _version_name(version), KEYWORDS_FILE))
+
+
+def read_meta(base_dir, version):
+    """
+    Metadaten (meta.json) einer gespeicherten Version oder None, wenn es sie nicht (mehr) gibt.
+    """
+    try:
+        with open(os.path.join(base_dir, _version_name(version), META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_index(base_dir, version=None):
+    """
+    Lädt eine gespeicherte Index-Version (standardmäßig die aktuelle) memory-gemappt
+    (IVF-basierte Typen; HNSW-Indizes werden vollständig in den RAM gelesen). Die exakten Vektoren
+    eines verlustbehafteten Index werden ebenfalls nur gemappt: die Neubewertung liest wenige Zeilen je Anfrage.
+    Gibt None zurück, wenn keine Version vorhanden ist.
+    """
+    if version is None:
+        version = current_version(base_dir)
+    if version is None:
+        return None
+    directory = os.path.join(base_dir, _version_name(version))
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE), faiss.IO_FLAG_MMAP)
+    with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    apply_search_params(index, meta.get("search_params", {}))
+    keywords_path = os.path.join(directory, KEYWORDS_FILE)
+    keywords = KeywordIndex(keywords_path) if os.path.exists(keywords_path) else None
+    chunks = ChunkStore(directory)
+    vectors = None
+    vectors_path = os.path.join(directory, VECTORS_FILE)
+    if os.path.exists(vectors_path):
+        vectors = np.load(vectors_path, mmap_mode="r")
+        if vectors.shape != (len(chunks), index.d):
+            vectors = None
+    size_bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+    return IndexSnapshot(version, index, chunks, meta.get("documents"), meta.get("next_id", 0),
+                         meta.get("index_type", DEFAULT_INDEX_TYPE), keywords, vectors, size_bytes)
+
+
+class ShardCache:
+    """
+    Geladene Index-Stände mehrerer Shards (ein Index-Verzeichnis je Schlüssel, z. B. je Mandant) in einem
+    Worker. Jeder Shard prüft höchstens alle check_interval Sekunden, ob eine neuere Version veröffentlicht
+    wurde. Übersteigt die Größe aller geladenen Stände max_bytes, werden die am längsten nicht genutzten
+    Shards verworfen (LRU) und bei der nächsten Anfrage neu geladen; der zuletzt genutzte bleibt immer.
+    Laufende Anfragen behalten ihren Stand, auch wenn er inzwischen verdrängt wurde.
+    """
+
+    def __init__(self, max_bytes, check_interval, on_evict=None):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.on_evict = on_evict
+        # Schlüssel -> [Stand oder None, Zeitpunkt der letzten Prüfung]; älteste Nutzung zuerst
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, directory):
+        """
+        Aktiver Stand des Shards key (Index-Verzeichnis directory) oder None, wenn es noch keine Version gibt.
+        """
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+                if time.monotonic() - shard[1] < self.check_interval:
+                    return shard[0]
+        snapshot = shard[0] if shard is not None else None
+        version = current_version(directory)
+        # Auf Gleichheit prüfen, nicht auf "neuer": nach einem Zurücksetzen (z. B. gelöschtes Index-Verzeichnis)
+        # beginnt die Zählung wieder bei 1 und muss trotzdem übernommen werden
+        if version is not None and (snapshot is None or version != snapshot.version):
+            try:
+                return self.publish(key, load_index(directory, version))
+            except Exception as e:
+                print(f"Fehler beim Laden der Index-Version {version} ({key}):", e)
+        return self.publish(key, None)
+
+    def peek(self, key):
+        """
+        Geladener Stand des Shards key ohne Prüfung auf neuere Versionen (None, wenn nicht geladen).
+        """
+        with self._lock:
+            shard = self._shards.get(key)
+            return shard[0] if shard is not None else None
+
+    def publish(self, key, snapshot):
+        """
+        Tauscht den Stand eines Shards atomar aus, sofern snapshot eine andere Version ist (None vermerkt nur
+        die Prüfung), und verdrängt bei Bedarf andere Shards. Gibt den aktiven Stand zurück.
+        """
+        evicted = []
+        with self._lock:
+            shard = self._shards.setdefault(key, [None, 0.0])
+            self._shards.move_to_end(key)
+            if snapshot is not None and (shard[0] is None or snapshot.version != shard[0].version):
+                shard[0] = snapshot
+            shard[1] = time.monotonic()
+            total = self._resident_bytes()
+            for other in list(self._shards):
+                if total <= self.max_bytes or other == key:
+                    break
+                total -= self._size(other)
+                evicted.append(other)
+                del self._shards[other]
+            active = shard[0]
+        for other in evicted:
+            print(f"Index-Shard {other} aus dem Speicher verdrängt.")
+            if self.on_evict is not None:
+                self.on_evict(other)
+        return active
+
+    def stats(self):
+        """
+        Geladene Shards (älteste Nutzung zuerst) als Schlüssel -> (Version, Bytes) und die Summe der Bytes.
+        """
+        with self._lock:
+            shards = {key: (shard[0].version, shard[0].size_bytes)
+                      for key, shard in self._shards.items() if shard[0] is not None}
+            return shards, self._resident_bytes()
+
+    def _size(self, key):
+        snapshot = self._shards[key][0]
+        return snapshot.size_bytes if snapshot is not None else 0
+
+    def _resident_bytes(self):
+        return sum(self._size(key) for key in self._shards)
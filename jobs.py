@@ -0,0 +1,396 @@
+import os
+import time
+import sqlite3
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Gleichzeitig laufende Jobs pro Worker-Prozess (Crawl und Index-Abgleich können parallel laufen)
+DEFAULT_MAX_WORKERS = int(os.getenv("SHOPBOT_JOB_WORKERS", "2"))
+# Lebenszeichen laufender und wartender Jobs; ohne Lebenszeichen gilt ein Job als verwaist
+HEARTBEAT_INTERVAL = 10.0
+STALE_AFTER = 60.0
+# Fortschritt wird höchstens so oft geschrieben (Sekunden); dabei wird auch ein Abbruch erkannt
+PROGRESS_INTERVAL = 1.0
+# Wartezeit zwischen zwei Startversuchen, solange ein Job derselben Art noch läuft
+POLL_INTERVAL = 1.0
+# So oft sieht der Verteiler nach neu angeforderten Jobs dieses Prozesses (nur im Speicher, ohne Datenbank)
+DISPATCH_INTERVAL = 0.1
+# So viele abgeschlossene Jobs bleiben für die Anzeige erhalten
+HISTORY_SIZE = 100
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def _native(module, name):
+    """
+    Das ursprüngliche Objekt der Standardbibliothek (z. B. _thread.start_new_thread, time.sleep), auch wenn der
+    gevent-Worker (monkey.patch_all, siehe gunicorn.conf.py) es durch eine Greenlet-Variante ersetzt hat.
+    """
+    if _gevent_patched():
+        from gevent import monkey
+
+        return monkey.get_original(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+def _native_executor(max_workers):
+    """
+    Thread-Pool aus echten Betriebssystem-Threads. Unter gevent wären die Threads des normalen
+    ThreadPoolExecutor Greenlets im einzigen Thread des Workers: ein rechenintensiver Job (Chunking, MinHash,
+    FAISS-Training) hielte dann alle Chat-Anfragen dieses Workers für seine gesamte Dauer an.
+    """
+    if _gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shopbot-job")
+
+
+class JobCancelled(Exception):
+    """
+    Wird im Job ausgelöst (per progress() oder check_cancelled()), wenn ein Abbruch angefordert wurde.
+    """
+
+
+class Job:
+    """
+    Sicht eines laufenden Jobs auf sich selbst: Fortschritt melden und auf Abbruch prüfen.
+    """
+
+    def __init__(self, runner, job_id, kind):
+        self.runner = runner
+        self.id = job_id
+        self.kind = kind
+        self.last_progress = None
+        self._written_at = 0.0
+
+    def progress(self, done, total=None, message=None):
+        """
+        Meldet den Fortschritt (z. B. verarbeitete Seiten, eingebettete Chunks). Wird höchstens alle
+        PROGRESS_INTERVAL Sekunden gespeichert; löst JobCancelled aus, wenn der Job abgebrochen werden soll.
+        """
+        self.last_progress = (done, total, message)
+        now = time.monotonic()
+        if now - self._written_at < PROGRESS_INTERVAL:
+            return
+        self._written_at = now
+        if self.runner._update_progress(self.id, done, total, message):
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        if self.runner._cancel_requested(self.id):
+            raise JobCancelled()
+
+
+class JobRunner:
+    """
+    Hintergrund-Jobs (Crawls, Index-Aktualisierungen) mit persistenter Job-Tabelle in einer SQLite-Datei,
+    die sich alle Worker teilen.
+
+    Je Job-Art läuft höchstens ein Job, und höchstens einer wartet (eindeutige Teilindizes in der Datenbank,
+    gilt also auch über Worker-Prozesse hinweg). Wer einen Job anfordert, während schon einer wartet, erhält
+    diesen zurück: Der wartende Job startet erst nach dem laufenden und sieht damit auch die neue Änderung.
+    Wartende Jobs belegen keinen Platz im Pool: ein Verteiler (unter gevent ein Greenlet) startet sie, sobald
+    die Datenbank sie freigibt, und erst dann kommen sie in den begrenzten Pool echter Threads des anfordernden
+    Prozesses (auch unter gevent), optional innerhalb eines Kontexts (z. B. app.app_context). Der Rückgabewert
+    der Job-Funktion wird als Meldung gespeichert. Auch das Lebenszeichen kommt aus einem echten Thread, damit
+    ein beschäftigter Worker es nicht aufhält und andere Worker einen laufenden Job nicht für verwaist halten.
+    Unter gevent greifen nur echte Threads auf die Datenbank zu; Greenlets geben ihre Zugriffe an den
+    Thread-Pool des Hubs ab, damit eine gesperrte SQLite-Datei (bis zu 30 s) nicht den ganzen Worker anhält.
+    """
+
+    def __init__(self, path, max_workers=DEFAULT_MAX_WORKERS, context=None):
+        self.path = path
+        self.context = context
+        self._executor = _native_executor(max_workers)
+        self._owned = set()
+        # Wartende Jobs dieses Prozesses: ID -> [Art, Funktion, Argumente, nächster Startversuch]
+        self._pending = {}
+        self._heartbeat = None
+        self._dispatcher = None
+        self._closed = False
+        # Datenbank-Sperre: nur echte Threads halten sie (siehe _offload), Greenlets können sie nicht blockieren
+        self._lock = _native("threading", "Lock")()
+        # Schützt nur _owned, _pending und _dispatcher; wird nie während eines Datenbankzugriffs gehalten
+        self._state_lock = _native("threading", "Lock")()
+        # Thread des gevent-Hubs (der Prozess, der den JobRunner anlegt), sonst None
+        self._hub_thread = _native("_thread", "get_ident")() if _gevent_patched() else None
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " label TEXT,"
+            " status TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " started REAL,"
+            " finished REAL,"
+            " heartbeat REAL NOT NULL,"
+            " progress_done INTEGER,"
+            " progress_total INTEGER,"
+            " message TEXT,"
+            " error TEXT,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0)"
+        )
+        for status in ACTIVE_STATUSES:
+            self._conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_{status} ON jobs (kind) WHERE status = '{status}'"
+            )
+        self._conn.commit()
+
+    def submit(self, kind, target, *args, label=None, queue_behind=True):
+        """
+        Fordert einen Job der Art kind an; target(job, *args) läuft im Hintergrund.
+        Mit queue_behind=False wird kein Job hinter einem laufenden eingeplant (z. B. ein zweiter Crawl direkt
+        nach dem ersten); dann zählt auch der laufende Job als vorhanden.
+        Gibt (Job-ID, True) zurück, oder (ID des bereits wartenden bzw. laufenden Jobs, False).
+        """
+        job_id, created = self._offload(self._insert, kind, label, queue_behind)
+        if created:
+            with self._state_lock:
+                self._owned.add(job_id)
+                self._pending[job_id] = [kind, target, args, 0.0]
+            self._start_heartbeat()
+            self._start_dispatcher()
+        return job_id, created
+
+    def _insert(self, kind, label, queue_behind):
+        now = time.time()
+        with self._lock:
+            self._reap_stale(now)
+            if not queue_behind:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE kind = ? AND status IN ('queued', 'running') ORDER BY id", (kind,)
+                ).fetchone()
+                if row is not None:
+                    return row[0], False
+            try:
+                job_id = self._conn.execute(
+                    "INSERT INTO jobs (kind, label, status, created, heartbeat) VALUES (?, ?, 'queued', ?, ?)",
+                    (kind, label, now, now),
+                ).lastrowid
+                self._conn.execute(
+                    "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND id NOT IN"
+                    " (SELECT id FROM jobs ORDER BY id DESC LIMIT ?)", (HISTORY_SIZE,),
+                )
+                self._conn.commit()
+            except sqlite3.IntegrityError:
+                self._conn.rollback()
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE kind = ? AND status = 'queued'", (kind,)
+                ).fetchone()
+                return row[0], False
+        return job_id, True
+
+    def cancel(self, job_id):
+        """
+        Fordert den Abbruch an. Ein wartender Job wird sofort beendet, ein laufender beim nächsten
+        Fortschritt. Gibt False zurück, wenn der Job nicht (mehr) aktiv ist.
+        """
+        return self._offload(self._cancel, job_id)
+
+    def _cancel(self, job_id):
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def get(self, job_id):
+        rows = self._offload(self._select_locked, "WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def recent(self, limit=20):
+        """
+        Die letzten Jobs (neueste zuerst) als Dictionaries.
+        """
+        return self._offload(self._select_locked, "ORDER BY id DESC LIMIT ?", (limit,), reap=True)
+
+    def active(self, kind=None):
+        if kind is None:
+            return self._offload(self._select_locked, "WHERE status IN ('queued', 'running') ORDER BY id")
+        return self._offload(self._select_locked, "WHERE status IN ('queued', 'running') AND kind = ? ORDER BY id",
+                             (kind,))
+
+    def _select_locked(self, clause, params=(), reap=False):
+        with self._lock:
+            if reap:
+                self._reap_stale(time.time())
+            return self._select(clause, params)
+
+    def _offload(self, function, *args, **kwargs):
+        """
+        Führt einen Datenbankzugriff aus; im Hub-Thread von gevent in einem echten Thread des Hub-Pools,
+        während das aufrufende Greenlet wartet und andere Anfragen weiterlaufen.
+        """
+        if self._hub_thread is not None and _native("_thread", "get_ident")() == self._hub_thread:
+            from gevent import get_hub
+
+            return get_hub().threadpool.apply(function, args, kwargs)
+        return function(*args, **kwargs)
+
+    def _select(self, clause, params=()):
+        cursor = self._conn.execute(f"SELECT * FROM jobs {clause}", params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        """
+        Wartet auf die laufenden Jobs dieses Prozesses und schließt die Datenbankverbindung. Noch wartende
+        Jobs gelten als fehlgeschlagen (wie bei einem beendeten Worker), damit sie neu angefordert werden können.
+        """
+        self._closed = True
+        # Der Verteiler könnte sonst noch einen Job starten und an den schon beendeten Pool geben
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        with self._state_lock:
+            abandoned = list(self._pending)
+            self._pending.clear()
+            self._owned.difference_update(abandoned)
+        with self._lock:
+            if abandoned:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished = ?, error = 'Worker-Prozess beendet'"
+                    f" WHERE status = 'queued' AND id IN ({','.join('?' * len(abandoned))})",
+                    [time.time()] + abandoned,
+                )
+                self._conn.commit()
+            self._conn.close()
+
+    def _reap_stale(self, now):
+        # Jobs eines beendeten Worker-Prozesses (Absturz, Neustart) würden ihre Art sonst für immer blockieren
+        if self._conn.execute(
+            "UPDATE jobs SET status = 'failed', finished = ?, error = 'Worker-Prozess beendet'"
+            " WHERE status IN ('queued', 'running') AND heartbeat < ?", (now, now - STALE_AFTER),
+        ).rowcount:
+            self._conn.commit()
+
+    def _start_heartbeat(self):
+        with self._state_lock:
+            if self._heartbeat is None:
+                # threading.Thread startet unter gevent auch in der Originalklasse ein Greenlet
+                self._heartbeat = _native("_thread", "start_new_thread")(self._beat, ())
+
+    def _start_dispatcher(self):
+        # Unter gevent ein Greenlet im Hub-Thread (threading ist gepatcht), sonst ein normaler Thread. Der erste
+        # Job eines Prozesses wird immer aus einer Anfrage angefordert, nie aus einem Job-Thread
+        with self._state_lock:
+            if self._dispatcher is not None:
+                return
+            self._dispatcher = threading.Thread(target=self._dispatch, name="shopbot-job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        """
+        Startet wartende Jobs dieses Prozesses, sobald die Datenbank sie freigibt (siehe _claim), und reicht nur
+        gestartete Jobs an den Pool weiter.
+        """
+        while not self._closed:
+            now = time.monotonic()
+            with self._state_lock:
+                due = [(job_id, entry) for job_id, entry in self._pending.items() if entry[3] <= now]
+            for job_id, (kind, target, args, _) in due:
+                claimed = self._offload(self._claim, job_id)
+                with self._state_lock:
+                    if claimed is None:
+                        self._pending[job_id][3] = now + POLL_INTERVAL
+                        continue
+                    del self._pending[job_id]
+                    if not claimed:
+                        self._owned.discard(job_id)
+                        continue
+                self._executor.submit(self._run, job_id, kind, target, args)
+            time.sleep(DISPATCH_INTERVAL)
+
+    def _beat(self):
+        sleep = _native("time", "sleep")
+        while True:
+            sleep(HEARTBEAT_INTERVAL)
+            with self._state_lock:
+                owned = list(self._owned)
+            with self._lock:
+                if owned:
+                    self._conn.execute(
+                        f"UPDATE jobs SET heartbeat = ? WHERE id IN ({','.join('?' * len(owned))})",
+                        [time.time()] + owned,
+                    )
+                    self._conn.commit()
+
+    def _claim(self, job_id):
+        """
+        Versucht, den wartenden Job zu starten. Gibt True zurück, wenn er läuft, False, wenn er nicht mehr
+        wartet (abgebrochen, verwaist), und None, solange noch ein Job derselben Art läuft.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, heartbeat = ? WHERE id = ? AND status = 'queued'",
+                    (now, now, job_id),
+                )
+                self._conn.commit()
+            except sqlite3.IntegrityError:
+                self._conn.rollback()
+                return None
+        return cursor.rowcount > 0
+
+    def _finish(self, job, status, message=None, error=None):
+        # Der letzte Fortschritt wurde wegen PROGRESS_INTERVAL evtl. noch nicht gespeichert
+        done, total, _ = job.last_progress or (None, None, None)
+        with self._state_lock:
+            self._owned.discard(job.id)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, message = COALESCE(?, message), error = ?,"
+                " progress_done = COALESCE(?, progress_done), progress_total = COALESCE(?, progress_total)"
+                " WHERE id = ?", (status, time.time(), message, error, done, total, job.id),
+            )
+            self._conn.commit()
+
+    def _update_progress(self, job_id, done, total, message):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress_done = ?, progress_total = ?, message = COALESCE(?, message),"
+                " heartbeat = ? WHERE id = ?", (done, total, message, time.time(), job_id),
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _cancel_requested(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _run(self, job_id, kind, target, args):
+        job = Job(self, job_id, kind)
+        try:
+            if self.context is not None:
+                with self.context():
+                    message = target(job, *args)
+            else:
+                message = target(job, *args)
+        except JobCancelled:
+            print(f"Job #{job_id} ({kind}) abgebrochen.")
+            self._finish(job, "cancelled")
+        except Exception as e:
+            print(f"Job #{job_id} ({kind}) fehlgeschlagen:", e)
+            self._finish(job, "failed", error=str(e))
+        else:
+            self._finish(job, "done", message=message)
@@ -0,0 +1,121 @@
+import os
+import re
+import shutil
+import sqlite3
+import threading
+
+# Tokenizer der Volltextsuche: Unicode-Wörter, Umlaute/Akzente werden beim Vergleich ignoriert
+TOKENIZER = "unicode61 remove_diacritics 2"
+# Konstante der Reciprocal-Rank-Fusion (üblicher Wert aus der Literatur)
+DEFAULT_RRF_K = 60
+
+# Suchbegriff: Wort, auch mit Bindestrich, Punkt oder Schrägstrich verbunden ("AB-1234", "3.5", "Lerchenstr")
+_TERM = re.compile(r"\w+(?:[-./]\w+)*")
+# Exakte Angaben, bei denen ein Embedding wenig hilft: Zahlen, Artikelnummern, Codes in Großbuchstaben
+_EXACT_TERM = re.compile(r"\w*\d\w*|[A-ZÄÖÜ]{2,}\w*|\w+[-/]\w+")
+
+
+def match_expression(query):
+    """
+    Übersetzt eine Nutzerfrage in einen sicheren FTS5-Ausdruck: jeder Begriff als Phrase in
+    Anführungszeichen, verknüpft mit OR (die Gewichtung übernimmt BM25). None, wenn kein Begriff bleibt.
+    """
+    terms = []
+    for term in _TERM.findall(query):
+        phrase = '"' + term.replace('"', '""') + '"'
+        if phrase not in terms:
+            terms.append(phrase)
+    return " OR ".join(terms) if terms else None
+
+
+def exact_terms(text):
+    """
+    Die exakten Angaben eines Texts (Zahlen, Preise, Artikelnummern, Codes) als Menge.
+    """
+    return frozenset(term for term in _TERM.findall(text) if _EXACT_TERM.fullmatch(term))
+
+
+def is_lexical_query(query, max_terms=4):
+    """
+    Ob eine Frage im Wesentlichen aus exakten Angaben besteht (z. B. "Lerchenstr. 40", "Artikel AB-1234"):
+    höchstens max_terms Begriffe, davon mindestens einer eine Zahl, ein Code oder eine Artikelnummer.
+    Für solche Fragen genügt die Stichwortsuche; das Embedding kann entfallen.
+    """
+    terms = _TERM.findall(query)
+    return 0 < len(terms) <= max_terms and any(_EXACT_TERM.fullmatch(term) for term in terms)
+
+
+def reciprocal_rank_fusion(rankings, k=DEFAULT_RRF_K, limit=None):
+    """
+    Führt mehrere Trefferlisten (jeweils Chunk-IDs, bester zuerst) per Reciprocal-Rank-Fusion zusammen:
+    score(id) = Summe über alle Listen von 1 / (k + Rang). Gibt die IDs nach absteigendem Score zurück.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return fused[:limit] if limit is not None else fused
+
+
+def write_keyword_index(path, ids, texts, base=None):
+    """
+    Schreibt den Stichwortindex (SQLite FTS5, rowid = Chunk-ID) einer Index-Version nach path.
+    base = (Pfad des Stichwortindex der Vorversion, deren Chunk-IDs, deren next_id): dann wird die Vorversion
+    kopiert und nur um entfernte Chunks bereinigt und um neue Chunks (ID >= next_id) ergänzt.
+    """
+    incremental = base is not None and os.path.exists(base[0])
+    if incremental:
+        base_path, base_ids, base_next_id = base
+        shutil.copyfile(base_path, path)
+        conn = sqlite3.connect(path)
+        keep = set(ids)
+        conn.executemany("DELETE FROM chunks WHERE rowid = ?",
+                         [(int(chunk_id),) for chunk_id in base_ids if int(chunk_id) not in keep])
+    else:
+        base_next_id = 0
+        conn = sqlite3.connect(path)
+        conn.execute(f"CREATE VIRTUAL TABLE chunks USING fts5(text, tokenize='{TOKENIZER}')")
+    conn.executemany("INSERT INTO chunks (rowid, text) VALUES (?, ?)",
+                     ((int(chunk_id), texts[position]) for position, chunk_id in enumerate(ids)
+                      if chunk_id >= base_next_id))
+    if not incremental:
+        conn.execute("INSERT INTO chunks (chunks) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+
+class KeywordIndex:
+    """
+    Lesezugriff auf den Stichwortindex einer veröffentlichten Index-Version. Die Datei wird nach dem
+    Veröffentlichen nicht mehr verändert und daher als unveränderlich geöffnet (keine Sperren).
+    Jeder Prozess öffnet eine eigene Verbindung; ein im Gunicorn-Master geladener Index (--preload) kann so
+    nach dem Fork von allen Workern genutzt werden.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._connect()
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    def search(self, query, k):
+        """
+        BM25-Suche: liefert bis zu k Paare (Chunk-ID, Score), bester Treffer zuerst (kleinerer Score = besser).
+        """
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT rowid, bm25(chunks) AS score FROM chunks WHERE chunks MATCH ? ORDER BY score LIMIT ?",
+                (expression, k),
+            ).fetchall()
+        return [(int(chunk_id), score) for chunk_id, score in rows]
@@ -0,0 +1,276 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Dokumente werden beim Durchlaufen in Blöcken dieser Größe gelesen
+DEFAULT_BATCH_SIZE = 100
+
+SECTION_PREFIXES = {"URL: ": "url:", "Datei: ": "file:"}
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_sections(lines):
+    """
+    Zerlegt den Inhalt einer knowledge.txt (String oder zeilenweise lesbare Datei) in Dokumente
+    (Quelle, Text). Jeder Abschnitt, der mit "URL: ..." oder "Datei: ..." beginnt, ist ein eigenes
+    Dokument; Text davor gehört zur Quelle "knowledge.txt".
+    """
+    source, section = "knowledge.txt", []
+    for line in lines.splitlines() if isinstance(lines, str) else lines:
+        line = line.rstrip("\r\n")
+        prefix = next((prefix for prefix in SECTION_PREFIXES if line.startswith(prefix)), None)
+        if prefix is not None:
+            if "".join(section).strip():
+                yield source, "\n".join(section)
+            source, section = SECTION_PREFIXES[prefix] + line.split(": ", 1)[1].strip(), []
+        section.append(line)
+    if "".join(section).strip():
+        yield source, "\n".join(section)
+
+
+class KnowledgeStore:
+    """
+    Wissensbasis als SQLite-Datei mit einer Zeile pro Dokument (gecrawlte Seite, hochgeladene Datei, ...).
+    Jede Zeile hält Quelle (z. B. "url:https://..." oder "upload:datei.txt"), Text, Inhalts-Hash,
+    Änderungszeit und eine fortlaufende Änderungsnummer (seq). Gelöschte Dokumente bleiben als
+    Grabstein ohne Text stehen, damit changes_since() auch Löschungen meldet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " source TEXT PRIMARY KEY,"
+            " content TEXT,"
+            " content_hash TEXT,"
+            " modified REAL NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_seq ON documents (seq)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def _meta(self, name, default=None):
+        row = self._conn.execute("SELECT value FROM store_meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO store_meta (name, value) VALUES (?, ?)", (name, str(value)))
+
+    def _next_seq(self):
+        seq = int(self._meta("last_seq", 0)) + 1
+        self._set_meta("last_seq", seq)
+        return seq
+
+    def last_seq(self):
+        """
+        Änderungsnummer des letzten Schreibvorgangs; ein Index merkt sie sich als Stand seiner Daten.
+        """
+        with self._lock:
+            return int(self._meta("last_seq", 0))
+
+    def put_many(self, documents, modified=None):
+        """
+        Speichert Dokumente (Quelle, Text) in einer Transaktion. Unveränderte Texte (gleicher Hash)
+        werden nicht neu geschrieben. Gibt die Quellen der neuen bzw. geänderten Dokumente zurück.
+        """
+        changed = []
+        with self._lock:
+            for source, text in documents:
+                text_hash = content_hash(text)
+                row = self._conn.execute(
+                    "SELECT content_hash, deleted FROM documents WHERE source = ?", (source,)
+                ).fetchone()
+                if row is not None and row[0] == text_hash and not row[1]:
+                    if modified is not None:
+                        # Gleicher Inhalt, neue Änderungszeit (z. B. Datei neu gespeichert): kein neuer Stand
+                        self._conn.execute("UPDATE documents SET modified = ? WHERE source = ?", (modified, source))
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (source, content, content_hash, modified, seq, deleted)"
+                    " VALUES (?, ?, ?, ?, ?, 0)",
+                    (source, text, text_hash, modified or time.time(), self._next_seq()),
+                )
+                changed.append(source)
+            self._conn.commit()
+        return changed
+
+    def put(self, source, text, modified=None):
+        """
+        Speichert ein Dokument; gibt True zurück, wenn es neu ist oder sich geändert hat.
+        """
+        return bool(self.put_many([(source, text)], modified))
+
+    def delete_many(self, sources):
+        """
+        Löscht Dokumente (als Grabstein). Gibt die Anzahl tatsächlich gelöschter Dokumente zurück.
+        """
+        deleted = 0
+        with self._lock:
+            for source in sources:
+                if self._conn.execute(
+                    "SELECT 1 FROM documents WHERE source = ? AND deleted = 0", (source,)
+                ).fetchone() is None:
+                    continue
+                self._conn.execute(
+                    "UPDATE documents SET content = NULL, content_hash = NULL, modified = ?, seq = ?, deleted = 1"
+                    " WHERE source = ?",
+                    (time.time(), self._next_seq(), source),
+                )
+                deleted += 1
+            self._conn.commit()
+        return deleted
+
+    def delete(self, source):
+        return self.delete_many([source]) > 0
+
+    def sources(self, prefix=""):
+        """
+        Quellen aller vorhandenen Dokumente, optional nur mit dem angegebenen Präfix (z. B. "url:").
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source FROM documents WHERE deleted = 0 AND source >= ? AND source < ? ORDER BY source",
+                (prefix, prefix + "\uffff"),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, source):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM documents WHERE source = ? AND deleted = 0", (source,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def previews(self, sources, length):
+        """
+        Quelle -> die ersten length Zeichen des Texts, für mehrere Quellen mit einer Abfrage
+        (ohne die vollständigen Texte zu lesen).
+        """
+        sources = list(sources)
+        if not sources:
+            return {}
+        with self._lock:
+            return dict(self._conn.execute(
+                f"SELECT source, substr(content, 1, ?) FROM documents"
+                f" WHERE deleted = 0 AND source IN ({','.join('?' * len(sources))})",
+                [length] + sources,
+            ))
+
+    def hashes(self):
+        """
+        Quelle -> Inhalts-Hash aller vorhandenen Dokumente (ohne die Texte zu lesen).
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT source, content_hash FROM documents WHERE deleted = 0"))
+
+    def modified_times(self, prefix=""):
+        """
+        Quelle -> Änderungszeit der vorhandenen Dokumente mit dem angegebenen Präfix.
+        """
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT source, modified FROM documents WHERE deleted = 0 AND source >= ? AND source < ?",
+                (prefix, prefix + "\uffff"),
+            ))
+
+    def iter_documents(self, sources=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Liefert die Dokumente (Quelle, Text) blockweise (Keyset-Paginierung über die Quelle), sodass nie
+        die gesamte Wissensbasis im Speicher liegt. Mit sources nur diese Dokumente.
+        """
+        if sources is not None:
+            sources = sorted(sources)
+            for start in range(0, len(sources), batch_size):
+                part = sources[start:start + batch_size]
+                placeholders = ",".join("?" * len(part))
+                with self._lock:
+                    rows = self._conn.execute(
+                        f"SELECT source, content FROM documents WHERE deleted = 0 AND source IN ({placeholders})"
+                        " ORDER BY source", part,
+                    ).fetchall()
+                yield from rows
+            return
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT source, content FROM documents WHERE deleted = 0 AND source > ?"
+                    " ORDER BY source LIMIT ?", (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def changes_since(self, seq):
+        """
+        Was sich seit dem Stand seq geändert hat: (neue bzw. geänderte Quellen, gelöschte Quellen).
+        Gibt None zurück, wenn seq unbekannt ist (z. B. ein Index aus der Zeit vor der Wissensbasis).
+        """
+        if seq is None:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, deleted FROM documents WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        return [source for source, deleted in rows if not deleted], [source for source, deleted in rows if deleted]
+
+    def is_migrated(self, name):
+        with self._lock:
+            return self._meta("migrated:" + name) is not None
+
+    def mark_migrated(self, name):
+        with self._lock:
+            self._set_meta("migrated:" + name, time.time())
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM documents WHERE deleted = 0"
+            ).fetchone()
+        return {"documents": count, "characters": size, "last_seq": self.last_seq()}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def sync_upload_directory(store, directory, filenames):
+    """
+    Gleicht die hochgeladenen Dateien (Quelle "upload:<dateiname>") mit der Wissensbasis ab: neue und seit
+    dem letzten Abgleich veränderte Dateien (Änderungszeit) werden gelesen und gespeichert, Dokumente zu
+    Dateien, die es nicht mehr gibt, gelöscht. Gibt die Anzahl geänderter Dokumente zurück.
+    """
+    known = store.modified_times("upload:")
+    wanted = set()
+    changed = 0
+    for filename in filenames:
+        source = "upload:" + filename
+        path = os.path.join(directory, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        wanted.add(source)
+        if source in known and known[source] >= mtime:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except Exception as e:
+            print(f"Fehler beim Lesen der Datei {filename}:", e)
+            continue
+        changed += store.put(source, text, modified=mtime)
+    changed += store.delete_many(set(known) - wanted)
+    return changed
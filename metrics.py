@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Standard-Grenzen der Histogramme in Sekunden (von Cache-Treffern bis zu langen GPT-4-Antworten)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUILD_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+# Wie oft ein Worker seinen Stand für die anderen Worker schreibt (Sekunden)
+PUBLISH_INTERVAL = 5.0
+# Stände beendeter Worker zählen nach dieser Zeit nicht mehr mit (Sekunden)
+STALE_AFTER = 3600.0
+# SHOPBOT_REQUEST_LOG=json: eine JSON-Zeile pro Chat-Anfrage mit den Zeiten aller Stufen
+REQUEST_LOG = os.getenv("SHOPBOT_REQUEST_LOG", "").lower()
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else f"{int(value)}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: Labels {sorted(labels)} statt {list(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): json.loads(json.dumps(value)) for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    """
+    Monoton steigender Zähler (z. B. Anfragen, geladene Seiten, Bytes).
+    """
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        self._registry.touch()
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def render(self, values):
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+
+
+class Gauge(Counter):
+    """
+    Momentanwert (z. B. Chunks/Sekunde des letzten Index-Aufbaus). Über mehrere Worker gilt der zuletzt gesetzte Wert.
+    """
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = [float(value), time.time()]
+        self._registry.touch()
+
+    @staticmethod
+    def merge(a, b):
+        return a if a[1] >= b[1] else b
+
+    def render(self, values):
+        return super().render((key, value[0]) for key, value in values)
+
+
+class Histogram(_Metric):
+    """
+    Verteilung von Messwerten (Prometheus-Histogramm mit festen Grenzen, plus Summe und Anzahl).
+    """
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total, count = self._values.get(key) or [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[slot] += 1
+            self._values[key] = [counts, total + value, count + 1]
+        self._registry.touch()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def render(self, values):
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_number(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    """
+    Alle Metriken eines Prozesses, ausgegeben im Textformat von Prometheus.
+
+    Unter gunicorn hat jeder Worker seine eigenen Zähler. Ist ein Verzeichnis gesetzt, schreibt jeder
+    Worker seinen Stand höchstens alle PUBLISH_INTERVAL Sekunden als <pid>.json dorthin, und render()
+    fasst die Stände aller Worker zusammen – egal welcher Worker /metrics beantwortet.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._published_at = 0.0
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def set_directory(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+    def touch(self):
+        """
+        Nach jeder Messung: den eigenen Stand veröffentlichen, wenn das letzte Mal lange genug her ist.
+        """
+        if self.directory is not None and time.monotonic() - self._published_at >= PUBLISH_INTERVAL:
+            self.publish()
+
+    def publish(self):
+        if self.directory is None:
+            return
+        self._published_at = time.monotonic()
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print("Metriken konnten nicht geschrieben werden:", e)
+
+    def _worker_snapshots(self):
+        snapshots = [self.snapshot()]
+        if self.directory is None:
+            return snapshots
+        own = f"{os.getpid()}.json"
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if not filename.endswith(".json") or filename == own:
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) > STALE_AFTER:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """
+        Textformat für Prometheus (Version 0.0.4), zusammengefasst über alle Worker.
+        """
+        self.publish()
+        merged = {}
+        for snapshot in self._worker_snapshots():
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                target = merged.setdefault(name, {})
+                for key, value in values.items():
+                    target[key] = metric.merge(target[key], value) if key in target else value
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            values = sorted((tuple(json.loads(key)), value) for key, value in merged.get(name, {}).items())
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Chat
+CHAT_REQUESTS = REGISTRY.counter(
+    "shopbot_chat_requests_total", "Chat-Anfragen nach Endpunkt und Ergebnis", ("endpoint", "outcome"))
+CHAT_REQUEST_SECONDS = REGISTRY.histogram(
+    "shopbot_chat_request_seconds", "Gesamtdauer einer Chat-Anfrage (beim Streaming bis zum letzten Token)",
+    ("endpoint",))
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "shopbot_chat_stage_seconds", "Dauer der einzelnen Stufen einer Chat-Anfrage", ("stage",))
+
+# Embeddings und Index-Aufbau
+EMBEDDING_BATCH_SECONDS = REGISTRY.histogram(
+    "shopbot_embedding_batch_seconds", "Dauer eines Embedding-API-Aufrufs (ein Batch)", ("outcome",))
+EMBEDDING_TEXTS = REGISTRY.counter(
+    "shopbot_embedding_texts_total", "Eingebettete Texte nach Herkunft (api oder cache)", ("source",))
+INDEX_BUILD_SECONDS = REGISTRY.histogram(
+    "shopbot_index_build_seconds", "Dauer eines Index-Aufbaus (full) bzw. -Abgleichs (sync)", ("kind",),
+    buckets=BUILD_BUCKETS)
+INDEX_CHUNKS_EMBEDDED = REGISTRY.counter(
+    "shopbot_index_chunks_embedded_total", "Beim Index-Aufbau eingebettete Chunks")
+INDEX_CHUNKS_PER_SECOND = REGISTRY.gauge(
+    "shopbot_index_chunks_per_second", "Durchsatz des letzten Index-Aufbaus (eingebettete Chunks pro Sekunde)")
+INDEX_CHUNKS = REGISTRY.gauge(
+    "shopbot_index_chunks", "Chunks in der zuletzt gespeicherten Index-Version je Mandant", ("tenant",))
+INDEX_SHARD_BYTES = REGISTRY.gauge(
+    "shopbot_index_shard_bytes", "Größe der geladenen Index-Shards (zuletzt meldender Worker)")
+INDEX_SHARD_EVICTIONS = REGISTRY.counter(
+    "shopbot_index_shard_evictions_total", "Wegen der Speichergrenze verdrängte Index-Shards")
+INDEX_DUPLICATES = REGISTRY.counter(
+    "shopbot_index_duplicates_total", "Beinahe-Duplikate, die beim Index-Aufbau nicht eingebettet wurden")
+INDEX_DUPLICATE_CHARS = REGISTRY.counter(
+    "shopbot_index_duplicate_chars_total", "Zeichen der nicht eingebetteten Beinahe-Duplikate")
+
+# Crawler
+CRAWL_PAGES = REGISTRY.counter(
+    "shopbot_crawl_pages_total", "Verarbeitete Seiten nach Ergebnis (changed, unchanged, removed, failed)",
+    ("result",))
+CRAWL_BYTES = REGISTRY.counter(
+    "shopbot_crawl_bytes_total", "Geladene Bytes (HTML, unkomprimiert)")
+CRAWL_FETCH_SECONDS = REGISTRY.histogram(
+    "shopbot_crawl_fetch_seconds", "Dauer eines Seitenabrufs (ohne Wartezeit der Drosselung)")
+CRAWL_PAGES_PER_SECOND = REGISTRY.gauge(
+    "shopbot_crawl_pages_per_second", "Durchsatz des letzten Crawls (verarbeitete Seiten pro Sekunde)")
+
+
+_active_trace = contextvars.ContextVar("shopbot_request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Zeitmessung einer Chat-Anfrage: sammelt die Dauer jeder Stufe (stage()), trägt sie in die Histogramme
+    ein und schreibt bei finish() optional eine JSON-Logzeile. Mit "with trace:" wird sie zur aktiven Messung
+    des laufenden Threads bzw. Greenlets, sodass tiefer liegende Funktionen ohne Parameter messen können.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.fields = {}
+        self._token = None
+        self._finished = False
+
+    def __enter__(self):
+        self._token = _active_trace.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_trace.reset(self._token)
+
+    def record(self, name, seconds):
+        CHAT_STAGE_SECONDS.observe(seconds, stage=name)
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def finish(self, outcome, status=200):
+        """
+        Schließt die Messung ab (nur beim ersten Aufruf): Gesamtdauer, Zähler und ggf. Logzeile.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        total = time.perf_counter() - self.started
+        CHAT_REQUEST_SECONDS.observe(total, endpoint=self.endpoint)
+        CHAT_REQUESTS.inc(endpoint=self.endpoint, outcome=outcome)
+        if REQUEST_LOG == "json":
+            entry = {"ts": round(time.time(), 3), "event": "chat", "endpoint": self.endpoint, "outcome": outcome,
+                     "status": status, "total_ms": round(total * 1000, 1),
+                     "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}}
+            entry.update(self.fields)
+            print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+
+@contextmanager
+def stage(name):
+    """
+    Misst eine Stufe der aktiven Chat-Anfrage; ohne aktive Messung (z. B. im Benchmark) nur im Histogramm.
+    """
+    trace = _active_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if trace is not None:
+            trace.record(name, seconds)
+        else:
+            CHAT_STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def annotate(**fields):
+    """
+    Zusätzliche Felder für die JSON-Logzeile der aktiven Chat-Anfrage (z. B. Index-Version, Retrieval-Modus).
+    """
+    trace = _active_trace.get()
+    if trace is not None:
+        trace.fields.update(fields)
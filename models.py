@@ -0,0 +1,172 @@
+import os
+import datetime
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from tenants import DEFAULT_TENANT
+
+# Gemeinsame Datenbank der Web-App und des Crawlers; ein relativer SQLite-Pfad liegt im instance-Ordner
+DATABASE_URI = os.getenv("SHOPBOT_DATABASE_URI", "sqlite:///shopbot.db")
+# Stand des Schemas, in der Datenbank als PRAGMA user_version vermerkt.
+# Bei neuen Tabellen, Spalten (UPGRADE_COLUMNS) oder Indizes erhöhen.
+SCHEMA_VERSION = 2
+
+db = SQLAlchemy()
+
+def tenant_column():
+    """
+    Mandant (Shop), zu dem ein Eintrag gehört; Einträge aus der Zeit davor gehören dem Standard-Mandanten.
+    """
+    return db.Column(db.String(64), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+
+def database_uri(instance_path):
+    """
+    DATABASE_URI mit absolutem SQLite-Pfad, wie Flask-SQLAlchemy ihn auflöst (relativ zum instance-Ordner);
+    für Skripte, die ohne die Web-App auf die Datenbank zugreifen.
+    """
+    prefix = "sqlite:///"
+    path = DATABASE_URI[len(prefix):] if DATABASE_URI.startswith(prefix) else None
+    if path and path != ":memory:" and not os.path.isabs(path):
+        return prefix + os.path.join(instance_path, path)
+    return DATABASE_URI
+
+def enable_sqlite_wal(engine):
+    """
+    Schaltet die SQLite-Datenbank einer Engine in den WAL-Modus: Leser (Web-Worker) blockieren Schreiber
+    (Crawl) nicht mehr und umgekehrt. Schreiber warten bis zu 30 Sekunden auf die Sperre statt sofort
+    mit "database is locked" abzubrechen.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
+# --------------------------
+# Datenbankmodelle
+# --------------------------
+class CrawledPage(db.Model):
+    """
+    Crawl-Stand einer Seite. Der Seitentext selbst liegt in der Wissensbasis (KnowledgeStore, Quelle "url:<url>");
+    content ist nur noch bei Einträgen aus der Zeit davor gefüllt.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False, unique=True)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Für inkrementelle Recrawls: Validatoren des Servers, Hash des Textes und gefundene interne Links (JSON)
+    etag = db.Column(db.String(255))
+    last_modified = db.Column(db.String(64))
+    content_hash = db.Column(db.String(64))
+    links = db.Column(db.Text)
+
+class CrawledWebsite(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), nullable=False, unique=True)
+    # Die Seiten landen in der Wissensbasis und im Index-Shard dieses Mandanten
+    tenant = tenant_column()
+    # Crawl-Budget: höchstens so viele Seiten bzw. Link-Ebenen ab Start-URL und Sitemap (leer = unbegrenzt)
+    max_pages = db.Column(db.Integer)
+    max_depth = db.Column(db.Integer)
+
+class CrawlFrontier(db.Model):
+    """
+    Persistenter Frontier eines laufenden Crawls: alle entdeckten URLs je Website mit Status
+    (pending, done, failed). Nach einem Abbruch (Absturz, Neustart) setzt der nächste Crawl hier fort.
+    """
+    __table_args__ = (db.UniqueConstraint("site", "url"),)
+    id = db.Column(db.Integer, primary_key=True)
+    site = db.Column(db.String(500), nullable=False, index=True)
+    url = db.Column(db.String(2000), nullable=False)
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=1)
+    status = db.Column(db.String(16), nullable=False, default="pending", index=True)
+
+class UploadedFile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    tenant = tenant_column()
+
+class APIKey(db.Model):
+    __tablename__ = "api_key"
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False)
+
+class BotPrompt(db.Model):
+    __tablename__ = "bot_prompt"
+    id = db.Column(db.Integer, primary_key=True)
+    prompt = db.Column(db.Text, nullable=False)
+    tenant = tenant_column()
+
+class GreetingMessage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.String(500), nullable=False)
+    tenant = tenant_column()
+
+# --------------------------
+# Schema anlegen und aktualisieren
+# --------------------------
+# Spalten, die nachträglich hinzugekommen sind (create_all ergänzt keine Spalten in bestehenden Tabellen)
+UPGRADE_COLUMNS = {
+    "crawled_page": {
+        "etag": "VARCHAR(255)",
+        "last_modified": "VARCHAR(64)",
+        "content_hash": "VARCHAR(64)",
+        "links": "TEXT",
+    },
+    "crawled_website": {
+        "max_pages": "INTEGER",
+        "max_depth": "INTEGER",
+        "tenant": f"VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_TENANT}'",
+    },
+    "uploaded_file": {
+        "tenant": f"VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_TENANT}'",
+    },
+    "bot_prompt": {
+        "tenant": f"VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_TENANT}'",
+    },
+    "greeting_message": {
+        "tenant": f"VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_TENANT}'",
+    },
+}
+
+def upgrade_tables():
+    """
+    Ergänzt fehlende Spalten in bestehenden Tabellen (SQLite, ohne Migrationstool) und den eindeutigen
+    Index auf crawled_page.url, den die Upserts des Crawls brauchen. Tabellen aus der Zeit davor können
+    eine URL mehrfach enthalten; behalten wird jeweils der neueste Eintrag.
+    """
+    for table, columns in UPGRADE_COLUMNS.items():
+        existing = {row[1] for row in db.session.execute(text(f"PRAGMA table_info({table})"))}
+        for name, column_type in columns.items():
+            if name not in existing:
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+    unique_columns = [
+        [row[2] for row in db.session.execute(text(f"PRAGMA index_info('{index[1]}')"))]
+        for index in db.session.execute(text("PRAGMA index_list(crawled_page)")) if index[2]
+    ]
+    if ["url"] not in unique_columns:
+        db.session.execute(text(
+            "DELETE FROM crawled_page WHERE id NOT IN (SELECT MAX(id) FROM crawled_page GROUP BY url)"
+        ))
+        db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_crawled_page_url ON crawled_page (url)"))
+    db.session.commit()
+
+def init_schema():
+    """
+    Legt fehlende Tabellen an und bringt bestehende auf den aktuellen Stand (upgrade_tables). Der erreichte
+    Stand wird als PRAGMA user_version vermerkt; danach prüft jeder weitere Start nur noch diese Zahl.
+    Muss in einem App-Kontext aufgerufen werden. Gibt zurück, ob das Schema geändert wurde.
+    """
+    if db.session.execute(text("PRAGMA user_version")).scalar() == SCHEMA_VERSION:
+        db.session.rollback()
+        return False
+    db.create_all()
+    upgrade_tables()
+    db.session.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+    db.session.commit()
+    return True
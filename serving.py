@@ -0,0 +1,36 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Maximale Anzahl gleichzeitig offener Verbindungen zur OpenAI-API pro Worker-Prozess.
+# Mit dem gevent-Worker laufen hunderte Anfragen pro Prozess, die sich diesen Pool teilen.
+DEFAULT_POOL_SIZE = 200
+
+
+class SharedSession(requests.Session):
+    """
+    Eine requests-Session, die von allen Threads bzw. Greenlets eines Prozesses gemeinsam genutzt wird.
+    openai==0.28.0 schließt seine Session regelmäßig; close() wird hier ignoriert, damit laufende
+    Anfragen anderer Greenlets ihre Verbindungen behalten.
+    """
+
+    def close(self):
+        pass
+
+
+def install_shared_openai_session(pool_size=None):
+    """
+    Ersetzt die Session-pro-Thread von openai==0.28.0 durch einen gemeinsamen Verbindungspool.
+    Ohne diesen Pool öffnet unter gevent jedes Greenlet eine eigene TLS-Verbindung.
+    """
+    import openai
+
+    pool_size = pool_size or int(os.getenv("SHOPBOT_HTTP_POOL_SIZE", DEFAULT_POOL_SIZE))
+    session = SharedSession()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    openai.requestssession = session
+    return session
+
@@ -0,0 +1,45 @@
+import os
+import re
+
+# Mandanten (Shops), die aus einer Installation bedient werden. Jeder Mandant hat eigene Wissensbasis,
+# eigenen Index-Shard, eigene Uploads sowie eigenen Basis-Prompt und Begrüßungstext. Der Standard-Mandant
+# nutzt die bisherigen Pfade (instance/knowledge.db, instance/faiss_index, uploads/), alle weiteren liegen
+# unter <Basisordner>/tenants/<mandant>/.
+DEFAULT_TENANT = "default"
+TENANTS_DIR = "tenants"
+# Mandanten-IDs werden als Verzeichnisnamen verwendet und deshalb streng geprüft
+TENANT_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+def normalize_tenant(value):
+    """
+    Prüft eine Mandanten-ID aus einer Anfrage oder einem Formular. Leer bedeutet Standard-Mandant;
+    gibt None zurück, wenn die ID ungültig ist.
+    """
+    tenant = (value or "").strip().lower() or DEFAULT_TENANT
+    return tenant if TENANT_PATTERN.match(tenant) else None
+
+
+def tenant_path(base_dir, tenant):
+    """
+    Ordner eines Mandanten unterhalb von base_dir (instance- oder Upload-Ordner).
+    """
+    if tenant == DEFAULT_TENANT:
+        return base_dir
+    return os.path.join(base_dir, TENANTS_DIR, tenant)
+
+
+def list_tenants(base_dir):
+    """
+    Alle Mandanten mit eigenem Ordner unter base_dir, der Standard-Mandant zuerst.
+    """
+    try:
+        names = sorted(name for name in os.listdir(os.path.join(base_dir, TENANTS_DIR))
+                       if TENANT_PATTERN.match(name) and name != DEFAULT_TENANT)
+    except FileNotFoundError:
+        names = []
+    return [DEFAULT_TENANT] + names
+
+
+def tenant_exists(base_dir, tenant):
+    return tenant == DEFAULT_TENANT or os.path.isdir(tenant_path(base_dir, tenant))
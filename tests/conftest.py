@@ -0,0 +1,53 @@
+"""
+Tests mit den lokalen Ersatz-Backends (SHOPBOT_EMBEDDINGS=fake, SHOPBOT_COMPLETIONS=fake), ohne Netzwerk
+und in einem eigenen instance-Ordner.
+
+Aufruf: python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Ohne OpenAI-Zugriff: lokale Embeddings und Antworten; app liest diese Variablen beim Import
+INSTANCE_PATH = tempfile.mkdtemp(prefix="shopbot-tests-")
+os.environ.setdefault("SHOPBOT_INSTANCE_PATH", INSTANCE_PATH)
+os.environ.setdefault("SHOPBOT_EMBEDDINGS", "fake")
+os.environ.setdefault("SHOPBOT_COMPLETIONS", "fake")
+os.environ.setdefault("SHOPBOT_FAKE_FIRST_TOKEN_SECONDS", "0")
+os.environ.setdefault("SHOPBOT_FAKE_TOKEN_SECONDS", "0")
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+# Keine semantischen Treffer im Antwort-Cache, damit jede neue Frage die Admission Control durchläuft
+os.environ.setdefault("SHOPBOT_ANSWER_CACHE_THRESHOLD", "2")
+
+
+def wait_for(predicate, timeout=30.0, interval=0.02):
+    """
+    Wartet, bis predicate() wahr ist; gibt den letzten Wert zurück.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        value = predicate()
+        if value or time.monotonic() > deadline:
+            return value
+        time.sleep(interval)
+
+
+@pytest.fixture(scope="session")
+def shopbot():
+    """
+    Das app-Modul mit eingerichteter App (Wissensbasis aus knowledge.txt, noch ohne Index).
+    """
+    import app
+
+    app.app.config["UPLOAD_FOLDER"] = os.path.join(INSTANCE_PATH, "uploads")
+    app.create_app()
+    yield app
+    app.close_process_resources()
+    shutil.rmtree(INSTANCE_PATH, ignore_errors=True)
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionGate, Overloaded, SingleFlight
+from conftest import wait_for
+
+
+def test_gate_rejects_with_429_when_the_queue_is_full():
+    gate = AdmissionGate(1, 0, 1.0)
+    gate.acquire()
+    with pytest.raises(Overloaded) as rejected:
+        gate.acquire()
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+    gate.release()
+    gate.acquire()
+
+
+def test_gate_rejects_with_503_when_the_wait_expires():
+    gate = AdmissionGate(1, 1, 0.05)
+    gate.acquire()
+    start = time.monotonic()
+    with pytest.raises(Overloaded) as rejected:
+        gate.acquire()
+    assert rejected.value.status == 503
+    assert time.monotonic() - start >= 0.05
+    assert gate.stats()["waiting"] == 0
+
+
+def test_waiting_request_gets_the_released_slot():
+    gate = AdmissionGate(1, 1, 5.0)
+    gate.acquire()
+    threading.Timer(0.05, gate.release).start()
+    gate.acquire()
+    assert gate.stats()["active"] == 1
+
+
+def test_submit_runs_on_the_slot_and_releases_it():
+    gate = AdmissionGate(2, 0, 1.0)
+    done = threading.Event()
+    gate.acquire()
+    gate.submit(time.monotonic(), done.set)
+    assert done.wait(5)
+    assert wait_for(lambda: gate.stats()["active"] == 0, timeout=5)
+    assert gate.stats()["average_seconds"] is not None
+
+
+def test_single_flight_shares_one_leader():
+    flights = SingleFlight()
+    flight, leader = flights.lead("frage")
+    assert leader
+    assert flights.lead("frage") == (flight, False)
+    assert flights.join("frage") is flight
+    flight.publish("Ant")
+    flight.publish("wort")
+    flights.land("frage", flight)
+    assert flight.result(1) == "Antwort"
+    assert flights.join("frage") is None
+
+
+@pytest.fixture(scope="module")
+def client(shopbot):
+    return shopbot.app.test_client()
+
+
+def test_chat_answers_503_while_the_first_index_is_built(shopbot, client):
+    response = client.post("/chat", json={"message": "Wie lange dauert der Versand?"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) == shopbot.INDEX_BUILDING_RETRY_AFTER
+    # Der Index wird im Hintergrund aufgebaut, nicht in der Anfrage
+    assert wait_for(lambda: shopbot.get_index_snapshot() is not None, timeout=120)
+    response = client.post("/chat", json={"message": "Wie lange dauert der Versand?"})
+    assert response.status_code == 200
+    assert response.json["response"]
+
+
+def test_chat_answers_429_when_the_upstream_gate_is_full(shopbot, client, monkeypatch):
+    assert wait_for(lambda: shopbot.get_index_snapshot() is not None, timeout=120)
+    monkeypatch.setattr(shopbot, "upstream_gate", AdmissionGate(1, 0, 0.1))
+    monkeypatch.setenv("SHOPBOT_FAKE_FIRST_TOKEN_SECONDS", "0.5")
+    results = []
+
+    def ask(question):
+        response = shopbot.app.test_client().post("/chat", json={"message": question})
+        results.append((response.status_code, response.headers.get("Retry-After")))
+
+    threads = [threading.Thread(target=ask, args=(f"Frage Nummer {i} zur Lieferung?",)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    statuses = sorted(status for status, _ in results)
+    assert statuses == [200, 429, 429]
+    assert all(retry_after is not None for status, retry_after in results if status == 429)
+    assert wait_for(lambda: shopbot.upstream_gate.stats()["active"] == 0, timeout=5)
+
+
+def test_identical_questions_share_one_upstream_slot(shopbot, client, monkeypatch):
+    assert wait_for(lambda: shopbot.get_index_snapshot() is not None, timeout=120)
+    monkeypatch.setattr(shopbot, "upstream_gate", AdmissionGate(1, 0, 0.1))
+    monkeypatch.setenv("SHOPBOT_FAKE_FIRST_TOKEN_SECONDS", "0.5")
+    results = []
+
+    def ask():
+        response = shopbot.app.test_client().post("/chat", json={"message": "Gibt es Expressversand?"})
+        results.append(response.status_code)
+
+    threads = [threading.Thread(target=ask) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [200, 200, 200]
@@ -0,0 +1,47 @@
+from chunking import chunk_document, get_token_counter, iter_chunks
+
+SENTENCES = " ".join(f"Satz Nummer {i} beschreibt den Versand und die Rückgabe im Shop." for i in range(80))
+
+
+def test_chunk_text_is_the_document_slice():
+    text = "# Versand\n" + SENTENCES + "\n\n# Rückgabe\n" + SENTENCES
+    for chunk in chunk_document("doc", text, max_tokens=60, overlap_tokens=10):
+        assert chunk.text == text[chunk.start:chunk.end]
+        assert chunk.source == "doc"
+
+
+def test_chunks_respect_the_token_budget():
+    counter = get_token_counter()
+    chunks = list(chunk_document("doc", SENTENCES, max_tokens=60, overlap_tokens=10))
+    assert len(chunks) > 1
+    assert all(counter.count(chunk.text) <= 60 for chunk in chunks)
+    assert [chunk.position for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_consecutive_chunks_overlap():
+    chunks = list(chunk_document("doc", SENTENCES, max_tokens=60, overlap_tokens=20))
+    for previous, following in zip(chunks, chunks[1:]):
+        assert following.start < previous.end
+
+
+def test_headings_never_form_a_chunk_of_their_own():
+    text = "# Leer\n# Versand\nWir versenden innerhalb von zwei Tagen.\n# Ende\n## Noch leerer\n"
+    chunks = list(chunk_document("doc", text, max_tokens=60, overlap_tokens=10))
+    assert len(chunks) == 1
+    assert "Wir versenden" in chunks[0].text
+    assert chunks[0].heading == "# Leer"
+
+
+def test_headings_start_new_chunks_and_are_remembered():
+    text = "# Versand\n" + SENTENCES[:600] + "\n# Rückgabe\n" + SENTENCES[:600]
+    chunks = list(chunk_document("doc", text, max_tokens=200, overlap_tokens=10))
+    assert chunks[0].heading == "# Versand"
+    assert chunks[-1].heading == "# Rückgabe"
+    assert chunks[-1].text.startswith("# Rückgabe")
+
+
+def test_chunks_never_cross_document_boundaries():
+    documents = [("a", SENTENCES), ("b", "Nur ein Satz.")]
+    chunks = list(iter_chunks(documents, max_tokens=60, overlap_tokens=10))
+    assert {chunk.source for chunk in chunks} == {"a", "b"}
+    assert [chunk.text for chunk in chunks if chunk.source == "b"] == ["Nur ein Satz."]
@@ -0,0 +1,59 @@
+from dedup import MinHasher, NearDuplicateIndex, lsh_bands, shingles
+from keyword_index import exact_terms
+
+PRODUCT = ("Die Kaffeemühle Modell Classic mahlt Bohnen gleichmäßig und leise. Das Mahlwerk aus Edelstahl ist "
+           "in zwölf Stufen einstellbar, der Behälter fasst 250 Gramm. Lieferung innerhalb von zwei Werktagen, "
+           "Rückgabe innerhalb von 30 Tagen. Die Reinigung gelingt mit dem beiliegenden Pinsel, das Gehäuse lässt "
+           "sich feucht abwischen. Für Espresso empfehlen wir die feinste Stufe, für Filterkaffee eine mittlere "
+           "und für die French Press eine grobe Einstellung. Ersatzteile und Zubehör gibt es in unserem Shop. "
+           "Artikelnummer KM-4711, Preis 49,90 Euro.")
+
+
+def find(index, hasher, text):
+    return index.find(hasher.signature(text), exact_terms(text))
+
+
+def add(index, hasher, key, text):
+    index.add(key, hasher.signature(text), exact_terms(text))
+
+
+def test_identical_and_reworded_texts_are_found():
+    hasher = MinHasher()
+    index = NearDuplicateIndex(0.9)
+    add(index, hasher, 1, PRODUCT)
+    assert find(index, hasher, PRODUCT) == 1
+    # Gleiche Wörter und Angaben, andere Satzzeichen
+    assert find(index, hasher, PRODUCT.replace(". ", "; ")) == 1
+
+
+def test_texts_below_the_threshold_are_kept():
+    hasher = MinHasher()
+    index = NearDuplicateIndex(0.9)
+    add(index, hasher, 1, PRODUCT)
+    other = "Die Kaffeemühle Modell Classic mahlt Bohnen. Versand nur innerhalb Deutschlands per Spedition."
+    assert find(index, hasher, other) is None
+
+
+def test_variants_with_other_prices_or_skus_are_never_collapsed():
+    hasher = MinHasher()
+    index = NearDuplicateIndex(0.9)
+    add(index, hasher, 1, PRODUCT)
+    for variant in (PRODUCT.replace("49,90", "79,90"), PRODUCT.replace("KM-4711", "KM-4712")):
+        # Dem Wortlaut nach ein Beinahe-Duplikat ...
+        assert len(shingles(variant) & shingles(PRODUCT)) / len(shingles(variant) | shingles(PRODUCT)) >= 0.9
+        # ... aber mit eigenem Preis bzw. eigener Artikelnummer
+        assert find(index, hasher, variant) is None
+    # Dieselbe Variante wird weiterhin gefunden
+    assert find(index, hasher, PRODUCT + " ") == 1
+
+
+def test_exact_terms_are_numbers_and_codes():
+    assert exact_terms("Artikel KM-4711, Preis 49,90 Euro") == {"KM-4711", "49", "90"}
+    assert exact_terms("Kaffee mahlen und genießen") == frozenset()
+
+
+def test_lsh_bands_reach_the_requested_recall():
+    for threshold in (0.8, 0.9, 0.97):
+        bands, rows = lsh_bands(threshold)
+        assert bands * rows <= 64
+        assert 1 - (1 - threshold ** rows) ** bands >= 0.95
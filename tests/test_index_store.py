@@ -0,0 +1,84 @@
+import numpy as np
+
+from embeddings import fake_embedding
+from index_store import COMPACT_FRACTION, IndexBuilder, load_index
+
+
+def build(sources):
+    """
+    Builder mit einem Chunk je Quelle (Text = "Inhalt von <Quelle>").
+    """
+    builder = IndexBuilder(index_type="flat")
+    entries = []
+    for source in sources:
+        text = f"Inhalt von {source}"
+        entries.append((source, [text], [fake_embedding(text)], f"hash-{source}"))
+    builder.add_documents(entries)
+    return builder
+
+
+def live_sources(builder):
+    return sorted(source for position, source in enumerate(builder.sources) if position not in builder._dead)
+
+
+def test_remove_sources_drops_chunks_vectors_and_documents():
+    builder = build(["a", "b", "c"])
+    assert builder.remove_sources(["b"]) == 1
+    assert live_sources(builder) == ["a", "c"]
+    assert builder.index.ntotal == 2
+    assert "b" not in builder.documents
+    assert builder.source_names() == {"a", "c"}
+
+
+def test_duplicate_is_promoted_when_its_original_is_removed():
+    builder = build(["a", "b"])
+    chunk_id = builder.ids[0]
+    builder.add_duplicate(chunk_id, "kopie", "Inhalt von a")
+    assert builder.remove_sources(["a"]) == 1
+    # Text und Vektor bleiben, die Fundstelle wird zur Quelle des Chunks
+    assert live_sources(builder) == ["b", "kopie"]
+    assert builder.index.ntotal == 2
+    assert chunk_id not in builder.duplicates
+    # Mit der Kopie verschwindet nun auch der Chunk
+    assert builder.remove_sources(["kopie"]) == 1
+    assert live_sources(builder) == ["b"]
+    assert builder.index.ntotal == 1
+
+
+def test_removing_original_and_duplicate_together_removes_the_chunk():
+    builder = build(["a", "b"])
+    builder.add_duplicate(builder.ids[0], "kopie", "Inhalt von a")
+    assert builder.remove_sources(["a", "kopie"]) == 2
+    assert live_sources(builder) == ["b"]
+    assert builder.duplicates == {}
+
+
+def test_removed_chunks_are_compacted_lazily():
+    sources = [f"s{i}" for i in range(20)]
+    builder = build(sources)
+    below = int(COMPACT_FRACTION * len(sources))
+    builder.remove_sources(sources[:below])
+    # Noch als Lücke vorhanden, aber für die Duplikat-Suche unsichtbar
+    assert len(builder.ids) == len(sources)
+    assert len(builder.duplicate_finder(0.9)) == len(sources) - below
+    builder.remove_sources([sources[below]])
+    assert len(builder.ids) == len(sources) - below - 1
+    assert builder._dead == set()
+    assert live_sources(builder) == sorted(sources[below + 1:])
+    assert [builder.texts[position] for position in range(len(builder.ids))] == [
+        f"Inhalt von {source}" for source in sources[below + 1:]]
+
+
+def test_saved_version_contains_only_live_chunks(tmp_path):
+    builder = build(["a", "b", "c"])
+    builder.remove_sources(["b"])
+    version = builder.save(str(tmp_path))
+    snapshot = load_index(str(tmp_path), version)
+    assert sorted(snapshot.chunks.sources) == ["a", "c"]
+    assert snapshot.index.ntotal == 2
+
+    reloaded = IndexBuilder.from_version(str(tmp_path))
+    reloaded.remove_sources(["a"])
+    query = np.asarray([fake_embedding("Inhalt von c")], dtype="float32")
+    _, ids = reloaded.index.search(query, 1)
+    assert reloaded.texts[reloaded._positions[int(ids[0][0])]] == "Inhalt von c"
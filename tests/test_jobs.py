@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+from conftest import wait_for
+from jobs import JobRunner
+
+
+@pytest.fixture
+def runner(tmp_path):
+    runner = JobRunner(str(tmp_path / "jobs.db"), max_workers=2)
+    yield runner
+    runner.close()
+
+
+def status(runner, job_id):
+    return runner.get(job_id)["status"]
+
+
+def blocking_job(started, release):
+    def target(job):
+        started.set()
+        release.wait(10)
+        job.check_cancelled()
+        return "fertig"
+    return target
+
+
+def test_job_runs_and_stores_its_message(runner):
+    job_id, created = runner.submit("index", lambda job, value: f"Ergebnis {value}", 42, label="Test")
+    assert created
+    assert wait_for(lambda: status(runner, job_id) == "done")
+    job = runner.get(job_id)
+    assert job["message"] == "Ergebnis 42"
+    assert job["label"] == "Test"
+
+
+def test_failing_job_is_marked_failed(runner):
+    def target(job):
+        raise ValueError("kaputt")
+
+    job_id, _ = runner.submit("index", target)
+    assert wait_for(lambda: status(runner, job_id) == "failed")
+    assert runner.get(job_id)["error"] == "kaputt"
+
+
+def test_second_job_of_a_kind_waits_and_later_requests_join_it(runner):
+    started, release = threading.Event(), threading.Event()
+    first, _ = runner.submit("index", blocking_job(started, release))
+    assert started.wait(10)
+    second, created = runner.submit("index", lambda job: "zweiter")
+    assert created
+    # Wer jetzt anfordert, erhält den wartenden Job zurück
+    assert runner.submit("index", lambda job: "dritter") == (second, False)
+    # Ohne queue_behind zählt auch der laufende Job
+    assert runner.submit("index", lambda job: "vierter", queue_behind=False) == (first, False)
+    assert status(runner, second) == "queued"
+    release.set()
+    assert wait_for(lambda: status(runner, second) == "done")
+    assert status(runner, first) == "done"
+    assert runner.get(second)["message"] == "zweiter"
+
+
+def test_waiting_job_does_not_block_the_pool(runner):
+    started, release = threading.Event(), threading.Event()
+    runner.submit("crawl", blocking_job(started, release))
+    assert started.wait(10)
+    waiting, _ = runner.submit("crawl", lambda job: "danach")
+    # Beide Plätze des Pools wären belegt, wenn der wartende Job in einem Pool-Thread auf seinen Start wartete
+    other, _ = runner.submit("index", lambda job: "unabhängig")
+    assert wait_for(lambda: status(runner, other) == "done", timeout=5)
+    assert status(runner, waiting) == "queued"
+    release.set()
+    assert wait_for(lambda: status(runner, waiting) == "done")
+
+
+def test_cancel_waiting_job_never_runs_it(runner):
+    started, release = threading.Event(), threading.Event()
+    ran = threading.Event()
+    first, _ = runner.submit("index", blocking_job(started, release))
+    assert started.wait(10)
+    waiting, _ = runner.submit("index", lambda job: ran.set())
+    assert runner.cancel(waiting)
+    assert status(runner, waiting) == "cancelled"
+    release.set()
+    assert wait_for(lambda: status(runner, first) == "done")
+    assert not ran.wait(0.5)
+    # Ein abgeschlossener Job lässt sich nicht mehr abbrechen
+    assert not runner.cancel(first)
+
+
+def test_cancel_running_job_stops_it_at_the_next_check(runner):
+    started, release = threading.Event(), threading.Event()
+    job_id, _ = runner.submit("crawl", blocking_job(started, release))
+    assert started.wait(10)
+    assert runner.cancel(job_id)
+    assert status(runner, job_id) == "running"
+    release.set()
+    assert wait_for(lambda: status(runner, job_id) == "cancelled")
+
+
+def test_progress_is_stored_and_reports_cancellation(runner):
+    started, release = threading.Event(), threading.Event()
+
+    def target(job):
+        job.progress(3, 10, "Seiten")
+        started.set()
+        release.wait(10)
+        job._written_at = 0.0
+        job.progress(4, 10, "Seiten")
+        return "nicht erreicht"
+
+    job_id, _ = runner.submit("crawl", target)
+    assert started.wait(10)
+    job = runner.get(job_id)
+    assert (job["progress_done"], job["progress_total"], job["message"]) == (3, 10, "Seiten")
+    runner.cancel(job_id)
+    release.set()
+    assert wait_for(lambda: status(runner, job_id) == "cancelled")
+    assert runner.get(job_id)["progress_done"] == 4
+
+
+def test_close_fails_jobs_that_never_started(tmp_path):
+    runner = JobRunner(str(tmp_path / "jobs.db"), max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    first, _ = runner.submit("index", blocking_job(started, release))
+    assert started.wait(10)
+    waiting, _ = runner.submit("index", lambda job: "nie")
+    # close() wartet auf den laufenden Job; der wartende startet danach nicht mehr
+    threading.Timer(0.5, release.set).start()
+    runner.close()
+    other = JobRunner(str(tmp_path / "jobs.db"))
+    try:
+        assert other.get(first)["status"] == "done"
+        assert other.get(waiting)["status"] == "failed"
+        assert not other.active()
+    finally:
+        other.close()